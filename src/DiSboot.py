@@ -26,6 +26,14 @@ parser.add_argument("--ca-path", type=str, default=None, help="Path to the CA ce
 parser.add_argument("--cert-path", type=str, default=None, help="Path to the certificate")
 parser.add_argument("--key-path", type=str, default=None, help="Path to the key")
 parser.add_argument("--dbg", type=str, default=None, help="Debug server string ip:port")
+parser.add_argument("--storage", type=str, default="segments", choices=["segments", "files"],
+                    help="Storage engine, append only segments or legacy one file per document")
+parser.add_argument("--server", type=str, default="threads", choices=["threads", "asyncio"],
+                    help="Rpc server, a thread per connection or one asyncio loop")
+parser.add_argument("--refresh-max-age", type=float, default=24 * 3600,
+                    help="Seconds before a stored page is revalidated in the background, negative never")
+parser.add_argument("--refresh-policy", type=str, default=None,
+                    help="Max ages by domain, domain=seconds separated by commas, negative never")
 
 # cd src
 #  py -3.10 .\DiSboot.py --baseport 4440 --joinport 4440 --cert-path storage\127.0.0.1-4440.crt --key-path storage\127.0.0.1-4440.key --ca-path storage\ca.crt
@@ -64,7 +72,13 @@ else:
     cert = None
     key = None
 
-node = DiSNode(args.baseport,interface=args.interface, logger=logger, ca_content=ca, keypair_content=keypair)
+node = DiSNode(args.baseport,interface=args.interface, logger=logger, ca_content=ca, keypair_content=keypair,
+               storage=args.storage, server=args.server)
+node.refresh_max_age = args.refresh_max_age if args.refresh_max_age >= 0 else None
+if args.refresh_policy is not None:
+    for rule in args.refresh_policy.split(","):
+        domain, max_age = rule.split("=")
+        node.refresh_policy[domain.strip()] = float(max_age) if float(max_age) >= 0 else None
 
 if args.joinaddr is not None:
     ip, port = args.joinaddr.split(":")
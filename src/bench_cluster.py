@@ -0,0 +1,328 @@
+import argparse
+import json
+import logging
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+parser = argparse.ArgumentParser(description='Headless loopback cluster benchmark, N nodes and a synthetic site served '
+                                             'locally, no network needed')
+parser.add_argument('--nodes', type=int, default=6, help='Nodes in the ring')
+parser.add_argument('--baseport', type=int, default=7100, help='Port of the first node, the rest follow it')
+parser.add_argument('--site-port', type=int, default=7099, help='Port of the synthetic site')
+parser.add_argument('--site-pages', type=int, default=400, help='Pages of each section of the site')
+parser.add_argument('--site-links', type=int, default=6, help='Links per page besides the nav bar')
+parser.add_argument('--page-kb', type=int, default=8, help='Size of each page')
+parser.add_argument('--depths', type=str, default="1,2,3", help='SCRAP depths, comma separated')
+parser.add_argument('--lookups', type=int, default=200, help='Lookups from random nodes')
+parser.add_argument('--ops', type=int, default=300, help='Pushes and GETs')
+parser.add_argument('--concurrency', type=int, default=8, help='Clients at the same time for Push and GET')
+parser.add_argument('--kills', type=int, default=1, help='Nodes killed to measure the recovery')
+parser.add_argument('--server', type=str, default="threads", choices=["threads", "asyncio"], help='Rpc server')
+parser.add_argument('--storage', type=str, default="segments", choices=["segments", "files"], help='Storage engine')
+parser.add_argument('--timeout', type=float, default=120, help='Seconds to wait for the ring to converge')
+parser.add_argument('--workdir', type=str, default=None, help='Folder of the node storages, a temporary one by default')
+parser.add_argument('--seed', type=int, default=1, help='Seed of the site and the workload')
+parser.add_argument('--out', type=str, default=None, help='Write the results as json to this file')
+# internal, the same script runs each node in its own process
+parser.add_argument('--run-node', type=int, default=None, help=argparse.SUPPRESS)
+parser.add_argument('--join', type=int, default=None, help=argparse.SUPPRESS)
+
+args = parser.parse_args()
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+# the node modules log on their own handlers, only their warnings matter here
+logging.getLogger("discraper_node").setLevel(logging.WARNING)
+
+sys.path.append(str(Path(__file__).absolute().parent))
+
+if args.run_node is not None:
+    from discraper_node import DiSNode
+
+    node_logger = logging.getLogger(f"node{args.run_node}")
+    node_logger.setLevel(logging.CRITICAL)
+    node = DiSNode(args.run_node, logger=node_logger, server=args.server, storage=args.storage)
+    # the harness measures the crawl itself, nothing goes stale during a run
+    node.refresh_max_age = None
+    if args.join is not None:
+        node.JOIN("127.0.0.1", args.join)
+    while True:
+        time.sleep(60)
+
+from discraper_node import DiSNode
+from discraper_node.ChordNodeRemote import RemoteChordNode
+from discraper_node.InfoContainer import InfoContainer
+from discraper_node.custom_xrpc import RedirectNodeResponse, register_type_unmarshaller
+
+register_type_unmarshaller(RemoteChordNode)
+register_type_unmarshaller(DiSNode)
+register_type_unmarshaller(InfoContainer)
+
+site_fetches = 0
+
+
+# ---------------------- SITE ---------------------- #
+
+class SiteHandler(BaseHTTPRequestHandler):
+    """
+    /<section>/p<i>.html, every page links to a nav bar and to site_links pages picked by the seed
+    """
+
+    def do_GET(self):
+        global site_fetches
+        site_fetches += 1
+        parts = self.path.strip("/").split("/")
+        if len(parts) != 2 or not parts[1].startswith("p") or not parts[1].endswith(".html"):
+            self.send_error(404)
+            return
+        section, page = parts[0], int(parts[1][1:-5])
+        rnd = random.Random(f"{args.seed}/{section}/{page}")
+        links = [f"p{i}.html" for i in range(5)] + \
+                [f"p{rnd.randrange(args.site_pages)}.html" for _ in range(args.site_links)]
+        body = "".join(f'<a href="{href}">{href}</a>\n' for href in links)
+        body = f"<html><body><h1>{section} {page}</h1>\n{body}<p>{'x' * (args.page_kb * 1024)}</p></body></html>"
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *a):
+        pass
+
+
+def site_url(section, page):
+    return f"http://127.0.0.1:{args.site_port}/{section}/p{page}.html"
+
+
+# ---------------------- RING ---------------------- #
+
+def node_id(port):
+    return RemoteChordNode.make_remote_node(("127.0.0.1", port)).id
+
+
+def remote(port) -> RemoteChordNode:
+    return RemoteChordNode.make_remote_node(("127.0.0.1", port))
+
+
+def start_node(port, join, workdir):
+    cmd = [sys.executable, __file__, "--run-node", str(port), "--server", args.server, "--storage", args.storage]
+    if join is not None:
+        cmd += ["--join", str(join)]
+    return subprocess.Popen(cmd, cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_listening(ports, timeout=30):
+    deadline = time.monotonic() + timeout
+    for port in ports:
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise Exception(f"Node {port} did not start")
+                time.sleep(0.05)
+
+
+def ring_converged(ports) -> bool:
+    # successor and predecessor of every node are its neighbours in id order
+    ring = sorted(ports, key=node_id)
+    for i, port in enumerate(ring):
+        try:
+            node = remote(port)
+            succ, pred = node.Successor(), node.Predecessor()
+        except Exception:
+            return False
+        if succ.Address[1] != ring[(i + 1) % len(ring)] or pred.Address[1] != ring[i - 1]:
+            return False
+    return True
+
+
+def wait_converged(ports, start) -> float:
+    while not ring_converged(ports):
+        if time.monotonic() - start > args.timeout:
+            raise Exception(f"Ring of {len(ports)} did not converge in {args.timeout}s")
+        time.sleep(0.1)
+    return round(time.monotonic() - start, 3)
+
+
+def owner_of(id_, ports):
+    # the largest node keeps the keys above it
+    ring = sorted((node_id(p), p) for p in ports)
+    for nid, port in ring:
+        if id_ <= nid:
+            return port
+    return ring[-1][1]
+
+
+def rpc_totals(ports) -> dict:
+    totals = {}
+    for port in ports:
+        stats = json.load(urllib.request.urlopen(f"http://127.0.0.1:{port}/STATS", timeout=10))
+        for name, calls in stats.get("rpc", {}).items():
+            totals[name] = totals.get(name, 0) + calls
+    return totals
+
+
+def rpc_per_op(before, after, ops) -> dict:
+    # STATS are the harness asking, not the operation
+    delta = {name: after.get(name, 0) - before.get(name, 0) for name in after if name != "STATS"}
+    return {name: round(n / max(1, ops), 2) for name, n in sorted(delta.items(), key=lambda e: -e[1]) if n}
+
+
+def summary(values, scale=1.0) -> dict:
+    values = sorted(values)
+    if not values:
+        return {}
+    return {"mean": round(statistics.fmean(values) * scale, 3), "p50": round(values[len(values) // 2] * scale, 3),
+            "p95": round(values[int(len(values) * 0.95) - 1 if len(values) > 1 else 0] * scale, 3),
+            "max": round(values[-1] * scale, 3)}
+
+
+# ---------------------- PHASES ---------------------- #
+
+def bench_lookups(ports, rnd):
+    hops, latencies, wrong = [], [], 0
+    before = rpc_totals(ports)
+    for _ in range(args.lookups):
+        id_ = rnd.randrange(2 ** 160)
+        node = remote(rnd.choice(ports))
+        start = time.perf_counter()
+        count = 0
+        # the iterative walk a node does, one redirect per hop, the alternatives if the next one is gone
+        candidates = [node]
+        while True:
+            count += 1
+            for node in candidates:
+                try:
+                    res = node.lookup_step(id_)
+                    break
+                except OSError:
+                    continue
+            else:
+                raise Exception(f"Lookup of {id_} ran out of nodes")
+            if not isinstance(res, RedirectNodeResponse):
+                break
+            candidates = [RemoteChordNode.make_remote_node(tuple(a)) for a in [res.Address, *res.Alternatives]]
+        latencies.append(time.perf_counter() - start)
+        hops.append(count)
+        wrong += res.Address[1] != owner_of(id_, ports)
+    return {"lookups": args.lookups, "wrong": wrong, "hops": summary(hops), "latency_ms": summary(latencies, 1e3),
+            "rpc_per_lookup": rpc_per_op(before, rpc_totals(ports), args.lookups)}
+
+
+def bench_scrap(ports, rnd):
+    global site_fetches
+    results = []
+    for depth in map(int, args.depths.split(",")):
+        # a fresh section per depth so nothing is stored yet
+        url = site_url(f"d{depth}", 0)
+        before, fetches = rpc_totals(ports), site_fetches
+        start = time.perf_counter()
+        res = json.load(urllib.request.urlopen(
+            f"http://127.0.0.1:{rnd.choice(ports)}/SCRAP/{depth}/{url}", timeout=args.timeout))
+        elapsed = time.perf_counter() - start
+        pages = len({entry["Id"] for entry in res})
+        results.append({"depth": depth, "pages": pages, "entries": len(res), "seconds": round(elapsed, 3),
+                        "pages_per_s": round(pages / elapsed, 1), "site_fetches": site_fetches - fetches,
+                        "rpc_per_page": rpc_per_op(before, rpc_totals(ports), pages)})
+    return results
+
+
+def bench_push_get(ports, rnd):
+    content = "<html>" + "y" * (args.page_kb * 1024) + "</html>"
+    urls = [f"http://bench.local/doc/{args.seed}/{i}" for i in range(args.ops)]
+    entries = [rnd.choice(ports) for _ in urls]
+
+    def push(i):
+        port = entries[i]
+        return remote(port).Push(InfoContainer(urls[i], content=content), port, True, True)
+
+    def get(i):
+        with urllib.request.urlopen(f"http://127.0.0.1:{entries[-i - 1]}/GET/{urls[i]}", timeout=30) as r:
+            return len(json.load(r) or "") == len(content)
+
+    res = {}
+    for name, fn in (("push", push), ("get", get)):
+        before = rpc_totals(ports)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            done = list(pool.map(fn, range(args.ops)))
+        elapsed = time.perf_counter() - start
+        res[name] = {"ops": args.ops, "ok": sum(1 for d in done if d), "seconds": round(elapsed, 3),
+                     "ops_per_s": round(args.ops / elapsed, 1), "rpc_per_op": rpc_per_op(before, rpc_totals(ports),
+                                                                                            args.ops)}
+    return res
+
+
+def main():
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="discluster"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    rnd = random.Random(args.seed)
+    site = ThreadingHTTPServer(("127.0.0.1", args.site_port), SiteHandler)
+    threading.Thread(target=site.serve_forever, daemon=True).start()
+    ports = [args.baseport + i for i in range(args.nodes)]
+    procs = {}
+    results = {"config": {k: v for k, v in vars(args).items() if k not in ("run_node", "join", "out")}}
+    try:
+        logger.info(f"Starting {args.nodes} nodes in {workdir}")
+        procs[ports[0]] = start_node(ports[0], None, workdir)
+        wait_listening(ports[:1])
+        for port in ports[1:]:
+            procs[port] = start_node(port, ports[0], workdir)
+        wait_listening(ports)
+        results["join"] = {"nodes": len(ports), "converge_s": wait_converged(ports, time.monotonic())}
+        logger.info(f"Joined {results['join']}")
+
+        results["lookup"] = bench_lookups(ports, rnd)
+        logger.info(f"Lookups {results['lookup']['hops']} wrong {results['lookup']['wrong']}")
+        results["scrap"] = bench_scrap(ports, rnd)
+        logger.info(f"Scrap {[(r['depth'], r['pages_per_s']) for r in results['scrap']]}")
+        results.update(bench_push_get(ports, rnd))
+        logger.info(f"Push {results['push']['ops_per_s']}/s GET {results['get']['ops_per_s']}/s")
+
+        killed = rnd.sample(ports[1:], min(args.kills, len(ports) - 2))
+        for port in killed:
+            procs.pop(port).kill()
+            RemoteChordNode.evict(remote(port))
+        alive = [p for p in ports if p not in killed]
+        start = time.monotonic()
+        results["kill"] = {"killed": killed, "converge_s": wait_converged(alive, start)}
+        results["kill"]["lookups_after"] = bench_lookups(alive, rnd)["wrong"]
+        logger.info(f"Killed {results['kill']}")
+
+        if killed:
+            # back with an empty storage
+            port = killed[0]
+            (workdir / "rejoin").mkdir(exist_ok=True)
+            procs[port] = start_node(port, ports[0], workdir / "rejoin")
+            wait_listening([port])
+            results["rejoin"] = {"node": port, "converge_s": wait_converged(alive + [port], time.monotonic())}
+            logger.info(f"Rejoined {results['rejoin']}")
+    finally:
+        for proc in procs.values():
+            proc.kill()
+        site.shutdown()
+
+    print(json.dumps(results, indent=2))
+    if args.out is not None:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        logger.info("Results written to " + args.out)
+
+
+main()
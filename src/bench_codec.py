@@ -0,0 +1,78 @@
+import argparse
+import json
+import logging
+import random
+import timeit
+import xmlrpc.client
+
+from discraper_node.ChordNodeRemote import RemoteChordNode
+from discraper_node.InfoContainer import InfoContainer
+from discraper_node.custom_xrpc import BinaryCodec, register_type_unmarshaller
+from discraper_node.custom_xrpc.CustomXRPC import struct_to_instance
+
+parser = argparse.ArgumentParser(description='Compares the xml and binary wire codecs, bytes and encode/decode time')
+parser.add_argument('--number', type=int, default=200, help='Repetitions of each encode/decode')
+parser.add_argument('--batch', type=int, default=256, help='Ids per batch call')
+parser.add_argument('--out', type=str, default=None, help='Write the results as json to this file')
+
+args = parser.parse_args()
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+register_type_unmarshaller(RemoteChordNode)
+register_type_unmarshaller(InfoContainer)
+
+rand_id = lambda: random.getrandbits(160)
+node = RemoteChordNode(("127.0.0.1", 4440))
+docs = [InfoContainer(f"http://example.com/page/{i}", refs=[f"http://example.com/page/{i + j}" for j in range(10)],
+                      content="<html>" + "x" * 2000 + "</html>") for i in range(32)]
+
+# (name, params, methodname or None for a response)
+cases = [
+    ("Find_Successor call", (rand_id(),), "Find_Successor"),
+    ("Find_Successor response", (node,), None),
+    ("Push call", (docs[0], 4440, True, False), "Push"),
+    ("Owner_Of_Many call", ([rand_id() for _ in range(args.batch)], 4440), "Owner_Of_Many"),
+    ("Owner_Of_Many response", (["y"] * args.batch,), None),
+    ("Push_Many call", (docs, 4440), "Push_Many"),
+]
+
+
+def xml_dumps(params, methodname):
+    return xmlrpc.client.dumps(params, methodname, methodresponse=methodname is None,
+                               allow_none=True).encode("utf-8")
+
+
+def xml_loads(data):
+    return xmlrpc.client.loads(data)
+
+
+def bin_dumps(params, methodname):
+    return BinaryCodec.dumps(params, methodname, methodresponse=methodname is None)
+
+
+def bin_loads(data):
+    return BinaryCodec.loads(data, struct_to_instance)
+
+
+results = []
+for name, params, methodname in cases:
+    row = {"case": name}
+    for codec, dumps, loads in (("xml", xml_dumps, xml_loads), ("binary", bin_dumps, bin_loads)):
+        data = dumps(params, methodname)
+        encode = timeit.timeit(lambda: dumps(params, methodname), number=args.number) / args.number
+        decode = timeit.timeit(lambda: loads(data), number=args.number) / args.number
+        row[codec] = {"bytes": len(data), "encode_us": round(encode * 1e6, 1), "decode_us": round(decode * 1e6, 1)}
+    results.append(row)
+
+print(f"{'case':<26}{'xml B':>9}{'bin B':>9}{'xml enc':>10}{'bin enc':>10}{'xml dec':>10}{'bin dec':>10}  (us)")
+for row in results:
+    x, b = row["xml"], row["binary"]
+    print(f"{row['case']:<26}{x['bytes']:>9}{b['bytes']:>9}{x['encode_us']:>10}{b['encode_us']:>10}"
+          f"{x['decode_us']:>10}{b['decode_us']:>10}")
+
+if args.out is not None:
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    logger.info("Results written to " + args.out)
@@ -0,0 +1,105 @@
+import argparse
+import inspect
+import json
+import logging
+import timeit
+from xmlrpc.server import SimpleXMLRPCDispatcher
+
+from discraper_node.custom_xrpc.CustomXRPC import RoutedDispatcher
+
+parser = argparse.ArgumentParser(description='Dispatch overhead per call, reflection on every request vs the route table')
+parser.add_argument('--number', type=int, default=200000, help='Calls per case')
+parser.add_argument('--out', type=str, default=None, help='Write the results as json to this file')
+
+args = parser.parse_args()
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+
+class Node:
+    # same shapes as the node methods, empty bodies so only the dispatch is measured
+    def GET(self, url_or_id, i_remote=None):
+        return url_or_id
+
+    def SCRAP(self, level, url, i_remote=None):
+        return level
+
+    def Find_Successor(self, id_, i_remote=None):
+        return id_
+
+    def Notify(self, dstport, i_addr=None):
+        return dstport
+
+
+client_address = ("127.0.0.1", 40000)
+
+
+class ReflectiveServer(SimpleXMLRPCDispatcher):
+    pass
+
+
+class RoutedServer(RoutedDispatcher, SimpleXMLRPCDispatcher):
+    pass
+
+
+reflective = ReflectiveServer(allow_none=True)
+reflective.register_instance(Node())
+routed = RoutedServer(allow_none=True)
+routed.register_instance(Node())
+
+
+# the resolution done on every request before the route table
+def reflective_get(method, url_path):
+    meth = getattr(reflective.instance, method)
+    meth_params = inspect.signature(meth).parameters
+    param_count = len(meth_params) - (1 if "i_remote" in meth_params else 0)
+    params = tuple(url_path.lstrip("/").split("/", param_count)[1:]) if param_count > 0 else tuple()
+    return reflective._dispatch(method, params)
+
+
+def reflective_post(method, params):
+    meth = getattr(reflective.instance, method)
+    meth_params = inspect.signature(meth).parameters
+    if meth_params.get("i_addr", None):
+        params = tuple(list(params) + [client_address])
+    if meth_params.get("i_remote", None):
+        params = tuple(list(params) + [1])
+    if len(params) > len(meth_params):
+        raise Exception("Invalid call to Injected method")
+    return reflective._dispatch(method, params)
+
+
+def routed_get(method, url_path):
+    route = routed.routes[method]
+    return route.call_rest(url_path)
+
+
+def routed_post(method, params):
+    route = routed.routes[method]
+    return route.call(params, client_address, "POST")
+
+
+cases = [
+    ("GET /GET/<url>", lambda f: f("GET", "/GET/http://example.com/a/b"), reflective_get, routed_get),
+    ("GET /SCRAP/<level>/<url>", lambda f: f("SCRAP", "/SCRAP/2/http://example.com/a"), reflective_get, routed_get),
+    ("POST Find_Successor", lambda f: f("Find_Successor", (2 ** 159,)), reflective_post, routed_post),
+    ("POST Notify", lambda f: f("Notify", (4440,)), reflective_post, routed_post),
+]
+
+results = []
+for name, call, old, new in cases:
+    assert call(old) == call(new)
+    old_us = timeit.timeit(lambda: call(old), number=args.number) / args.number * 1e6
+    new_us = timeit.timeit(lambda: call(new), number=args.number) / args.number * 1e6
+    results.append({"case": name, "reflective_us": round(old_us, 3), "routed_us": round(new_us, 3),
+                    "speedup": round(old_us / new_us, 1)})
+
+print(f"{'case':<28}{'reflective':>12}{'routed':>10}{'speedup':>9}  (us per call)")
+for row in results:
+    print(f"{row['case']:<28}{row['reflective_us']:>12}{row['routed_us']:>10}{row['speedup']:>8}x")
+
+if args.out is not None:
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    logger.info("Results written to " + args.out)
@@ -0,0 +1,118 @@
+import argparse
+import json
+import logging
+import random
+import re
+import time
+import tracemalloc
+import urllib.parse
+
+from discraper_node.tools.LinkExtractor import LinkExtractor, normalize_url
+
+parser = argparse.ArgumentParser(description='Link extraction on large pages, regex over the whole page vs the '
+                                             'streaming html parser fed while downloading')
+parser.add_argument('--sizes', type=str, default="256,1024,4096", help='Page sizes in KB, comma separated')
+parser.add_argument('--chunk', type=int, default=64 * 1024, help='Download chunk size in bytes')
+parser.add_argument('--number', type=int, default=5, help='Repetitions per page, best time is kept')
+parser.add_argument('--out', type=str, default=None, help='Write the results as json to this file')
+
+args = parser.parse_args()
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+page_url = "http://example.com/docs/guide/index.html"
+
+# the extraction used before, over the decoded page
+compiled_regex = re.compile('(?:href=(?:[ "]|(?:&quot;))(?P<href>.+?)(?:[ "]|(?:&quot;)))')
+
+
+def regex_links(chunks):
+    content = b"".join(chunks).decode("utf-8")
+    domain = urllib.parse.urlsplit(page_url).netloc
+    urls = set()
+    for url in compiled_regex.findall(content):
+        if url.startswith("#"):
+            continue
+        if not url.startswith("http"):
+            url = "http://" + domain + "/" + url.lstrip("/")
+        if urllib.parse.urlsplit(url).netloc.endswith(domain):
+            urls.add(url)
+    return urls
+
+
+def streaming_links(chunks):
+    extractor = LinkExtractor(page_url)
+    for chunk in chunks:
+        extractor.feed(chunk.decode("utf-8"))
+    extractor.close()
+    domain = urllib.parse.urlsplit(page_url).netloc
+    return {link for link in extractor.links() if urllib.parse.urlsplit(link).netloc.endswith(domain)}
+
+
+hrefs = ["/docs/a.html", "b.html", "../api/c.html", "./d.html?x=1", "http://example.com/e.html#top",
+         "HTTP://Example.COM:80/f.html", "#section", "mailto:someone@example.com", "http://other.org/g.html",
+         "//example.com/h.html", "sub/i.html", "/docs/guide/../j.html"]
+
+
+def make_page(size):
+    rnd = random.Random(size)
+    parts = ['<html><head><title>t</title></head><body>']
+    n = 0
+    while sum(map(len, parts)) < size:
+        href = rnd.choice(hrefs).replace(".html", f"{n % 500}.html")
+        parts.append(f'<p>{"lorem ipsum " * rnd.randint(1, 20)}<a class="x" href="{href}">link {n}</a></p>\n')
+        n += 1
+    parts.append("</body></html>")
+    return "".join(parts).encode("utf-8")
+
+
+def expected_links(page):
+    # what a browser resolves, for counting the wrong urls of each method
+    found = set()
+    for href in re.findall(r'href="([^"]*)"', page.decode("utf-8")):
+        if href.startswith("#"):
+            continue
+        url = normalize_url(urllib.parse.urljoin(page_url, href))
+        if url is not None and urllib.parse.urlsplit(url).netloc == "example.com":
+            found.add(url)
+    return found
+
+
+def measure(fn, chunks):
+    best = float("inf")
+    for _ in range(args.number):
+        start = time.perf_counter()
+        links = fn(chunks)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    fn(chunks)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return links, best, peak
+
+
+results = []
+for size_kb in map(int, args.sizes.split(",")):
+    page = make_page(size_kb * 1024)
+    chunks = [page[i:i + args.chunk] for i in range(0, len(page), args.chunk)]
+    expected = expected_links(page)
+    row = {"page_kb": size_kb}
+    for name, fn in (("regex", regex_links), ("streaming", streaming_links)):
+        links, best, peak = measure(fn, chunks)
+        row[name] = {"ms": round(best * 1e3, 2), "mb_s": round(len(page) / best / 1e6, 1),
+                     "peak_kb": peak // 1024, "links": len(links), "wrong": len(links - expected),
+                     "missed": len(expected - links)}
+    results.append(row)
+
+print(f"{'page KB':>8}{'regex ms':>10}{'stream ms':>11}{'regex peak':>12}{'stream peak':>13}"
+      f"{'regex links/wrong':>19}{'stream links/wrong':>20}")
+for row in results:
+    r, s = row["regex"], row["streaming"]
+    print(f"{row['page_kb']:>8}{r['ms']:>10}{s['ms']:>11}{r['peak_kb']:>12}{s['peak_kb']:>13}"
+          f"{str(r['links']) + '/' + str(r['wrong']):>19}{str(s['links']) + '/' + str(s['wrong']):>20}")
+
+if args.out is not None:
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    logger.info("Results written to " + args.out)
@@ -1,3 +1,4 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import logging
 import math
 import os
@@ -6,10 +7,20 @@ import threading
 import time
 
 from ._IdComparable import IdComparable
-from .custom_xrpc import RedirectNodeResponse, ThreadedXRPCServer, register_type_unmarshaller
+from .custom_xrpc import AsyncXRPCServer, RedirectNodeResponse, StreamResponse, ThreadedXRPCServer, \
+    register_type_unmarshaller, client_errors, client_latency, shared_pool
 from .ChordNodeRemote import RemoteChordNode
 from .InfoContainer import InfoContainer
-from .tools.OrderedUniqueList import OrderedUniqueList
+from .storage import make_store
+from .tools.SortedIndex import SortedIndex
+from .tools.BloomFilter import BloomFilter
+from .tools.MerkleTree import MerkleTree
+from .tools.LocationCache import LocationCache
+from .tools.Metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, HOP_BUCKETS, Histogram, MetricsText, \
+    thread_counts
+from .tools.RttEstimator import RttEstimator
+from .tools.Tracer import carry, tracer, untraced
+from .tools.Scheduler import Scheduler
 from .tools.utils import between
 from .tools.DbgHelpers import debug_d
 from . import custom_logger as CustomLogger
@@ -24,7 +35,7 @@ class ChordNode(IdComparable):
         return res
 
     def __init__(self, port=4440, interface="127.0.0.1", *, logger=None, keypair_content=None, ca_content=None, iterative=True,
-                 aditional_types=None):
+                 aditional_types=None, storage="segments", server="threads"):
         # param validation and primitives
         assert interface != "0.0.0.0"  # only allow one interface, it does not make sense for the id
         super(IdComparable, self).__init__()
@@ -40,6 +51,7 @@ class ChordNode(IdComparable):
         self.folder.mkdir(parents=True, exist_ok=True)
         os.chdir(self.folder)
         folder = Path.cwd()
+        InfoContainer.store = make_store(storage, folder)
 
         cryptoname = 'cert'
         keypair_path = folder / f"{cryptoname}.crt", folder / f"{cryptoname}.key"
@@ -56,15 +68,20 @@ class ChordNode(IdComparable):
         if ca_content is not None:
             ca_path.write_text(ca_content)
 
+        # a thread per connection or one asyncio loop with a bounded pool for the calls
+        server_type = AsyncXRPCServer if server == "asyncio" else ThreadedXRPCServer
         if keypair_path[0].exists() and keypair_path[1].exists() and ca_path.exists():
             self.logger.info(f"Using Secure Connection")
-            self._rpc_server = ThreadedXRPCServer(addr=self.Address, keypair=keypair_path, ca_file=ca_path,
-                                                  allow_none=True,
-                                                  logRequests=False)
+            self._rpc_server = server_type(addr=self.Address, keypair=keypair_path, ca_file=ca_path,
+                                           allow_none=True,
+                                           logRequests=False)
+            RemoteChordNode.set_credentials(keypair_path, ca_path)
         else:
-            self._rpc_server = ThreadedXRPCServer(addr=self.Address, allow_none=True, logRequests=False)
+            self._rpc_server = server_type(addr=self.Address, allow_none=True, logRequests=False)
+            RemoteChordNode.set_credentials()
 
         # rpc config
+        InfoContainer.blob_server = self.Address
 
         # type(self) to allow inheriting from ChordNode
         required_types = [type(self), RemoteChordNode, InfoContainer]
@@ -81,27 +98,59 @@ class ChordNode(IdComparable):
         # self.finger[0] = self # better with the getters
         self.r_successors = [None] * (math.ceil(math.log2(len(self.finger))))
 
-        self.database: OrderedUniqueList = OrderedUniqueList()
+        self.merkle = MerkleTree(len(self.finger))
+        self.location_cache = LocationCache()
+        # iterative lookups are run here, each hop races the alternatives sent with the redirect
+        self.rtt = RttEstimator()
+        self.lookup_alternatives = 3
+        self.lookup_parallel = 2
+        self.lookup_max_hops = 2 * len(self.finger)
+        self.lookup_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="LOOKUP")
+        self.lookup_hops = Histogram(HOP_BUCKETS)
+        self.lookup_latency = Histogram()
+        # spans of the traced requests kept here, and nodes asked for theirs when a trace is collected
+        self.trace_capacity = 4096
+        self.trace_max_nodes = 64
+        tracer.configure(f"{self.Address[0]}:{self.Address[1]}", self.trace_capacity)
+        self.database: SortedIndex = SortedIndex(tree=self.merkle)
+
+        # all the maintenance runs in one timer wheel, the pollings are the intervals while the ring changes
+        # and grow up to maintenance_backoff times while it is stable
+        self.scheduler = Scheduler()
+        self.maintenance_backoff = 16
 
         self.r_successors_polling = 0.5
-        self.r_successors_thread = None
-        self.r_successors_d()
+        self._add_maintenance("RS", self.r_successors_d, self.r_successors_polling)
 
-        self.fix_fingers_polling = 0.1
-        self.fix_fingers_thread = None
-        self.fix_fingers_d()
+        self.fix_fingers_round_polling = 1
+        self._add_maintenance("FF", self.fix_fingers_d, self.fix_fingers_round_polling)
 
         self.stabilize_polling = 0.5
-        self.stabilize_thread = None
-        self.stabilize_d()
+        self._add_maintenance("ST", self.stabilize_d, self.stabilize_polling)
 
         self.chk_pred_polling = 0.5
-        self.chk_pred_thread = None
-        self.chk_pred_d()
+        self._add_maintenance("CP", self.chk_pred_d, self.chk_pred_polling)
 
         self.fix_content_polling = 0.2
-        self.fix_content_thread = None
-        self.fix_content_d()
+        # reconcile by owner ranges with batched calls instead of one proposal per key
+        self.fix_content_bulk = True
+        self.fix_content_bulk_polling = 1
+        self.fix_content_batch = 256
+        # compare replicas with the successor by hash tree instead of proposing every key
+        self.fix_content_merkle = True
+        # documents per call when taking over a range on join
+        self.handoff_batch = 64
+        self._add_maintenance("FC", self.fix_content_d,
+                              self.fix_content_bulk_polling if self.fix_content_bulk else self.fix_content_polling)
+
+        # bloom filter of the ids i store, pulled by my neighbours so they can tell what is already stored
+        self.bloom_error_rate = 0.01
+        self.bloom_filter: BloomFilter = None
+        self.bloom_version = None
+        # address -> (node, version, filter) of the neighbours
+        self.peer_filters: dict[tuple, tuple] = {}
+        self.bloom_polling = 2
+        self._add_maintenance("BF", self.bloom_gossip_d, self.bloom_polling)
 
         self.rpc_server_thread = threading.Thread(name="Server", target=self._rpc_server.serve_forever)
         self.rpc_server_thread.start()
@@ -120,132 +169,219 @@ class ChordNode(IdComparable):
             self._rpc_server.server_close()
         except:
             pass
+        InfoContainer.get_store().close()
+        self.lookup_pool.shutdown(wait=False)
+        self.scheduler.stop()
 
     # ---------------------- DAEMONS ---------------------- #
 
-    def r_successors_d(self):
+    def _add_maintenance(self, name, task, interval):
+        self.scheduler.add(name, task, interval, interval * self.maintenance_backoff)
 
-        if self.r_successors_thread is None or not self.r_successors_thread.is_alive():
-            self.logger.info("Starting R_successors_d")
-            self.r_successors_thread = threading.Thread(name="RS", target=self.r_successors_d, daemon=True)
-            self.r_successors_thread.start()
-            return
+    def _bounded(self, node):
+        """
+        node itself if it is me, otherwise its proxy with a timeout. The maintenance runs on a few shared
+        workers, a peer frozen without closing its socket must not hold them
+        """
+        return node if isinstance(node, ChordNode) else node.bounded()
 
-        while True:
-            successor = self
-            for i in range(len(self.r_successors)):
-                time.sleep(self.r_successors_polling)
-                try:
-                    successor = successor.Successor()
-                except Exception as e:
-                    self.logger.error(f"Succesor down {e}")
-                    for j in range(i, len(self.r_successors)):  # will give second opportunity
-                        try:
-                            s: ChordNode = self.r_successors[j]
-                            if s is None:
-                                break
-                            content = str(time.time_ns())
-                            self.logger.debug(f"Ping {content} to {s}")
-                            s.Ping(content)
-                            if i == 1:  # if down in iteration 1 is that succesor is down, have to fix it
-                                self.finger[0] = s
-                                self.r_successors.pop(j)
-                                self.r_successors.append(None)
-                                break
-                        except Exception as e2:
-                            self.logger.error(f"Err2 {e}")
+    def _ring_changed(self):
+        """
+        a node failed or joined, the maintenance goes back to its shortest intervals
+        """
+        self.scheduler.tighten()
+
+    def r_successors_d(self):
+        """
+        called periodically. walks the successor list, returns True if it changed
+        """
+        changed = False
+        successor = self
+        for i in range(len(self.r_successors)):
+            try:
+                successor = self._bounded(successor).Successor()
+            except Exception as e:
+                self.logger.error(f"Succesor down {e}")
+                changed = True
+                for j in range(i, len(self.r_successors)):  # will give second opportunity
+                    try:
+                        s: ChordNode = self.r_successors[j]
+                        if s is None:
+                            break
+                        content = str(time.time_ns())
+                        self.logger.debug(f"Ping {content} to {s}")
+                        self._bounded(s).Ping(content)
+                        if i == 1:  # if down in iteration 1 is that succesor is down, have to fix it
+                            self.finger[0] = s
                             self.r_successors.pop(j)
                             self.r_successors.append(None)
-
-                if successor == self or successor in self.r_successors[:i]:
-                    self.r_successors[i:] = [None] * (len(self.r_successors) - i)
-                    break
-                self.r_successors[i] = successor
+                            break
+                    except Exception as e2:
+                        self.logger.error(f"Err2 {e}")
+                        RemoteChordNode.evict(s)
+                        self.location_cache.invalidate(s)
+                        self.r_successors.pop(j)
+                        self.r_successors.append(None)
+
+            if successor == self or successor in self.r_successors[:i]:
+                changed = changed or any(s is not None for s in self.r_successors[i:])
+                self.r_successors[i:] = [None] * (len(self.r_successors) - i)
+                break
+            changed = changed or self.r_successors[i] != successor
+            self.r_successors[i] = successor
+        return changed
 
     def stabilize_d(self):
         """
         called periodically, verifies n’s immediate successor, and tells the successor about n.
         """
-        if self.stabilize_thread is None or not self.stabilize_thread.is_alive():
-            self.logger.info("Starting stabilize_d")
-            self.stabilize_thread = threading.Thread(name="ST", target=self.stabilize_d, daemon=True)
-            self.stabilize_thread.start()
-            return
-
-        while True:
-            successor = self.Successor()
-            try:
-                x = successor.Predecessor()
-                if between(L=self.id, R=successor.id, id_=x.id) or (successor == self and x != self):
-                    self.logger.warning(f"StabSucc from {successor} to {x}")
-                    self.finger[0] = x
-                    successor = x
-            except BaseException as e:  # maybe catch spec exept
-                self.logger.error(f"Err stabilizing {e}")
+        changed = False
+        successor = self.Successor()
+        try:
+            x = self._bounded(successor).Predecessor()
+            if between(L=self.id, R=successor.id, id_=x.id) or (successor == self and x != self):
+                self.logger.warning(f"StabSucc from {successor} to {x}")
+                self.finger[0] = x
+                successor = x
+                self.location_cache.node_seen(x)
+                changed = True
+            else:
+                self._learn_finger(x)
+        except BaseException as e:  # maybe catch spec exept
+            self.logger.error(f"Err stabilizing {e}")
+            changed = True
 
-            try:
-                if successor != self:
-                    successor.Notify(self.Address[1])  # notify my port
-            except BaseException as e:
-                self.logger.error(f"Err notifiying {e}")
-            time.sleep(self.stabilize_polling)
+        try:
+            if successor != self:
+                self._bounded(successor).Notify(self.Address[1])  # notify my port
+        except BaseException as e:
+            self.logger.error(f"Err notifiying {e}")
+            changed = True
+        return changed
 
     def chk_pred_d(self):
         '''
          called periodically. checks whether predecessor has failed
         '''
-        if self.chk_pred_thread is None or not self.chk_pred_thread.is_alive():
-            self.logger.info("Starting chk_pred_d")
-            self.chk_pred_thread = threading.Thread(name="CP", target=self.chk_pred_d, daemon=True)
-            self.chk_pred_thread.start()
-            return
+        pred: "ChordNode" = self.predecessor
+        try:
+            if pred is not None:
+                content = str(time.time_ns())
+                self.logger.debug(f"Ping {content} to {pred}")
+                self._bounded(pred).Ping(content)
+        except BaseException as e:
+            # now im responsible for the data im backed up so lets send it to my successor
+            self.logger.error(f"Cleaning predecessor")
+            RemoteChordNode.evict(pred)
+            self.location_cache.invalidate(pred)
+            self.predecessor = None
+            return True
+        return False
 
-        while True:
-            pred: "ChordNode" = self.predecessor
+    def fix_fingers_d(self):
+        """
+        called periodically. refreshes finger table entries.
+        """
+        changed = False
+        # only the distinct fingers are looked up, the slots a finger covers are skipped
+        next_ = 0
+        while next_ < len(self.finger):
+            fid = (self.id + 2 ** next_) % (2 ** len(self.finger))
+            next_succ = self.Find_Successor(fid)
+            if next_succ.id == self.id:  # break because i will no longer find something better than me
+                for j in range(max(next_, 1), len(self.finger)):
+                    changed = changed or self.finger[j] is not None
+                    self.finger[j] = None  # clean them
+                break
+            if next_ > 0 and self.finger[next_] != next_succ:
+                self.logger.warning(f"Fixed finger {next_} from {self.finger[next_]} to {next_succ}")
+                self.finger[next_] = next_succ
+                changed = True
+            # every slot whose start is in (self, next_succ] has next_succ as finger too
+            covered = self._distance(next_succ.id).bit_length()
+            for j in range(max(next_ + 1, 1), min(covered, len(self.finger))):
+                self.finger[j] = None
+            next_ = max(covered, next_ + 1)
+        return changed
+
+    def _own_filter(self) -> tuple[str, BloomFilter]:
+        # rebuilt only when the set of ids changes, the root of the hash tree tells
+        version = format(self.merkle.hashes(0, [0])[0], "x")
+        if version != self.bloom_version:
+            ids = [info.id for info in self.database]
+            bloom = BloomFilter(max(1024, 2 * len(ids)), self.bloom_error_rate)
+            for id_ in ids:
+                bloom.add(id_)
+            self.bloom_filter, self.bloom_version = bloom, version
+        return self.bloom_version, self.bloom_filter
+
+    def _neighbours(self) -> list:
+        nodes = {self.predecessor, *self.r_successors, *self.finger}
+        return [node for node in nodes if node is not None and node != self]
+
+    def bloom_gossip_d(self):
+        """
+        called periodically. pulls the bloom filters of my neighbours that changed since the last pull,
+        never tightens the ring maintenance
+        """
+        neighbours = self._neighbours()
+        changed = False
+        for node in neighbours:
+            address = tuple(node.Address)
+            known = self.peer_filters.get(address, None)
             try:
-                if pred is not None:
-                    content = str(time.time_ns())
-                    self.logger.debug(f"Ping {content} to {pred}")
-                    pred.Ping(content)
-            except BaseException as e:
-                # now im responsible for the data im backed up so lets send it to my successor
-                self.logger.error(f"Cleaning predecessor")
-                self.predecessor = None
+                res = self._bounded(node).Bloom_Filter(known[1] if known else "")
+            except Exception as e:
+                self.logger.info(f"Failed pulling the bloom filter of {node} {e}")
+                self.peer_filters.pop(address, None)
+                continue
+            if res:
+                version, *wire = res
+                self.peer_filters[address] = node, version, BloomFilter.from_wire(wire)
+                changed = True
+        for address in set(self.peer_filters) - {tuple(node.Address) for node in neighbours}:
+            self.peer_filters.pop(address, None)
+        if changed:
+            # filters change while the neighbours crawl, stay at the shortest interval meanwhile
+            self.scheduler.tighten("BF")
+        return False
+
+    def _stored_by(self, id_):
+        """
+        a node that most likely stores id_, me or a neighbour whose filter has it, None if unknown
+        """
+        if id_ in self.database:
+            return self
+        for node, _, bloom in list(self.peer_filters.values()):
+            if id_ in bloom:
+                return node
+        return None
 
-            time.sleep(self.chk_pred_polling)
+    def _distance(self, id_) -> int:
+        # clockwise distance from me to id_
+        return (id_ - self.id) % (2 ** len(self.finger))
 
-    def fix_fingers_d(self):
+    def _learn_finger(self, node):
         """
-        called periodically. refreshes finger table entries.
+        places a node seen in a lookup in the finger table if it is a better finger than the known ones
         """
-        if self.fix_fingers_thread is None or not self.fix_fingers_thread.is_alive():
-            self.logger.info("Starting fix_fingers_d")
-            self.fix_fingers_thread = threading.Thread(name="FF", target=self.fix_fingers_d, daemon=True)
-            self.fix_fingers_thread.start()
+        if node is None or isinstance(node, RedirectNodeResponse) or node == self:
             return
-
-        while True:
-            for next_ in range(0, len(self.finger)):
-                time.sleep(self.fix_fingers_polling)  # here to avoid hard looping
-                fid = (self.id + 2 ** next_) % (2 ** len(self.finger))
-                next_succ = self.Find_Successor(fid)
-                if next_succ.id == self.id:  # break because i will no longer find something better than me
-                    if next_ > 0:
-                        self.finger[next_] = None  # clean it
-                    break
-                if next_succ not in self.finger:
-                    self.logger.warning(f"Fixed finger {next_} from {self.finger[next_]} to {next_succ}")
-                    self.finger[next_] = next_succ
+        distance = self._distance(node.id)
+        slot = distance.bit_length() - 1
+        if slot <= 0 or node in self.finger:
+            return
+        # a known node between the slot start and node is at least as good
+        for f in self.finger:
+            if f is not None and 2 ** slot <= self._distance(f.id) <= distance:
+                return
+        self.logger.info(f"Learned finger {slot} from {self.finger[slot]} to {node}")
+        self.finger[slot] = node
 
     def fix_content_d(self):
         """
         called periodically. refreshes info around the ring
         """
-        if self.fix_content_thread is None or not self.fix_content_thread.is_alive():
-            self.logger.info("Starting fix_content_d")
-            self.fix_content_thread = threading.Thread(name="FC", target=self.fix_content_d, daemon=True)
-            self.fix_content_thread.start()
-            return
 
         def _propose_and_send(node, info_, recurse):
             try:
@@ -258,6 +394,7 @@ class ChordNode(IdComparable):
                     self.logger.info(f"{node} has {info_.id}")
                 case "n":
                     self.logger.warning(f"{node} rejected {info_.id}")
+                    self.location_cache.invalidate(node)
                 case "m":
                     self.logger.warning(f"{node} missing {info_.id}")
                     try:
@@ -269,30 +406,170 @@ class ChordNode(IdComparable):
                     self.logger.warning(f"{node} is in invalid state")
             return res
 
-        while True:
-            polling_interval = max(self.fix_content_polling, 5 / (len(self.database) + 1))
-            time.sleep(polling_interval)
-            content = self.database
-            for info in content:
-                time.sleep(polling_interval)
-                predecessor = self.Predecessor()
-                successor = self.Successor()
-                if predecessor == self or successor == self:
+        if self.fix_content_bulk:
+            self._reconcile_bulk()
+            return False
+        content = self.database
+        for info in content:
+            predecessor = self.Predecessor()
+            successor = self.Successor()
+            if predecessor == self or successor == self:
+                continue
+
+            im_owner = self.Owner_Of(info.id, self.Address[1], False, self.Address)
+            tnode = self if im_owner == "y" else self.Find_Successor(info.id)
+            if tnode == self:
+                resp = _propose_and_send(node=successor, info_=info, recurse=False)
+                tnode = successor
+            else:
+                recurse_push = False # if tnode == predecessor else True
+                resp = _propose_and_send(node=tnode, info_=info, recurse=recurse_push)
+
+            # not mine and not deleting predecessor keys
+            if im_owner == "n" and (resp == "y" or resp == "m") and tnode != predecessor:
+                recurse_del = False  # True if tnode != successor else False
+                self.Delete(info.id, self.Address[1], recurse_del, False, self.Address)
+        return False
+
+    def _group_by_owner(self, ids, predecessor, successor):
+        """
+        splits the sorted ids in ranges by owner, one lookup per owner instead of one per key
+        """
+        groups: dict[int, tuple[ChordNode, list]] = {}
+        owner, start = None, None
+        for id_ in ids:
+            if self._is_owner(id_, predecessor, successor):
+                tnode = self
+            else:
+                # no node lies between a key and its successor, so the whole [start, owner] belongs to it
+                if owner is None or not (id_ == start or id_ == owner.id or between(L=start, R=owner.id, id_=id_)):
+                    owner, start = self.Find_Successor(id_), id_
+                tnode = owner
+            groups.setdefault(tnode.id, (tnode, []))[1].append(id_)
+        return groups.values()
+
+    def _reconcile_bulk(self):
+        """
+        one pass of fix_content_d in bulk, each owner is asked once which of its ids it has and
+        the missing ones are sent in one push
+        """
+        predecessor = self.Predecessor()
+        successor = self.Successor()
+        if predecessor == self or successor == self:
+            return
+        compared = False
+        if self.fix_content_merkle:
+            # runs even with no keys of mine, the successor may hold some i lost
+            try:
+                self._anti_entropy(successor, predecessor)
+                compared = True
+            except BaseException as e:
+                self.logger.error(f"Err comparing hash tree with {successor} err: {e}")
+        ids = [info.id for info in list(self.database)]
+        for tnode, owned in self._group_by_owner(ids, predecessor, successor):
+            mine = tnode == self
+            if mine and compared:
+                continue
+            # my keys are proposed to the successor as replicas
+            node = successor if mine else tnode
+            for i in range(0, len(owned), self.fix_content_batch):
+                batch = owned[i:i + self.fix_content_batch]
+                try:
+                    answers = self._bounded(node).Owner_Of_Many(batch, self.Address[1])
+                except BaseException as e:
+                    self.logger.error(f"Err proposing {len(batch)} ids to {node} err: {e}")
+                    self.location_cache.invalidate(node)
                     continue
+                missing = [id_ for id_, res in zip(batch, answers) if res == "m"]
+                accepted = [id_ for id_, res in zip(batch, answers) if res == "y"]
+                if missing:
+                    infos = list(filter(None, map(self.database.find_like, missing)))
+                    self.logger.warning(f"{node} missing {len(infos)} ids")
+                    try:
+                        self._bounded(node).Push_Many(infos, self.Address[1], False)
+                        accepted.extend(missing)
+                    except BaseException as e:
+                        self.logger.error(f"Err sending {len(infos)} ids to {node} in prop {e}")
+                rejected = len(batch) - len(accepted)
+                if rejected:
+                    self.logger.warning(f"{node} rejected {rejected} ids")
+                if "n" in answers:
+                    self.location_cache.invalidate(node)
+                # not mine and not deleting predecessor keys
+                if not mine and tnode != predecessor:
+                    for id_ in accepted:
+                        self.Delete(id_, self.Address[1], False, False, self.Address)
 
-                im_owner = self.Owner_Of(info.id, self.Address[1], False, self.Address)
-                tnode = self if im_owner == "y" else self.Find_Successor(info.id)
-                if tnode == self:
-                    resp = _propose_and_send(node=successor, info_=info, recurse=False)
-                    tnode = successor
-                else:
-                    recurse_push = False # if tnode == predecessor else True
-                    resp = _propose_and_send(node=tnode, info_=info, recurse=recurse_push)
+    def _my_intervals(self, predecessor, successor) -> list[tuple[int, int]]:
+        """
+        inclusive key intervals i own, same ranges as _is_owner
+        """
+        max_id = 2 ** len(self.finger) - 1
+        if predecessor.id > self.id:
+            return [(0, self.id)]
+        high = max_id if self.id > successor.id else self.id
+        return [(predecessor.id + 1, high)]
 
-                # not mine and not deleting predecessor keys
-                if im_owner == "n" and (resp == "y" or resp == "m") and tnode != predecessor:
-                    recurse_del = False  # True if tnode != successor else False
-                    self.Delete(info.id, self.Address[1], recurse_del, False, self.Address)
+    def _owned_intervals(self) -> list[tuple[int, int]]:
+        predecessor = self.Predecessor()
+        if predecessor == self:
+            # alone, everything is mine
+            return [(0, 2 ** len(self.finger) - 1)]
+        return self._my_intervals(predecessor, self.Successor())
+
+    def _anti_entropy(self, node, predecessor):
+        """
+        finds the keys of my range where node, my replica, differs from me by descending only into
+        the subtrees whose hashes differ, then repairs them in both directions
+        """
+        intervals = self._my_intervals(predecessor, node)
+
+        def _inside(lo, hi):
+            return any(l <= lo and hi <= h for l, h in intervals)
+
+        def _intersects(lo, hi):
+            return any(lo <= h and l <= hi for l, h in intervals)
+
+        frontier = [0]
+        leaves = []
+        for level in range(self.merkle.depth + 1):
+            inside = [i for i in frontier if _inside(*self.merkle.node_range(level, i))]
+            # partially covered nodes can't be compared, hashes include keys out of my range
+            differ = [i for i in frontier if i not in inside]
+            if inside:
+                remote = self._bounded(node).Merkle_Hashes(level, inside)
+                local = self.merkle.hashes(level, inside)
+                differ.extend(i for i, l, r in zip(inside, local, remote) if format(l, "x") != r)
+            if level == self.merkle.depth:
+                leaves = differ
+                break
+            frontier = [c for i in differ for c in (2 * i, 2 * i + 1)
+                        if _intersects(*self.merkle.node_range(level + 1, c))]
+            if not frontier:
+                break
+
+        ranges = []
+        for leaf in leaves:
+            lo, hi = self.merkle.node_range(self.merkle.depth, leaf)
+            ranges.extend((max(lo, l), min(hi, h)) for l, h in intervals if lo <= h and l <= hi)
+        if not ranges:
+            return
+        remote_ids = self._bounded(node).Range_Ids(ranges)
+        local_only, remote_only = [], []
+        for (lo, hi), r_ids in zip(ranges, remote_ids):
+            r_ids = set(map(int, r_ids))
+            l_infos = self.database.get_range(lo, hi)
+            local_only.extend(info for info in l_infos if info.id not in r_ids)
+            remote_only.extend(r_ids.difference(info.id for info in l_infos))
+        if local_only:
+            self.logger.warning(f"{node} missing {len(local_only)} replicas")
+            self._bounded(node).Push_Many(local_only, self.Address[1], False)
+        for id_ in remote_only:
+            info = self._bounded(node).Pull(id_, self.Address[1], False)
+            if info is not None:
+                self.logger.warning(f"Recovered {id_} from {node}")
+                info.write(bounded=True)
+                self.database.append(info)
 
     # ---------------------- DHT CORE OPS ---------------------- #
 
@@ -320,8 +597,47 @@ class ChordNode(IdComparable):
             self.logger.error(f"Err {e} finding successor setting {n0} on JOIN ")
         if successor == self:
             self.logger.critical("Why returned self? collision?")
+        else:
+            # nobody routes to me until the successor is set, so it keeps owning the range meanwhile
+            self._take_over_range(successor)
         self.finger[0] = successor
         self.logger.info(f"Set successor as {successor}")
+        self._ring_changed()
+
+    def _take_over_range(self, successor):
+        """
+        copies every document of the range i will own, the _my_intervals of my place in the ring, in batches
+        before joining. They are pulled from the node owning them now, which keeps its copies as replicas or
+        hands them back through fix_content_d
+        """
+        owner = successor
+        try:
+            if owner.id < self.id:
+                # joining as the largest, the ids above me are kept by the old largest. The lookup may give the
+                # smallest node instead, the old largest is its predecessor then
+                before = owner.Predecessor()
+                if before.id > owner.id:
+                    owner = before
+                predecessor = owner
+            else:
+                # a lonely owner is its own predecessor, then i take [0, self]
+                predecessor = owner.Predecessor()
+            moved = 0
+            for low, high in self._my_intervals(predecessor, owner):
+                cursor = low - 1
+                while low <= high:
+                    infos = owner.Handoff_Range(low, high, cursor, self.handoff_batch)
+                    for info in infos:
+                        info.write()  # content streamed from the owner
+                    self.database.bulk_load(infos)
+                    moved += len(infos)
+                    if len(infos) < self.handoff_batch:
+                        break
+                    cursor = infos[-1].id
+            self.logger.info(f"Took over {moved} documents from {owner}")
+        except Exception as e:
+            # not fatal, fix_content_d will move the keys one by one
+            self.logger.error(f"Err taking over range from {owner} {e}")
 
     def Find_Successor(self, id_, i_remote=None) -> "ChordNode":
 
@@ -342,6 +658,20 @@ class ChordNode(IdComparable):
         if id_ >= self.id > successor.id:  # im the largest so i will keep em
             return self
 
+        cached = self.location_cache.lookup(id_)
+        if cached is not None:
+            owner, fresh = cached
+            if fresh:
+                return owner
+            try:
+                # one call to the owner instead of a whole lookup
+                if owner.Owns(id_):
+                    self.location_cache.confirm(owner)
+                    return owner
+            except Exception as e:
+                self.logger.error(f"Cached owner {owner} failed: {e}")
+            self.location_cache.invalidate(owner)
+
         i = len(self.finger) * 2
         while True:
             try:
@@ -351,18 +681,225 @@ class ChordNode(IdComparable):
                     return self.Successor()
 
                 if self.iterative_scheme and i_remote:  # and is a remote call:
-                    n0.Ping(str(time.time_ns()))
-                    return RedirectNodeResponse(n0)
+                    # the caller can go on with the next best ones if n0 is slow or down
+                    alternatives = self._progress_candidates(id_)[1:self.lookup_alternatives + 1]
+                    return RedirectNodeResponse(n0, alternatives)
 
-                successor = n0.Find_Successor(id_)
+                if self.iterative_scheme:
+                    with tracer.span("lookup", Id=str(id_)):
+                        successor = self._lookup(id_, self._progress_candidates(id_))
+                else:
+                    successor = n0.Find_Successor(id_)
+                self._learn_finger(successor)
+                if successor != self:
+                    self.location_cache.learn(id_, successor)
                 return successor
             except Exception as e:
                 self.logger.error(f"Find_successor fail: {e}")
+                if self.finger[i] is not None:
+                    RemoteChordNode.evict(self.finger[i])
+                    self.location_cache.invalidate(self.finger[i])
+                    self._ring_changed()
                 self.finger[i] = None
 
+    def _progress_candidates(self, id_):
+        """
+        distinct fingers between me and id_, the closest to id_ first
+        """
+        candidates = []
+        for f in self.finger:
+            if f is not None and between(L=self.id, R=id_, id_=f.id) and f not in candidates:
+                candidates.append(f)
+        candidates.sort(key=lambda f: self._distance(f.id), reverse=True)
+        return candidates
+
+    def _pns_order(self, candidates, id_):
+        """
+        proximity neighbour selection, a candidate costs its rtt once plus once more
+        for every hop it is expected to be behind the closest one
+        """
+        ring_size = 2 ** len(self.finger)
+        closest = min(((id_ - c.id) % ring_size).bit_length() for c in candidates)
+
+        def cost(node):
+            behind = ((id_ - node.id) % ring_size).bit_length() - closest
+            return self.rtt.estimate(node.Address) * (1 + behind)
+
+        return sorted(candidates, key=cost)
+
+    def _lookup_query(self, node, id_):
+        start = time.monotonic()
+        res = node.lookup_step(id_)
+        self.rtt.observe(node.Address, time.monotonic() - start)
+        return res
+
+    def _hedged_step(self, candidates, id_, failed):
+        """
+        asks the first candidate and, when it takes longer than its usual rtt, the next one too.
+        the first answer wins, the candidates that failed are appended to failed. None if all failed
+        """
+        queue = list(candidates)
+        pending = {}
+
+        def launch():
+            node = queue.pop(0)
+            pending[self.lookup_pool.submit(carry(self._lookup_query), node, id_)] = node
+            return self.rtt.timeout(node.Address)
+
+        hedge_after = launch()
+        while pending:
+            hedge = queue and len(pending) < self.lookup_parallel
+            done, _ = wait(pending, timeout=hedge_after if hedge else None, return_when=FIRST_COMPLETED)
+            for future in done:
+                node = pending.pop(future)
+                try:
+                    res = future.result()
+                except Exception as e:
+                    self.logger.error(f"Lookup hop {node} failed: {e}")
+                    self.rtt.failed(node.Address)
+                    failed.append(node)
+                    continue
+                self._learn_finger(node)
+                return res
+            if queue and len(pending) < self.lookup_parallel:
+                hedge_after = launch()
+        return None
+
+    def _lookup(self, id_, candidates):
+        """
+        iterative lookup run from here, redirects are followed by this node so every hop is timed
+        and a slow or dead one does not stall the lookup
+        """
+        failed = []
+        start = time.monotonic()
+        try:
+            for hop in range(1, self.lookup_max_hops + 1):
+                candidates = [c for c in candidates if c not in failed]
+                if not candidates:
+                    # no way forward from the last hop, start again from my fingers
+                    self._forget_failed(failed)
+                    candidates = self._progress_candidates(id_)
+                    if not candidates:
+                        return self.Successor()
+                res = self._hedged_step(self._pns_order(candidates, id_), id_, failed)
+                if res is None:
+                    candidates = []
+                elif isinstance(res, RedirectNodeResponse):
+                    candidates = [RemoteChordNode.make_remote_node(a) for a in [res.Address] + res.Alternatives]
+                else:
+                    self.lookup_hops.observe(hop)
+                    self.lookup_latency.observe(time.monotonic() - start)
+                    return res
+            raise Exception(f"Lookup of {id_} did not end after {self.lookup_max_hops} hops")
+        finally:
+            self._forget_failed(failed)
+
+    def _forget_failed(self, nodes):
+        if nodes:
+            self._ring_changed()
+        for node in nodes:
+            RemoteChordNode.evict(node)
+            self.location_cache.invalidate(node)
+            for i, f in enumerate(self.finger):
+                if f == node:
+                    self.finger[i] = None
+        nodes.clear()
+
     def Ping(self, content, dstport=None, inj_addr=None):
         self.logger.debug("Pong " + content)
 
+    def Owns(self, id_):
+        """
+        cheap confirmation for cached locations, if id_ is in my range
+        """
+        predecessor = self.Predecessor()
+        successor = self.Successor()
+        if predecessor == self or successor == self:
+            return False
+        return self._is_owner(int(id_), predecessor, successor)
+
+    @untraced
+    def STATS(self):
+        return {"location_cache": self.location_cache.stats(), "rtt": self.rtt.stats(),
+                "maintenance": self.scheduler.stats(),
+                "rpc": {name: route.calls for name, route in self._rpc_server.routes.items() if route.calls},
+                "trace": {"spans": len(tracer.spans)},
+                "bloom": {"bits": self.bloom_filter.bits if self.bloom_filter else 0,
+                          "peers": {f"{a[0]}:{a[1]}": len(f) for a, (_, _, f) in list(self.peer_filters.items())}}}
+
+    @untraced
+    def METRICS(self):
+        """
+        counters and histograms of the node in the prometheus text format
+        """
+        out = MetricsText()
+        self._metrics(out)
+        return StreamResponse([out.encode()], content_type=METRICS_CONTENT_TYPE)
+
+    def _metrics(self, out: MetricsText):
+        routes = [route for route in self._rpc_server.routes.values() if route.calls]
+        out.counter("rpc_server_calls_total", "Calls served by method, rest and rpc",
+                    [({"method": r.name}, r.calls) for r in routes])
+        out.counter("rpc_server_errors_total", "Calls served that raised, by method",
+                    [({"method": r.name}, r.errors) for r in routes])
+        out.histogram("rpc_server_latency_seconds", "Time spent serving a call, by method",
+                      [({"method": r.name}, r.latency) for r in routes])
+        calls = client_latency.items()
+        out.counter("rpc_client_calls_total", "Calls made to other nodes, by method",
+                    [({"method": m}, h.count) for m, h in calls])
+        out.counter("rpc_client_errors_total", "Calls made to other nodes that failed, by method",
+                    [({"method": m}, n) for m, n in client_errors.items()])
+        out.histogram("rpc_client_latency_seconds", "Time of a call to other nodes with its redirects, by method",
+                      [({"method": m}, h) for m, h in calls])
+        out.histogram("lookup_hops", "Hops of the iterative lookups run by this node", [({}, self.lookup_hops)])
+        out.histogram("lookup_latency_seconds", "Time of the iterative lookups run by this node",
+                      [({}, self.lookup_latency)])
+        tasks = self.scheduler.task_list()
+        out.histogram("daemon_duration_seconds", "Time of each run of a maintenance task",
+                      [({"task": t.name}, t.durations) for t in tasks])
+        out.counter("daemon_errors_total", "Runs of a maintenance task that raised",
+                    [({"task": t.name}, t.errors) for t in tasks])
+        out.counter("daemon_changes_total", "Runs of a maintenance task that saw a change in the ring",
+                    [({"task": t.name}, t.changes) for t in tasks])
+        out.gauge("daemon_interval_seconds", "Current interval of a maintenance task",
+                  [({"task": t.name}, t.interval) for t in tasks])
+        out.gauge("database_documents", "Documents stored by this node", [({}, len(self.database))])
+        out.gauge("database_bytes", "Bytes of the store on disk", [({}, InfoContainer.get_store().size())])
+        out.gauge("server_connections", "Connections open to the server", [({}, self._rpc_server.connections.value)])
+        out.gauge("client_idle_connections", "Kept alive connections to other nodes waiting in a pool",
+                  [({"pool": "rpc"}, shared_pool.idle_count()),
+                   ({"pool": "lookup"}, RemoteChordNode._lookup_pool.idle_count())])
+        out.gauge("client_connections", "Connections to other nodes in use or idle, capped per node by the pool",
+                  [({"pool": "rpc"}, shared_pool.open_count()),
+                   ({"pool": "lookup"}, RemoteChordNode._lookup_pool.open_count())])
+        out.gauge("threads", "Live threads by pool", [({"pool": p}, n) for p, n in thread_counts().items()])
+
+    @untraced
+    def TRACE(self, trace_id):
+        """
+        spans of trace_id in every node it went through, following the calls each node made, by start time
+        """
+        spans = tracer.spans_of(trace_id)
+        visited = {f"{self.Address[0]}:{self.Address[1]}"}
+        pending = [span["Peer"] for span in spans if "Peer" in span]
+        while pending and len(visited) < self.trace_max_nodes:
+            peer = pending.pop(0)
+            if peer in visited:
+                continue
+            visited.add(peer)
+            host, port = peer.rsplit(":", 1)
+            try:
+                found = RemoteChordNode.make_remote_node((host, int(port))).Trace_Spans(trace_id)
+            except Exception as e:
+                self.logger.error(f"Failed getting the spans of {trace_id} from {peer} error {e}")
+                continue
+            spans.extend(found)
+            pending.extend(span["Peer"] for span in found if "Peer" in span)
+        return sorted(spans, key=lambda span: span["Start"])
+
+    def Trace_Spans(self, trace_id):
+        return tracer.spans_of(trace_id)
+
     def Notify(self, dstport, i_addr=None):
         """
         inj_addr,dstport thinks it might be our predecessor
@@ -370,12 +907,23 @@ class ChordNode(IdComparable):
         addr = i_addr[0], dstport
         n0 = RemoteChordNode.make_remote_node(addr)
         pred = self.predecessor
+        self.location_cache.node_seen(n0)
         if pred is None or between(L=pred.id, R=self.id, id_=n0.id):
             self.logger.warning(f"Notified Updpred from {pred} to {n0}")
             self.predecessor = n0
+            self._ring_changed()
 
     # ---------------------- CRUD ---------------------- #
 
+    def _is_owner(self, id_, predecessor, successor, n0=None):
+        # between(L=predecessor.id, R=self.id, id_=id_)
+        belongs_to_my_range = predecessor.id < id_ <= self.id or predecessor.id > self.id and id_ <= self.id
+        im_last_n_key_bigger_than_me = self.id > successor.id and id_ >= self.id
+        # in case of remote call # or recurse and predecessor.Owner_of(id_, self.Address[1], False)
+        is_from_predecessor_and_valid = n0 is not None and predecessor.id == n0.id and (
+                predecessor.id > self.id or id_ <= predecessor.id < self.id)
+        return im_last_n_key_bigger_than_me or belongs_to_my_range or is_from_predecessor_and_valid
+
     def Owner_Of(self, id_, dstport, recurse=True, i_addr=None):
         predecessor = self.Predecessor()
         successor = self.Successor()
@@ -384,14 +932,7 @@ class ChordNode(IdComparable):
             self.logger.error(f"Telling {n0} im broke {self.Address}")
             return "-"
 
-        # between(L=predecessor.id, R=self.id, id_=id_)
-        belongs_to_my_range =  predecessor.id < id_ <= self.id or predecessor.id > self.id and id_ <= self.id
-        im_last_n_key_bigger_than_me = self.id > successor.id and id_ >= self.id
-        # in case of remote call # or recurse and predecessor.Owner_of(id_, self.Address[1], False)
-        is_from_predecessor_and_valid = predecessor.id == n0.id and (
-                predecessor.id > self.id or id_ <= predecessor.id < self.id)
-
-        if im_last_n_key_bigger_than_me or belongs_to_my_range or is_from_predecessor_and_valid:
+        if self._is_owner(id_, predecessor, successor, n0):
             res = "y" if id_ in self.database else "m"
             self.logger.info(f"Telling {n0} that {id_} {res} is mine {self.Address} ")
             return res
@@ -400,6 +941,59 @@ class ChordNode(IdComparable):
                             f"Telling {n0} that {id_} not mine {self.Address}")
             return "n"
 
+    def Owner_Of_Many(self, ids, dstport, i_addr=None):
+        """
+        batched Owner_Of, one answer per id in the same order
+        """
+        predecessor = self.Predecessor()
+        successor = self.Successor()
+        n0 = RemoteChordNode.make_remote_node(address=(i_addr[0], dstport))
+        if predecessor == self or successor == self:
+            self.logger.error(f"Telling {n0} im broke {self.Address}")
+            return ["-"] * len(ids)
+        res = [("y" if int(id_) in self.database else "m") if self._is_owner(int(id_), predecessor, successor, n0)
+               else "n" for id_ in ids]
+        self.logger.info(f"Telling {n0} {res.count('y')} have {res.count('m')} missing {res.count('n')} not mine")
+        return res
+
+    def Bloom_Filter(self, version):
+        """
+        bloom filter of my ids as [version, bits, hashes, count, bytes], False if version is still the current one
+        """
+        current, bloom = self._own_filter()
+        if version == current:
+            return False
+        return [current, *bloom.to_wire()]
+
+    def Metadata_Many(self, ids):
+        """
+        address, id and refs of each id, "" for the ones not stored here
+        """
+        res = []
+        for id_ in ids:
+            info: InfoContainer = self.database.find_like(int(id_))
+            res.append(info.get_metadata() if info is not None else "")
+        return res
+
+    def Merkle_Hashes(self, level, indices):
+        """
+        hashes of the hash tree nodes at level, in hex to keep them small on the wire
+        """
+        return [format(h, "x") for h in self.merkle.hashes(int(level), indices)]
+
+    def Range_Ids(self, ranges):
+        """
+        ids stored in each of the inclusive ranges
+        """
+        return [[info.id for info in self.database.get_range(int(lo), int(hi))] for lo, hi in ranges]
+
+    def Handoff_Range(self, low, high, cursor, limit):
+        """
+        one batch of the documents in the inclusive [low, high] with ids above cursor, for a node joining next
+        to me that takes over the range
+        """
+        return self.database.get_range(max(int(low), int(cursor) + 1), int(high), int(limit))
+
     def Push(self, info, dstport, recurse=True, resolve=True, i_addr=None, i_remote=None):
         if resolve and self.Owner_Of(info.id, dstport, True, i_addr) == "n":
             tnode: ChordNode = self.Find_Successor(info.id)
@@ -407,19 +1001,37 @@ class ChordNode(IdComparable):
                 if self.iterative_scheme and i_remote:
                     return RedirectNodeResponse(tnode)
                 return tnode.Push(info, dstport, recurse, True)
-        self.database.append(info)
-        info.write()
+        with tracer.span("store", Id=str(info.id)):
+            # written first, the content may be streamed from another node and fail
+            info.write()
+            # a refreshed page replaces the one stored
+            self.database.append(info, replace=True)
         self.logger.warning(f"{i_addr[0], dstport} Pushed in me {self} this {info} recurse {recurse}")
         if recurse > 0:
             successor = self.Successor()
             if successor != self:
-                return successor.Push(info, self.Address[1], False, False)
+                with tracer.span("replicate", Id=str(info.id)):
+                    return successor.Push(info, self.Address[1], False, False)
+        return True
+
+    def Push_Many(self, infos, dstport, recurse=True, i_addr=None):
+        """
+        batched Push without resolving, used to repair a range in one call
+        """
+        for info in infos:
+            info.write()
+            self.database.append(info, replace=True)
+        self.logger.warning(f"{i_addr[0], dstport} Pushed in me {self} {len(infos)} infos recurse {recurse}")
+        if recurse > 0:
+            successor = self.Successor()
+            if successor != self:
+                return successor.Push_Many(infos, self.Address[1], False)
         return True
 
     def Delete(self, id_, dstport, recurse=True, resolve=True, i_addr=None, i_remote=None):
-        if id_ in self.database:
-            self.database.find_like(id_).delete()
-            self.database.remove(id_)
+        info = self.database.pop(id_)
+        if info is not None:
+            info.delete()
             self.logger.warning(f"{i_addr[0], dstport} Deleted in me {self.Address} this {id_} recurse {recurse}")
 
         if resolve and self.Owner_Of(id_, dstport, True, i_addr) == "n":
@@ -435,6 +1047,16 @@ class ChordNode(IdComparable):
                 return successor.Delete(id_, self.Address[1], False, False)
         return True
 
+    @untraced
+    def BLOB(self, id_):
+        """
+        streams the stored content of id_, side channel used between nodes to move content out of the xml
+        """
+        info: InfoContainer = self.database.find_like(int(id_))
+        if info is None:
+            raise Exception(f"{id_} not stored in {self.Address}")
+        return StreamResponse(info.read_blob(), content_type="text/html")
+
     def Pull(self, id_, dstport, resolve=True, i_addr=None, i_remote=None):  # todo add None to dstport
         value = self.database.find_like(id_)
         if resolve and value is None:
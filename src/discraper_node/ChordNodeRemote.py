@@ -1,26 +1,76 @@
+import threading
 from pathlib import Path
-from xmlrpc.client import ServerProxy
 
 from ._IdComparable import IdComparable
-from .custom_xrpc import DiSTransport
+from .custom_xrpc import ConnectionPool, DiSServerProxy, DiSTransport, make_client_context
 from .custom_logger import get_logger
 
 logger = get_logger(__name__)
 
 
-class RemoteChordNode(ServerProxy, IdComparable):
+class RemoteChordNode(DiSServerProxy, IdComparable):
+    # process wide proxies, one per peer address, all of them share the client ssl context
+    _registry: dict[tuple, "RemoteChordNode"] = {}
+    _registry_lock = threading.Lock()
+    _context = None
+    _context_loaded = False
+    # calls with a timeout have their own connections, the lookup hops and the ring maintenance
+    _lookup_pool = ConnectionPool()
+    lookup_timeout = 5
+
+    @staticmethod
+    def set_credentials(keypair_path=None, ca_path=None):
+        """
+        loads the client ssl context once, called at node start
+        """
+        with RemoteChordNode._registry_lock:
+            if keypair_path is not None and ca_path is not None:
+                RemoteChordNode._context = make_client_context(ca_path, keypair_path)
+            else:
+                RemoteChordNode._context = None
+            RemoteChordNode._context_loaded = True
+            # proxies made with the old credentials are no longer valid
+            RemoteChordNode._registry.clear()
+
     @staticmethod
     def make_remote_node(address):
-        folder = Path.cwd()
-        cryptoname = 'cert'
-        keypair_path = folder / f"{cryptoname}.crt", folder / f"{cryptoname}.key"
-        ca_path = folder / f"ca.crt"
-        if keypair_path[0].exists() and keypair_path[1].exists() and ca_path.exists():
-            n0 = RemoteChordNode(address, transport=DiSTransport(keypair=keypair_path,ca_file=ca_path))
-        else:
-            n0 = RemoteChordNode(address, transport=DiSTransport())
+        address = str(address[0]), int(address[1])
+        n0 = RemoteChordNode._registry.get(address, None)
+        if n0 is not None:
+            return n0
+        if not RemoteChordNode._context_loaded:
+            # not started by a node, look for the credentials in the cwd as before
+            folder = Path.cwd()
+            cryptoname = 'cert'
+            keypair_path = folder / f"{cryptoname}.crt", folder / f"{cryptoname}.key"
+            ca_path = folder / f"ca.crt"
+            if keypair_path[0].exists() and keypair_path[1].exists() and ca_path.exists():
+                RemoteChordNode.set_credentials(keypair_path, ca_path)
+            else:
+                RemoteChordNode.set_credentials()
+        with RemoteChordNode._registry_lock:
+            n0 = RemoteChordNode._registry.get(address, None)
+            if n0 is None:
+                n0 = RemoteChordNode(address, transport=DiSTransport(context=RemoteChordNode._context))
+                RemoteChordNode._registry[address] = n0
         return n0
 
+    @staticmethod
+    def evict(node_or_address):
+        """
+        forgets the proxy of a peer declared dead and its kept alive connections
+        """
+        address = getattr(node_or_address, "Address", None) or node_or_address
+        address = str(address[0]), int(address[1])
+        with RemoteChordNode._registry_lock:
+            n0 = RemoteChordNode._registry.pop(address, None)
+        if n0 is not None:
+            logger.debug(f"Evicted proxy {n0}")
+            transport: DiSTransport = n0("transport")
+            scheme = "https" if transport.context is not None else "http"
+            transport.pool.clear((scheme, f"{address[0]}:{address[1]}"))
+            RemoteChordNode._lookup_pool.clear((scheme, f"{address[0]}:{address[1]}"))
+
     @staticmethod
     def unmarshall(val: dict):
         addr = val.get("Address", None)
@@ -36,20 +86,49 @@ class RemoteChordNode(ServerProxy, IdComparable):
         else:
             uri = "http://" +  addr[0] + ":" + str(addr[1])
 
-        ServerProxy.__init__(self, uri, transport, encoding, verbose, allow_none, use_datetime,
+        DiSServerProxy.__init__(self, uri, transport, encoding, verbose, allow_none, use_datetime,
                              use_builtin_types,
                              headers=headers,
                              context=context)
         super(IdComparable).__init__()
-        self.Address = addr
+        self.Address = tuple(addr)
         self.id: int = IdComparable.hasher(f"{self.Address[0]}:{self.Address[1]}")  # salty :
 
+    def lookup_step(self, id_):
+        """
+        one hop of an iterative lookup, a redirect is returned to the caller instead of being followed
+        """
+        return self.bounded().Find_Successor(id_)
+
+    def bounded(self):
+        """
+        proxy to the same peer whose calls give up after lookup_timeout and do not follow redirects, for the
+        short calls that must not hang on a frozen peer
+        """
+        stepper = self.__dict__.get("_stepper", None)
+        if stepper is None:
+            transport: DiSTransport = self("transport")
+            scheme = "https" if transport.context is not None else "http"
+            stepper = DiSServerProxy(f"{scheme}://{self.Address[0]}:{self.Address[1]}",
+                                  DiSTransport(context=transport.context, follow_redirects=False,
+                                               timeout=RemoteChordNode.lookup_timeout,
+                                               pool=RemoteChordNode._lookup_pool))
+            self.__dict__["_stepper"] = stepper
+        return stepper
+
+    def fetch_blob(self, id_, bounded=False):
+        """
+        streams the blob of id_ from the peer, out of the xml channel. Bounded it gives up as the bounded() calls
+        """
+        transport: DiSTransport = (self.bounded() if bounded else self)("transport")
+        return transport.stream(f"{self.Address[0]}:{self.Address[1]}", f"/BLOB/{id_}")
+
     def __getattr__(self, item: str):
         res = self.__dict__.get(item, None)
         if res is None:
             if item.startswith("__") and item.endswith("__"):
                 raise AttributeError(f"{item}")
-            res = ServerProxy.__getattr__(self, item)
+            res = DiSServerProxy.__getattr__(self, item)
             logger.debug(f"XMLCall to {item} in {self}")
         return res
 
@@ -1,18 +1,27 @@
 from .ChordNode import ChordNode
 from .InfoContainer import InfoContainer
-from .custom_xrpc import RedirectNodeResponse
+from .custom_xrpc import ElasticExecutor, RedirectNodeResponse
+from .storage import FileStore
+from .tools.BloomFilter import RecentFilter
+from .tools.LinkExtractor import LinkExtractor, normalize_url
+from .tools.Metrics import Counters, Histogram, MetricsText
+from .tools.Tracer import carry, tracer, untraced
 
-import re
+import codecs
+import random
+import threading
+import time
+from pathlib import Path
+import urllib.error
 import urllib.request
 import urllib.parse
 import ssl
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 
 class DiSNode(ChordNode):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        # '(?:(?P<urls>https?://.+?)(?:[ "]|(?:&quot;)))|(?:href=(?:[ "]|(?:&quot;))(?P<href>.+?)(?:[ "]|(?:&quot;)))')
-        self.compiled_regex = re.compile('(?:href=(?:[ "]|(?:&quot;))(?P<href>.+?)(?:[ "]|(?:&quot;)))')
         user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/70.0.3538.77 Safari/537.36'
         # disable content encoding  to avoid decompression
         self.headers = {'Accept-Encoding': 'identity',
@@ -20,96 +29,421 @@ class DiSNode(ChordNode):
                         'Accept': 'text/html',
                         # set user agent to avoid 403s and other problems
                         'User-Agent': user_agent}
-        # filter al json
-        jsons = self.folder.cwd().glob('*.json')
-        for i in jsons:
-            info = InfoContainer.from_json(i)
-            self.logger.warning("Loaded " + str(info.Address) + " url")
+        # crawl concurrency, refs scraped at the same time by one SCRAP and downloads at the same time by the node
+        self.scrap_fanout = 8
+        # shared by every crawl, it grows past the fanout when crawls wait on nodes crawling back here
+        self.crawl_executor = ElasticExecutor(core=self.scrap_fanout, thread_name_prefix="SCRAP")
+        # pages are read, decoded and parsed for links in chunks of this size while they download
+        self.download_chunk = 64 * 1024
+        self.scrap_max_fetches = 16
+        self.fetch_semaphore = threading.BoundedSemaphore(self.scrap_max_fetches)
+        # downloads by http status, error when no response came, and their time until the page was read
+        self.fetch_status = Counters()
+        self.fetch_latency = Histogram()
+        # refs most likely stored already, by me, a neighbour's bloom filter or seen lately, are not scraped,
+        # their metadata is asked in one call per node
+        self.scrap_skip_known = True
+        self.recent_urls = RecentFilter()
+        self.crawl_stats = Counters(("scraped", "metadata", "misses"))
+        # page sizes of LIST and RINGLIST, and nodes a ring listing visits per page
+        self.list_max_limit = 1000
+        self.list_max_hops = 64
+        store = InfoContainer.get_store()
+        loaded = [InfoContainer(address, refs=refs, stored=True, validators=validators)
+                  for address, refs, validators in store.load()]
+        self.database.bulk_load(loaded)
+        self.logger.warning(f"Loaded {len(loaded)} urls")
+        if not isinstance(store, FileStore):
+            self._migrate_legacy(store, FileStore(Path.cwd()))
+
+        # stale pages i own are revalidated in the background, max ages in seconds by domain, None never refreshes
+        self.refresh_max_age = 24 * 3600
+        self.refresh_policy: dict[str, float] = {}
+        self.refresh_batch = 16
+        # a page that failed to download is retried after this, doubled on each failure up to its max age
+        self.refresh_retry = 60
+        self.refresh_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="REFRESH")
+        self.refreshing: set[int] = set()
+        self.refresh_stats = Counters(("revalidated", "not_modified", "modified", "failed"))
+        self.refresh_polling = 10
+        self._add_maintenance("RF", self.refresh_d, self.refresh_polling)
+
+    def _migrate_legacy(self, store, legacy: FileStore):
+        """
+        documents left in the legacy layout are moved to the current store, once
+        """
+        if not legacy.has_documents():
+            return
+        for address, refs, validators in list(legacy.load()):
+            info = InfoContainer(address, refs=refs, stored=True, validators=validators)
+            store.put(info.id, address, refs, legacy.read_chunks(info.id), validators)
+            legacy.delete(info.id)
+            self.logger.warning("Migrated " + str(address) + " url")
             self.database.append(info)
+        # all moved, the next start finds nothing to migrate
+        legacy.close()
+        legacy.manifest.path.unlink(missing_ok=True)
+
+    def shutdown(self):
+        super().shutdown()
+        self.refresh_pool.shutdown(wait=False)
+        self.crawl_executor.shutdown(wait=False)
+
+    @untraced
+    def STATS(self):
+        stats = super().STATS()
+        stats["refresh"] = dict(self.refresh_stats.items())
+        stats["crawl"] = dict(self.crawl_stats.items())
+        return stats
+
+    def _metrics(self, out: MetricsText):
+        super()._metrics(out)
+        out.counter("fetch_responses_total", "Page downloads by http status, error when there was no response",
+                    [({"status": status}, n) for status, n in self.fetch_status.items()])
+        out.histogram("fetch_latency_seconds", "Time of a page download until it was read",
+                      [({}, self.fetch_latency)])
+        out.counter("crawl_refs_total", "Refs of the crawls by how they were handled",
+                    [({"kind": k}, n) for k, n in self.crawl_stats.items()])
+        out.counter("refresh_total", "Revalidations of stale pages by outcome",
+                    [({"outcome": k}, n) for k, n in self.refresh_stats.items()])
 
-    def _get_url(self, url):
-        request = urllib.request.Request(url, headers=self.headers)
+    @staticmethod
+    def _validators(headers, previous=None) -> dict:
+        validators = dict(previous or {})
+        if etag := headers.get("ETag"):
+            validators["etag"] = etag
+        if last_modified := headers.get("Last-Modified"):
+            validators["last_modified"] = last_modified
+        validators["fetched"] = time.time()
+        return validators
+
+    def _get_url(self, url, validators=None):
+        """
+        downloads url, returns (content, refs, validators). With the validators of a previous download the
+        request is conditional and content is None when the page did not change
+        """
+        headers = dict(self.headers)
+        if validators and "etag" in validators:
+            headers["If-None-Match"] = validators["etag"]
+        if validators and "last_modified" in validators:
+            headers["If-Modified-Since"] = validators["last_modified"]
+        request = urllib.request.Request(url, headers=headers)
         # allow weak certificate
         context = ssl.create_default_context()
         context.check_hostname = False
         context.verify_mode = ssl.CERT_NONE
-        response = urllib.request.urlopen(request, timeout=20, context=context)  # this follows redirects
-        # only accept mime type text/html
-        if response.headers.get_content_type() == 'text/html':
-            res = response.read().decode(response.headers.get_content_charset() or 'utf-8')
-            domain = urllib.parse.urlsplit(response.geturl()).netloc
-            return domain, res
-        else:
-            self.logger.info("mime type: " + response.info().get("Content-Type"))
-            raise Exception("Got Not text/html")
-
-    def _get_links(self, domain, content):
-        matches = self.compiled_regex.findall(content)
-        urls = set()
-        # get group href
-        for url in matches:  # unpack only one as have only one group in regex
-            url: str
-            if url.startswith("#"):
-                continue
-            if not url.startswith("http"):
-                url = "http://" + domain + "/" + url.lstrip("/")
-            parsed = urllib.parse.urlsplit(url)
-            n: str = parsed.netloc
-            if n.endswith(domain):
-                urls.add(url)
-        return urls
+        start = time.monotonic()
+        status = "error"
+        with tracer.span("fetch", Url=url) as span:
+            try:
+                try:
+                    response = urllib.request.urlopen(request, timeout=20, context=context)  # this follows redirects
+                except urllib.error.HTTPError as e:
+                    status = e.code
+                    if e.code == 304 and validators:
+                        return None, None, self._validators(e.headers, validators)
+                    raise
+                status = response.status
+                return self._read_page(response)
+            finally:
+                self.fetch_status.inc(status)
+                self.fetch_latency.observe(time.monotonic() - start)
+                if span is not None:
+                    span["Status"] = status
+
+    def _read_page(self, response):
+        """
+        reads an html response decoding it and extracting its links as the chunks come
+        """
+        with response:
+            # only accept mime type text/html
+            if response.headers.get_content_type() != 'text/html':
+                self.logger.info("mime type: " + response.info().get("Content-Type"))
+                raise Exception("Got Not text/html")
+            decoder = codecs.getincrementaldecoder(response.headers.get_content_charset() or 'utf-8')()
+            # relative links resolve against the url after redirects
+            extractor = LinkExtractor(response.geturl())
+            content = []
+            while chunk := response.read(self.download_chunk):
+                text = decoder.decode(chunk)
+                extractor.feed(text)
+                content.append(text)
+            text = decoder.decode(b"", final=True)
+            extractor.feed(text)
+            extractor.close()
+            content.append(text)
+            refs = self._same_site(response.geturl(), extractor.links())
+            return "".join(content), refs, self._validators(response.headers)
+
+    @staticmethod
+    def _same_site(url, links):
+        # links to the domain of the page or its subdomains
+        domain = urllib.parse.urlsplit(normalize_url(url) or url).netloc
+        same = []
+        for link in links:
+            netloc = urllib.parse.urlsplit(link).netloc
+            if netloc == domain or netloc.endswith("." + domain):
+                same.append(link)
+        return same
+
+    def _scrap_local(self, url, id_, refresh=False):
+        """
+        gets the url from the database or downloads and stores it, None if it could not be scraped.
+        On refresh a stored url is revalidated first
+        """
+        info = self.database.find_like(id_)
+        if info:
+            self.logger.warning("Found " + str(url) + " in ring")
+            return (self._refresh_local(info) or info) if refresh else info
+        try:
+            # only the download is capped, waiting on other nodes must not hold a slot
+            with self.fetch_semaphore:
+                content, refs, validators = self._get_url(url)
+            if len(content) == 0:
+                raise Exception(f"Got Empty content in {url}")
+        except Exception as e:
+            self.logger.error("Failed scrapping url " + str(url) + f" error {e}")
+            return None
+        info = InfoContainer(url, refs=refs, content=content, validators=validators)
+        self.Push(info, dstport=self.Address[1], recurse=True, resolve=False, i_addr=self.Address)
+        return info
+
+    def _refresh_local(self, info: InfoContainer):
+        """
+        revalidates a stored page with a conditional request, a 304 only updates the fetch time, new content
+        replaces the page here and in the replica. None if it could not be downloaded, the failure is kept in
+        the validators to back off
+        """
+        self.refresh_stats.inc("revalidated")
+        try:
+            with self.fetch_semaphore:
+                content, refs, validators = self._get_url(info.Address, info.validators)
+            if content is not None and len(content) == 0:
+                raise Exception(f"Got Empty content in {info.Address}")
+        except Exception as e:
+            self.refresh_stats.inc("failed")
+            self.logger.error("Failed refreshing url " + str(info.Address) + f" error {e}")
+            info.validators["failures"] = info.validators.get("failures", 0) + 1
+            info.validators["failed"] = time.time()
+            return None
+        validators.pop("failures", None)
+        validators.pop("failed", None)
+        if content is None:
+            self.refresh_stats.inc("not_modified")
+            info.update_validators(validators)
+            return info
+        self.refresh_stats.inc("modified")
+        self.logger.warning("Refreshed " + str(info.Address))
+        new_info = InfoContainer(info.Address, refs=refs, content=content, validators=validators)
+        self.Push(new_info, dstport=self.Address[1], recurse=True, resolve=False, i_addr=self.Address)
+        return new_info
+
+    def _max_age(self, url):
+        # the most specific domain of the policy wins
+        netloc = urllib.parse.urlsplit(url).netloc
+        matches = [d for d in self.refresh_policy if netloc == d or netloc.endswith("." + d)]
+        return self.refresh_policy[max(matches, key=len)] if matches else self.refresh_max_age
+
+    def _refresh_task(self, info):
+        try:
+            self._refresh_local(info)
+        finally:
+            self.refreshing.discard(info.id)
+
+    def _refresh_due(self, info, max_age, now) -> float:
+        """
+        when the page should be revalidated, after its max age or its backoff if the last try failed
+        """
+        validators = info.validators
+        if "fetched" not in validators:
+            # stored before the validators, spread over the max age instead of all of them at once
+            validators["fetched"] = now - random.uniform(0, max_age)
+        due = validators["fetched"] + max_age
+        if failures := validators.get("failures", 0):
+            backoff = min(self.refresh_retry * 2 ** (failures - 1), max_age)
+            due = max(due, validators["failed"] + backoff)
+        return due
+
+    def refresh_d(self):
+        """
+        called periodically. queues the revalidation of the stale pages i own, the replicas get the new
+        content from my push. Never tightens the ring maintenance
+        """
+        now = time.time()
+        stale = []
+        for low, high in self._owned_intervals():
+            for info in self.database.get_range(low, high):
+                if urllib.parse.urlsplit(info.Address).scheme not in ("http", "https"):
+                    continue  # not downloaded, as the entries pushed by hand
+                max_age = self._max_age(info.Address)
+                if max_age is not None and self._refresh_due(info, max_age, now) <= now:
+                    stale.append(info)
+        stale.sort(key=lambda i: i.validators["fetched"])
+        for info in stale:
+            if len(self.refreshing) >= self.refresh_batch:
+                # behind, keep polling at the shortest interval until caught up
+                self.scheduler.tighten("RF")
+                break
+            if info.id not in self.refreshing:
+                self.refreshing.add(info.id)
+                self.refresh_pool.submit(self._refresh_task, info)
+        return False
+
+    def _scrap_ref(self, level, url, refresh=False):
+        """
+        one task of the crawl, returns the response entries and the refs to follow in the next level
+        """
+        id_ = self.hasher(url)
+        n0 = self.Find_Successor(id_)
+        if n0 != self:
+            # the owner crawls the subtree under its url
+            self.logger.warning("Redirecting SCRAP to " + str(n0))
+            try:
+                return (n0.REFRESH if refresh else n0.SCRAP)(level, url), []
+            except Exception:
+                self.location_cache.invalidate(n0)
+                raise
+        self.logger.warning("Scraping " + url + " level " + str(level))
+        info = self._scrap_local(url, id_, refresh)
+        if info is None:
+            return [], []
+        return [info.get_metadata()], info.refs if level > 1 else []
+
+    def _scrap_known(self, level, node, urls):
+        """
+        metadata of urls most likely stored in node in one call instead of a SCRAP per url, the ones it does not
+        have are scraped as usual. With no node the urls were seen lately and are asked to their owners
+        """
+        entries, next_refs = [], []
+        if node is None:
+            owners = {}
+            for url in urls:
+                owners.setdefault(self.Find_Successor(self.hasher(url)), []).append(url)
+            for owner, owned in owners.items():
+                e, n = self._scrap_known(level, owner, owned)
+                entries.extend(e)
+                next_refs.extend(n)
+            return entries, next_refs
+        ids = [self.hasher(url) for url in urls]
+        try:
+            metas = self.Metadata_Many(ids) if node == self else node.Metadata_Many(ids)
+        except Exception as e:
+            self.logger.error(f"Failed getting metadata from {node} error {e}")
+            metas = [""] * len(ids)
+        for url, meta in zip(urls, metas):
+            if meta:
+                self.crawl_stats.inc("metadata")
+                entries.append(meta)
+                if level > 1:
+                    next_refs.extend(meta["Refs"])
+            else:
+                # false positive or gone since the filter was sent
+                self.crawl_stats.inc("misses")
+                e, n = self._scrap_ref(level, url)
+                entries.extend(e)
+                next_refs.extend(n)
+        return entries, next_refs
+
+    def _split_known(self, urls):
+        """
+        groups the urls most likely stored by node, None for the ones only seen lately, and the unknown ones
+        """
+        known, unknown = {}, []
+        for url in urls:
+            id_ = self.hasher(url)
+            node = self._stored_by(id_)
+            if node is not None or id_ in self.recent_urls:
+                known.setdefault(node, []).append(url)
+            else:
+                unknown.append(url)
+        return known, unknown
+
+    def _crawl(self, level, refs, seen, refresh=False):
+        """
+        scraps refs level by level, each level runs concurrently and the entries are yielded as they finish
+        """
+        frontier = []
+        for u in refs:
+            if u not in seen:
+                seen.add(u)
+                frontier.append(u)
+        running = {}
+        try:
+            while frontier and level > 0:
+                # a refresh has to reach every page
+                known, unknown = self._split_known(frontier) if self.scrap_skip_known and not refresh \
+                    else ({}, frontier)
+                tasks = [(self._scrap_known, (level, node, urls), urls) for node, urls in known.items()]
+                tasks.extend((self._scrap_ref, (level, u, refresh), u) for u in unknown)
+                tasks.reverse()  # popped from the end in frontier order
+                self.crawl_stats.inc("scraped", len(unknown))
+                frontier = []
+                while tasks or running:
+                    # at most scrap_fanout tasks of this crawl at a time
+                    while tasks and len(running) < self.scrap_fanout:
+                        fn, args, work = tasks.pop()
+                        running[self.crawl_executor.submit(carry(fn), *args)] = work
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for f in done:
+                        work = running.pop(f)
+                        try:
+                            entries, next_refs = f.result()
+                        except Exception as e:
+                            self.logger.error(f"Failed scraping {work} error {e}")
+                            continue
+                        for entry in entries:
+                            self.recent_urls.add(int(entry["Id"]))
+                        yield from entries
+                        for u in next_refs:
+                            if u not in seen:
+                                seen.add(u)
+                                frontier.append(u)
+                level -= 1
+        finally:
+            # the consumer may stop early, the pending refs of the level are dropped
+            for f in running:
+                f.cancel()
 
     def SCRAP(self, level, url, i_remote=None):
         '''
         Scraps the url
         '''
+        return self._scrap(level, url, i_remote, False)
+
+    def REFRESH(self, level, url, i_remote=None):
+        '''
+        Scraps the url, the pages already stored are revalidated with conditional requests
+        '''
+        return self._scrap(level, url, i_remote, True)
+
+    def _scrap(self, level, url, i_remote, refresh):
+        """
+        the entries of the crawl are produced as they are scraped, except when another node owns the url
+        """
         id_ = self.hasher(url)
         n0 = self.Find_Successor(id_)
-        response = []
 
         if n0 != self:
             self.logger.warning("Redirecting SCRAP to " + str(n0))
             if self.iterative_scheme and i_remote:
                 return RedirectNodeResponse(n0)
             try:
-                res: InfoContainer = n0.SCRAP(level, url)
-                response.extend(res)
+                return (n0.REFRESH if refresh else n0.SCRAP)(level, url)
             except Exception as e:
                 self.logger.error("Failed getting url " + url + f" in {n0} error {e}")
-        else:
-            level = int(level)
-            self.logger.warning("Scraping " + url + " level " + str(level))
-            if level == 0:
+                self.location_cache.invalidate(n0)
                 return []
+        return self._scrap_here(int(level), url, id_, refresh)
 
-            info = self.database.find_like(id_)
-            if info:
-                self.logger.warning("Found " + str(url) + " in ring")
-            else:
-                try:
-                    domain, content = self._get_url(url)
-                    if len(content) == 0:
-                        raise Exception(f"Got Empty content in {url}")
-                except Exception as e:
-                    self.logger.error("Failed scrapping url " + str(url) + f" error {e}")
-                    return []
-                refs = self._get_links(domain, content)
-                info = InfoContainer(url, refs=refs, content=content)
-                self.Push(info, dstport=self.Address[1], recurse=True, resolve=False, i_addr=self.Address)
-
-            if info:
-                c = info.get_as_dict()
-                del c["Content"]
-                response.append(c)
-                if level > 1:
-                    for u in info.refs:
-                        try:
-                            v = self.SCRAP(level - 1, u)
-                        except Exception as e:
-                            self.logger.error(f"Failed scraping {u} error {e}")
-                            continue
-                        response.extend(v)
-        return response
+    def _scrap_here(self, level, url, id_, refresh):
+        self.logger.warning("Scraping " + url + " level " + str(level))
+        if level == 0:
+            return
+        info = self._scrap_local(url, id_, refresh)
+        if info:
+            yield info.get_metadata()
+            if level > 1:
+                yield from self._crawl(level - 1, info.refs, {url}, refresh)
 
     def DELETE(self, level, url_or_id, i_remote=None):
         level = int(level)
@@ -126,7 +460,8 @@ class DiSNode(ChordNode):
             try:
                 response.extend(n0.DELETE(level, id_))
             except Exception as e:
-                self.logger.error("Failed deleting url " + url_or_id + f" in {n0} error {e}")
+                self.logger.error("Failed deleting url " + str(url_or_id) + f" in {n0} error {e}")
+                self.location_cache.invalidate(n0)
         else:
             self.logger.warning("Deleting " + str(url_or_id) + " level " + str(level))
             info: InfoContainer = self.database.find_like(id_)
@@ -148,7 +483,13 @@ class DiSNode(ChordNode):
         if n0 != self:
             if self.iterative_scheme and i_remote:
                 return RedirectNodeResponse(n0)
-            info = n0.GET(url_or_id)
+            # streamed out of the xml channel
+            try:
+                return b"".join(n0.fetch_blob(id_)).decode()
+            except Exception as e:
+                self.logger.error(f"Failed getting {url_or_id} from {n0} error {e}")
+                self.location_cache.invalidate(n0)
+                return None
         else:
             info: InfoContainer = self.database.find_like(id_)
 
@@ -157,14 +498,85 @@ class DiSNode(ChordNode):
 
         return info.Content
 
-    def LIST(self):
-        response = []
-        for d in self.database:
-            c = d.get_as_dict()
-            del c["Content"]
-            response.append(c)
-        return response
+    def _list_fields(self, fields) -> tuple:
+        if not fields:
+            return "Address", "Id", "Refs"
+        fields = tuple(f.strip() for f in fields.split(","))
+        if unknown := set(fields) - set(InfoContainer.metadata_fields):
+            raise Exception(f"Unknown fields {', '.join(unknown)}, valid: {', '.join(InfoContainer.metadata_fields)}")
+        return fields
+
+    def _list_page(self, low, high, limit, fields) -> dict:
+        # one more than asked tells if there is a next page
+        infos = self.database.get_range(low, high, limit + 1)
+        items = [info.get_metadata(fields) for info in infos[:limit]]
+        return {"Items": items, "Next": str(infos[limit - 1].id) if len(infos) > limit else ""}
+
+    def LIST(self, cursor="", limit: int = 0, fields=""):
+        """
+        metadata of the documents stored here in id order, the content is never read.
+        With a limit one page of the ids after cursor as {"Items", "Next"}, Next is the cursor of the following
+        page or "" on the last one. Without a limit all of them are streamed. fields is a comma separated
+        subset of the metadata fields
+        """
+        fields = self._list_fields(fields)
+        low = int(cursor) + 1 if cursor else 0
+        if limit > 0:
+            return self._list_page(low, 2 ** len(self.finger) - 1, min(limit, self.list_max_limit), fields)
+        return self._list_all(low, fields)
+
+    def _list_all(self, low, fields):
+        # the index iterates a snapshot, nothing is held besides the record being sent
+        for info in self.database:
+            if info.id >= low:
+                yield info.get_metadata(fields)
+
+    def List_Owned(self, low, limit, fields):
+        """
+        one page of the documents i own from low up to the end of my range, the range end is returned so the
+        caller goes on with my successor. None as the end if low is not mine
+        """
+        low = int(low)
+        for lo, hi in self._owned_intervals():
+            if lo <= low <= hi:
+                page = self._list_page(low, hi, int(limit), tuple(fields))
+                page["End"] = str(hi)
+                return page
+        return {"Items": [], "Next": "", "End": ""}
+
+    def RINGLIST(self, cursor="", limit: int = 100, fields=""):
+        """
+        one page of the documents of the whole ring in id order, each node lists only the range it owns so
+        replicas are not repeated. The cursor is the last id returned, it tells the node and its position
+        """
+        fields = self._list_fields(fields)
+        limit = max(1, min(limit, self.list_max_limit))
+        max_id = 2 ** len(self.finger) - 1
+        low = int(cursor) + 1 if cursor else 0
+        items = []
+        node = self.Find_Successor(low)
+        for _ in range(self.list_max_hops):
+            page = self.List_Owned(low, limit - len(items), fields) if node == self \
+                else node.List_Owned(str(low), limit - len(items), list(fields))
+            if not page["End"]:
+                # the ring moved, ask for the owner again
+                node = self.Find_Successor(low)
+                continue
+            items.extend(page["Items"])
+            if page["Next"]:
+                return {"Items": items, "Next": page["Next"]}
+            low = int(page["End"]) + 1
+            if low > max_id:
+                break
+            node = node.Successor() if node != self else self.Successor()
+            if len(items) >= limit:
+                return {"Items": items, "Next": str(low - 1)}
+        else:
+            # out of hops, the next page goes on from here
+            return {"Items": items, "Next": str(low - 1) if low > 0 else ""}
+        return {"Items": items, "Next": ""}
 
+    @untraced
     def PEERS(self):
         peers = set()
         peers.update(map(lambda e: str(tuple(e.Address)) if e is not None else None, self.r_successors))
@@ -1,38 +1,46 @@
-import inspect
-import json
-import os
 from pathlib import Path
 
 from ._IdComparable import IdComparable
+from .ChordNodeRemote import RemoteChordNode
+from .storage import FileStore
 
 
 class InfoContainer(IdComparable):
+    # address of the node serving the blobs of this process, set at node start
+    blob_server = None
+    # storage engine of the process, set at node start, legacy files in the cwd otherwise
+    store = None
+    # fields a listing can ask for, none of them reads the content
+    metadata_fields = ("Address", "Id", "Refs", "Validators")
+
     @staticmethod
     def unmarshall(val):
         address = val.get("Address")
         content = val.get("Content")
         refs = val.get("Refs")
-        res = InfoContainer(address, content=content, refs=refs)
+        blob_source = val.get("BlobSource")
+        validators = val.get("Validators")
+        res = InfoContainer(address, content=content, refs=refs, blob_source=blob_source, validators=validators)
         return res
 
     @staticmethod
-    def from_json(descriptor) -> "InfoContainer":
-        with Path(descriptor).open() as f:
-            js = json.load(f)
-            address = js["Address"]
-            refs = js["Refs"]
-            blob_file = js["BlobFile"]
-            res = InfoContainer(address, refs=refs, blob_file=blob_file, desc=descriptor)
-            return res
-
-    def __init__(self, adrr, *, refs=None, content=None, blob_file=None, desc=None):
+    def get_store():
+        if InfoContainer.store is None:
+            InfoContainer.store = FileStore(Path.cwd())
+        return InfoContainer.store
+
+    def __init__(self, adrr, *, refs=None, content=None, stored=False, blob_source=None, validators=None):
         super(IdComparable, self).__init__()
         self.address = adrr
         self.id = IdComparable.hasher(self.address)
         self.blob_ram = content or ""  # using "" instead of None
-        self.blob_file = Path(blob_file) if blob_file else ""
-        self.descriptor_file = Path(desc) if desc else ""
+        # content is in the store of the node
+        self.stored = stored
         self.refs = list(refs) if refs else []
+        # node to stream the content from when it was not sent inline
+        self.blob_source = tuple(blob_source) if blob_source else None
+        # http cache validators of the download, etag, last_modified and fetched (epoch seconds)
+        self.validators = dict(validators) if validators else {}
 
     def __repr__(self):
         return f"{self.Address}, {self.id}"
@@ -47,28 +55,77 @@ class InfoContainer(IdComparable):
 
     @property
     def Content(self):
-        return Path(self.blob_file).read_text() if self.blob_file != "" else self.blob_ram
+        if self.stored:
+            return InfoContainer.get_store().read(self.id).decode()
+        if not self.blob_ram and self.blob_source:
+            return b"".join(RemoteChordNode.make_remote_node(self.blob_source).fetch_blob(self.id)).decode()
+        return self.blob_ram
 
     @property
     def Refs(self):
         return self.refs
 
-    def write(self):
+    @property
+    def Validators(self):
+        return self.validators
+
+    def read_blob(self, chunk_size=64 * 1024):
+        """
+        yields the raw content chunk by chunk
+        """
+        if self.stored:
+            yield from InfoContainer.get_store().read_chunks(self.id, chunk_size)
+        elif self.blob_ram:
+            yield self.blob_ram.encode()
+
+    def wire_struct(self) -> dict:
+        # only metadata goes on the wire when the content can be streamed from a node
+        struct = {"Address": self.Address, "Id": self.Id, "Refs": self.Refs}
+        if self.validators:
+            struct["Validators"] = self.validators
+        if self.stored and InfoContainer.blob_server is not None:
+            struct["BlobSource"] = InfoContainer.blob_server
+        elif not self.blob_ram and self.blob_source:
+            struct["BlobSource"] = self.blob_source
+        else:
+            struct["Content"] = self.Content
+        return struct
+
+    def encode(self, marshaller_w):
+        marshaller_w.dump_struct({type(self).__name__: self.wire_struct()}, marshaller_w.write)
+
+    def write(self, bounded=False):
+        """
+        saves the content in the store, a bounded write gives up on a source node that stops answering
+        """
+        if self.stored:
+            return
         if self.blob_ram:
-            self.blob_file = Path().cwd() / f"{self.id}.html"
-            self.blob_file.write_text(self.blob_ram)
-            self.blob_file = str(self.blob_file)
-            self.blob_ram = None
-            self.descriptor_file = Path().cwd() / f"{self.id}.json"
-            js = json.JSONEncoder()
-            js = js.encode({"Address": self.Address, "Refs": self.refs, "BlobFile": self.blob_file})
-            self.descriptor_file.write_text(js)
+            chunks = [self.blob_ram.encode()]
+        elif self.blob_source:
+            # straight from the source node to the store, never whole in memory
+            chunks = RemoteChordNode.make_remote_node(self.blob_source).fetch_blob(self.id, bounded)
+        else:
+            return
+        InfoContainer.get_store().put(self.id, self.Address, self.refs, chunks, self.validators)
+        self.stored = True
+        self.blob_ram = None
+
+    def update_validators(self, validators):
+        """
+        validators of a revalidation that kept the content, saved along the stored page
+        """
+        self.validators = dict(validators)
+        if self.stored:
+            InfoContainer.get_store().update_validators(self.id, self.Address, self.refs, self.validators)
 
     def delete(self):
-        if self.blob_file:
-            Path(self.blob_file).unlink()
-        if self.descriptor_file:
-            Path(self.descriptor_file).unlink()
+        if self.stored:
+            InfoContainer.get_store().delete(self.id)
+            self.stored = False
+
+    def get_metadata(self, fields=("Address", "Id", "Refs")) -> dict:
+        return {field: getattr(self, field) for field in fields}
 
     def get_as_dict(self) -> dict:
         filtered = dict()
@@ -0,0 +1,294 @@
+import asyncio
+import itertools
+import json
+import queue
+import socket
+import ssl
+import threading
+import types
+from concurrent.futures import Executor, Future
+from http import client
+from io import BytesIO
+from urllib import parse as urlparse
+from xmlrpc.client import gzip_encode
+from xmlrpc.server import SimpleXMLRPCDispatcher
+import zlib
+
+from .CustomXRPC import DiSRequestHandler, RedirectNodeResponse, RoutedDispatcher, StreamResponse, json_stream, \
+    make_server_context, marshaled_dispatch, redirect_url
+from ..custom_logger import get_logger
+from ..tools.Metrics import Gauge
+from ..tools.Tracer import HEADER as TRACE_HEADER, RESPONSE_HEADER as TRACE_RESPONSE_HEADER, parse_header
+
+logger = get_logger(__name__)
+
+
+class ElasticExecutor(Executor):
+    """
+    Thread pool that starts one more thread when all of them are busy instead of queueing the call. The node
+    methods wait on other nodes that may call back here, a bounded pool would deadlock once every worker waits.
+    The threads above core exit after idle_timeout without work
+    """
+
+    def __init__(self, core=8, idle_timeout=30, thread_name_prefix="XRPC"):
+        self.core = core
+        self.idle_timeout = idle_timeout
+        self.thread_name_prefix = thread_name_prefix
+        self.lock = threading.Lock()
+        self.queue = queue.SimpleQueue()
+        self.idle = 0  # waiting threads not promised to a queued call yet
+        self.threads = 0
+        self._names = itertools.count()
+        self._shutdown = False
+
+    def submit(self, fn, /, *args, **kwargs):
+        future = Future()
+        with self.lock:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            start = self.idle == 0
+            if start:
+                self.threads += 1
+            else:
+                self.idle -= 1
+            self.queue.put((future, fn, args, kwargs))
+        if start:
+            threading.Thread(name=f"{self.thread_name_prefix}_{next(self._names)}", target=self._worker,
+                             daemon=True).start()
+        return future
+
+    def _worker(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                with self.lock:
+                    # an empty queue means no call was promised to the waiting threads, i am one of the idle
+                    if self.queue.empty() and self.threads > self.core:
+                        self.idle -= 1
+                        self.threads -= 1
+                        return
+                continue
+            if item is None:
+                return
+            future, fn, args, kwargs = item
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+            del item, future
+            with self.lock:
+                self.idle += 1
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        with self.lock:
+            self._shutdown = True
+            threads = self.threads
+        for _ in range(threads):
+            self.queue.put(None)
+
+
+class AsyncXRPCServer(RoutedDispatcher, SimpleXMLRPCDispatcher):
+    """
+    Same calls as ThreadedXRPCServer served from one asyncio loop, rest GET and xmlrpc POST on the same socket.
+    Connections cost no thread while idle, the node methods are blocking so they run in an executor that
+    grows while they wait on other nodes
+    """
+    # same limits as the threaded handler
+    protocol_version = DiSRequestHandler.protocol_version
+    timeout = DiSRequestHandler.timeout
+    rpc_paths = DiSRequestHandler.rpc_paths
+    encode_threshold = DiSRequestHandler.encode_threshold
+    max_header_size = 64 * 1024
+
+    def __init__(self, addr, ca_file=None, keypair=None, logRequests=True, allow_none=False, encoding=None,
+                 use_builtin_types=False, workers=32):
+        SimpleXMLRPCDispatcher.__init__(self, allow_none, encoding, use_builtin_types)
+        self.server_address = addr
+        self.logRequests = logRequests
+        self.socket = socket.create_server(addr)
+        # grows past workers while calls wait on other nodes, shrinks back when they are idle
+        self.executor = ElasticExecutor(core=workers, thread_name_prefix="XRPC")
+        self.connections = Gauge()
+        self.loop: asyncio.AbstractEventLoop = None
+        self._server: asyncio.Server = None
+
+        if keypair is not None and len(keypair) == 2 and ca_file is not None:
+            self.context = make_server_context(ca_file, keypair)
+            logger.info(f"Starting a secure async XRPC server on {addr}")
+        else:
+            logger.info(f"Starting an insecure async XRPC server on {addr}")
+            self.context = None
+
+    def serve_forever(self):
+        asyncio.run(self._serve())
+
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(self._handle, sock=self.socket, ssl=self.context,
+                                                  limit=self.max_header_size)
+        async with self._server:
+            try:
+                await self._server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+
+    def server_close(self):
+        if self.loop is not None and self._server is not None:
+            self.loop.call_soon_threadsafe(self._server.close)
+        else:
+            self.socket.close()
+        self.executor.shutdown(wait=False)
+
+    # ---------------------- HTTP ---------------------- #
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        client_address = writer.get_extra_info("peername")[:2]
+        self.connections.inc()
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.timeout)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    return
+                request_line, _, raw_headers = head.partition(b"\r\n")
+                try:
+                    command, path, version = request_line.decode("iso-8859-1").split()
+                except ValueError:
+                    await self._send(writer, 400, b"Bad Request", close=True)
+                    return
+                headers = client.parse_headers(BytesIO(raw_headers))
+                connection = headers.get("Connection", "").lower()
+                keep_alive = version == "HTTP/1.1" and connection != "close" or connection == "keep-alive"
+                if command == "GET":
+                    keep_alive = await self._do_get(writer, path, headers, client_address, version) and keep_alive
+                elif command == "POST":
+                    length = int(headers.get("Content-length", 0))
+                    body = await asyncio.wait_for(reader.readexactly(length), self.timeout)
+                    keep_alive = await self._do_post(writer, path, headers, body, client_address) and keep_alive
+                else:
+                    await self._send(writer, 501, b"Unsupported method", close=True)
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError, ssl.SSLError) as e:
+            logger.debug(f"Connection with {client_address} dropped {e}")
+        finally:
+            self.connections.dec()
+            writer.close()
+
+    async def _send(self, writer, status, body=b"", content_type="text/plain", headers=(), close=False):
+        lines = [f"{self.protocol_version} {status} {client.responses.get(status, '')}",
+                 f"Content-type: {content_type}", f"Content-length: {len(body)}"]
+        lines += [f"{k}: {v}" for k, v in headers]
+        if close:
+            lines.append("Connection: close")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("iso-8859-1") + body)
+        await writer.drain()
+
+    def _run(self, fn, *args):
+        return self.loop.run_in_executor(self.executor, fn, *args)
+
+    async def _do_get(self, writer, path, headers, client_address, version="HTTP/1.1"):
+        # clean url + rest
+        url = urlparse.urlsplit(path)
+        method = url.path.lstrip("/").split("/")[0]
+        route = self.routes.get(method, None)
+        if route is None or not route.get:
+            logger.error('method "' + method + f'" is not supported on GET by {client_address}')
+            await self._send(writer, 404, b"No such page")
+            return True
+        logger.debug(f"Clean Rest Called {method} by {client_address}")
+        trace = route.rest_trace(headers.get(TRACE_HEADER))
+        extra = [(TRACE_RESPONSE_HEADER, parse_header(trace)[0])] if trace is not None else []
+        try:
+            result = await self._run(route.call_rest, url.path, trace)
+        except Exception as e:
+            await self._send(writer, 500, f'Internal Server Error {e}'.encode("utf-8"))
+            return True
+
+        if isinstance(result, RedirectNodeResponse):
+            new_url = redirect_url(result, self.context is not None, path)
+            await self._send(writer, 301, headers=[("Location", new_url)] + extra)
+            return True
+        if isinstance(result, types.GeneratorType):
+            result = json_stream(result, headers.get("Accept", ""))
+        if isinstance(result, StreamResponse):
+            return await self._send_stream(writer, result, headers, extra, chunked=version != "HTTP/1.0")
+        try:
+            encoded_result = json.JSONEncoder().encode(result).encode("utf-8")
+        except Exception as e:
+            await self._send(writer, 500, f'Internal Server Error {e}'.encode("utf-8"))
+            return True
+        await self._send(writer, 200, encoded_result, "application/json", extra)
+        return True
+
+    async def _send_stream(self, writer, result: StreamResponse, headers, extra=(), chunked=True):
+        # chunked transfer, deflate compressed if the client accepts it. Http/1.0 clients know no chunks,
+        # the end of the body is the end of the connection for them
+        deflate = result.compress and "deflate" in headers.get("Accept-Encoding", "")
+        compressor = zlib.compressobj() if deflate else None
+        lines = [f"{self.protocol_version} 200 OK", f"Content-type: {result.content_type}",
+                 "Transfer-Encoding: chunked" if chunked else "Connection: close"]
+        lines += [f"{k}: {v}" for k, v in extra]
+        if deflate:
+            lines.append("Content-Encoding: deflate")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("iso-8859-1"))
+
+        def write(data):
+            if data:  # an empty chunk would end the body
+                writer.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n" if chunked else data)
+
+        chunks = iter(result.chunks)
+        try:
+            # the chunks may come from disk or from another node, they are produced in the executor
+            while (chunk := await self._run(next, chunks, None)) is not None:
+                write(compressor.compress(chunk) if compressor else chunk)
+                await writer.drain()
+            if compressor:
+                write(compressor.flush())
+        except Exception as e:
+            # status is already sent, leaving the body unterminated tells the client it failed
+            logger.error(f"Stream failed {e}")
+            return False
+        if not chunked:
+            await writer.drain()
+            return False
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        return True
+
+    async def _do_post(self, writer, path, headers, body, client_address):
+        if self.rpc_paths and urlparse.urlsplit(path).path not in self.rpc_paths:
+            await self._send(writer, 404, b"No such page")
+            return True
+        if self.context is not None:
+            # force clients to authenticate this is incompatible with browsers
+            cert = writer.get_extra_info("peercert")
+            if cert is None or cert == {}:
+                logger.error(f"Client {client_address} did not used a certificate on POST")
+                await self._send(writer, 403, b"Not Authenticated")
+                return True
+
+        def dispatch(method, params):
+            route = self.routes.get(method, None)
+            if route is None or not route.post:
+                logger.error('method "' + method + f'" is not supported on POST by {client_address}')
+                raise Exception(f'method "{method}" is not supported')
+            logger.debug(f"XMLCalled {method} by {client_address}")
+            return route.call(tuple(params), client_address, "POST", headers.get(TRACE_HEADER))
+
+        try:
+            response, content_type = await self._run(marshaled_dispatch, self, body, dispatch,
+                                                     headers.get("Content-Type", ""), headers.get("Accept", ""))
+        except Exception as e:
+            logger.error(f"XMLRequest from {client_address} failed {e}")
+            await self._send(writer, 500)
+            return True
+        extra = []
+        if content_type == "text/xml" and len(response) > self.encode_threshold and \
+                "gzip" in headers.get("Accept-Encoding", ""):
+            response = gzip_encode(response)
+            extra.append(("Content-Encoding", "gzip"))
+        await self._send(writer, 200, response, content_type, extra)
+        return True
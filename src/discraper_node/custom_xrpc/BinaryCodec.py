@@ -0,0 +1,216 @@
+import inspect
+import struct
+from xmlrpc.client import Binary, Fault
+
+# Compact alternative to the xml bodies, negotiated per connection by content type.
+# message: MAGIC, kind (C call, R response, E fault), then values
+# value: one tag byte followed by its payload, lengths and ints are LEB128 varints
+MAGIC = b"DB1"
+CONTENT_TYPE = "application/x-dis-binary"
+
+_NONE, _TRUE, _FALSE = b"N"[0], b"T"[0], b"F"[0]
+_INT, _FLOAT, _STR, _BYTES = b"i"[0], b"f"[0], b"s"[0], b"b"[0]
+_LIST, _DICT, _NODE, _OBJECT = b"l"[0], b"d"[0], b"A"[0], b"O"[0]
+
+_double = struct.Struct(">d")
+_field_names: dict[type, list[str]] = {}
+
+
+def _fields(value) -> dict:
+    """
+    same attributes the xml marshaller sends, the capitalized ones, or the struct the type asks for
+    """
+    if hasattr(type(value), "wire_struct"):
+        return value.wire_struct()
+    names = _field_names.get(type(value), None)
+    if names is None:
+        names = [name for name, _ in inspect.getmembers(value, lambda x: not inspect.ismethod(x) and not inspect.isclass(x))
+                 if name[0].isupper()]
+        _field_names[type(value)] = names
+    return {name: getattr(value, name) for name in names}
+
+
+class _Encoder:
+    def __init__(self):
+        self.out = bytearray()
+
+    def varint(self, n):
+        out = self.out
+        while n > 0x7f:
+            out.append(0x80 | (n & 0x7f))
+            n >>= 7
+        out.append(n)
+
+    def text(self, s: str):
+        data = s.encode("utf-8")
+        self.varint(len(data))
+        self.out += data
+
+    def value(self, v):
+        t = type(v)
+        if t is str:
+            self.out.append(_STR)
+            self.text(v)
+        elif t is int:
+            self.out.append(_INT)
+            # zigzag, any size, the ids are just ints here
+            self.varint(v << 1 if v >= 0 else (-v << 1) - 1)
+        elif t is list or t is tuple:
+            self.out.append(_LIST)
+            self.varint(len(v))
+            for item in v:
+                self.value(item)
+        elif t is dict:
+            self.out.append(_DICT)
+            self.mapping(v)
+        elif v is None:
+            self.out.append(_NONE)
+        elif t is bool:
+            self.out.append(_TRUE if v else _FALSE)
+        elif t is float:
+            self.out.append(_FLOAT)
+            self.out += _double.pack(v)
+        elif t is bytes or t is bytearray or t is Binary:
+            data = v.data if t is Binary else v
+            self.out.append(_BYTES)
+            self.varint(len(data))
+            self.out += data
+        else:
+            fields = _fields(v)
+            address = fields.get("Address", None)
+            if len(fields) == 1 and isinstance(address, (list, tuple)) and len(address) == 2:
+                # nodes only carry their address
+                self.out.append(_NODE)
+                self.text(type(v).__name__)
+                self.text(str(address[0]))
+                self.varint(int(address[1]))
+            else:
+                self.out.append(_OBJECT)
+                self.text(type(v).__name__)
+                self.mapping(fields)
+
+    def mapping(self, d: dict):
+        self.varint(len(d))
+        for k, item in d.items():
+            self.text(str(k))
+            self.value(item)
+
+
+class _Decoder:
+    def __init__(self, data, hook):
+        self.data = memoryview(data)
+        self.pos = 0
+        self.hook = hook
+
+    def varint(self):
+        data, pos = self.data, self.pos
+        shift = result = 0
+        while True:
+            b = data[pos]
+            pos += 1
+            result |= (b & 0x7f) << shift
+            if b < 0x80:
+                break
+            shift += 7
+        self.pos = pos
+        return result
+
+    def raw(self):
+        n = self.varint()
+        start = self.pos
+        self.pos += n
+        if self.pos > len(self.data):
+            raise ValueError("Truncated binary message")
+        return self.data[start:self.pos]
+
+    def text(self):
+        return str(self.raw(), "utf-8")
+
+    def value(self):
+        tag = self.data[self.pos]
+        self.pos += 1
+        if tag == _STR:
+            return self.text()
+        if tag == _INT:
+            z = self.varint()
+            return z >> 1 if not z & 1 else -((z + 1) >> 1)
+        if tag == _LIST:
+            return [self.value() for _ in range(self.varint())]
+        if tag == _DICT:
+            return self.mapping()
+        if tag == _NODE:
+            name = self.text()
+            address = [self.text(), self.varint()]
+            return self.hook(name, {"Address": address})
+        if tag == _OBJECT:
+            name = self.text()
+            return self.hook(name, self.mapping())
+        if tag == _NONE:
+            return None
+        if tag == _TRUE:
+            return True
+        if tag == _FALSE:
+            return False
+        if tag == _FLOAT:
+            self.pos += 8
+            return _double.unpack_from(self.data, self.pos - 8)[0]
+        if tag == _BYTES:
+            return bytes(self.raw())
+        raise ValueError(f"Unknown binary tag {tag}")
+
+    def mapping(self):
+        return {self.text(): self.value() for _ in range(self.varint())}
+
+
+def _as_struct(name, fields):
+    return {name: fields}
+
+
+def is_binary(data) -> bool:
+    return data[:len(MAGIC)] == MAGIC
+
+
+def dumps(params, methodname=None, methodresponse=False) -> bytes:
+    """
+    binary counterpart of xmlrpc.client.dumps, params is a tuple or a Fault
+    """
+    encoder = _Encoder()
+    encoder.out += MAGIC
+    if isinstance(params, Fault):
+        encoder.out += b"E"
+        encoder.value(params.faultCode)
+        encoder.value(params.faultString)
+    elif methodresponse or methodname is None:
+        encoder.out += b"R"
+        encoder.value(params[0])
+    else:
+        encoder.out += b"C"
+        encoder.text(methodname)
+        encoder.value(list(params))
+    return bytes(encoder.out)
+
+
+def loads(data, hook=_as_struct):
+    """
+    binary counterpart of xmlrpc.client.loads, returns (params, methodname) and raises faults.
+    hook(type name, fields) builds the objects, by default they are left as {name: fields} like the xml structs
+    """
+    if not is_binary(data):
+        raise ValueError("Not a binary message")
+    decoder = _Decoder(data, hook)
+    decoder.pos = len(MAGIC) + 1
+    kind = data[len(MAGIC):len(MAGIC) + 1]
+    try:
+        if kind == b"C":
+            methodname = decoder.text()
+            return tuple(decoder.value()), methodname
+        if kind == b"R":
+            return (decoder.value(),), None
+        if kind == b"E":
+            fault = Fault(decoder.value(), decoder.value())
+        else:
+            raise ValueError(f"Unknown binary message kind {kind}")
+    except (IndexError, struct.error):
+        # read past the end
+        raise ValueError("Truncated binary message") from None
+    raise fault
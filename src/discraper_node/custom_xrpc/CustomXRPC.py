@@ -1,13 +1,22 @@
+import contextvars
 import json
+import threading
+import time
+import types
+import zlib
 from http import client
 import inspect
 import xmlrpc
 import ssl
 from urllib import parse as urlparse
 from socketserver import ThreadingMixIn
-from xmlrpc.client import Transport, Marshaller, Unmarshaller, ServerProxy
-from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+from xmlrpc.client import Transport, Marshaller, Unmarshaller, ServerProxy, Fault
+from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler, SimpleXMLRPCDispatcher
+from . import BinaryCodec
 from ..custom_logger import get_logger
+from ..tools.Metrics import Counters, Gauge, Histogram, HistogramFamily
+from ..tools.Tracer import HEADER as TRACE_HEADER, RESPONSE_HEADER as TRACE_RESPONSE_HEADER, Tracer, parse_header, \
+    tracer
 
 ServerProxy = ServerProxy  # to avoid removal
 
@@ -24,23 +33,255 @@ except ImportError:
 
 
 class RedirectNodeResponse:
-    def __init__(self, node):
+    def __init__(self, node, alternatives=()):
         self.Address = getattr(node, "Address", None) or node
+        # other nodes that also get closer, asked if the first one does not answer
+        self.Alternatives = [getattr(n, "Address", None) or n for n in alternatives]
+
+
+class StreamResponse:
+    """
+    Wraps an iterable of bytes to be sent as it is produced on a GET instead of json encoded
+    """
+
+    def __init__(self, chunks, content_type="application/octet-stream", compress=True):
+        self.chunks = chunks
+        self.content_type = content_type
+        self.compress = compress
+
+
+NDJSON = "application/x-ndjson"
+
+
+def json_stream(records, accept) -> StreamResponse:
+    """
+    a generator result sent as it is produced, one json record per line if the client accepts ndjson,
+    otherwise a json array written piece by piece. Not compressed, deflate would hold the records back
+    """
+    encoder = json.JSONEncoder()
+    if NDJSON in accept:
+        return StreamResponse((encoder.encode(r).encode("utf-8") + b"\n" for r in records), NDJSON, compress=False)
+
+    def array():
+        separator = b"["
+        for r in records:
+            yield separator + encoder.encode(r).encode("utf-8")
+            separator = b","
+        yield b"]" if separator == b"," else b"[]"
+
+    return StreamResponse(array(), "application/json", compress=False)
+
+
+def is_valid_post_method(method: str):
+    return len(method) >= 3 and method[0].isupper()
+
+
+def is_valid_get_method(method: str):
+    return len(method) >= 3 and all(map(str.isupper, method))
+
+
+def _parse_bool(value: str):
+    return value.lower() in ("1", "true", "yes")
+
+
+# rest params come as strings, the annotated ones are converted
+_coercers = {int: int, float: float, bool: _parse_bool}
+
+
+class Route:
+    """
+    everything a request needs to call an exported method, resolved once when the instance is registered
+    """
+    __slots__ = ("name", "func", "get", "post", "inject_addr", "inject_remote", "max_params", "rest_arity",
+                 "coercers", "traced", "lock", "calls", "errors", "latency")
+
+    def __init__(self, name, func):
+        meth_params = inspect.signature(func).parameters
+        self.name = name
+        self.func = func
+        self.get = is_valid_get_method(name)
+        self.post = is_valid_post_method(name)
+        self.inject_addr = "i_addr" in meth_params
+        self.inject_remote = "i_remote" in meth_params
+        self.max_params = len(meth_params)
+        # the last rest param takes the rest of the path, i_remote is never in the url. Self is not counted
+        self.rest_arity = len(meth_params) - (1 if self.inject_remote else 0)
+        coercers = [_coercers.get(p.annotation, None) for p in meth_params.values()][:self.rest_arity]
+        self.coercers = coercers if any(coercers) else None
+        # rest calls without a trace start one unless the method is marked untraced
+        self.traced = not getattr(func, "untraced", False)
+        # served calls, rest and rpc, the ones that raised and how long they took
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.latency = Histogram()
+
+    def rest_params(self, url_path) -> tuple:
+        """
+        params of a clean rest call /METHOD/p1/p2
+        """
+        if self.rest_arity == 0:
+            return ()
+        params = url_path.lstrip("/").split("/", self.rest_arity)[1:]
+        if self.coercers is not None:
+            params = [c(p) if c is not None else p for c, p in zip(self.coercers, params)]
+        return tuple(params)
+
+    def inject(self, params: tuple, client_address, command) -> tuple:
+        """
+        appends the caller address and the kind of call to the methods asking for them
+        """
+        if self.inject_addr:
+            params = params + (client_address,)
+        if self.inject_remote:
+            params = params + (1 if command == "POST" else 2,)
+        if len(params) > self.max_params:
+            raise Exception("Invalid call to Injected method")
+        return params
+
+    def rest_trace(self, header):
+        """
+        the trace header a rest call runs in, the one of the caller or a new trace
+        """
+        if header and parse_header(header) is not None:
+            return header
+        return Tracer.new_header() if self.traced else None
+
+    def invoke(self, params: tuple, collect=True, trace=None):
+        """
+        calls the method counting and timing it, a generator is timed until it is exhausted and is
+        collected unless collect is False. With a trace header the call is a span of that trace
+        """
+        start = time.perf_counter()
+        context = span = None
+        if trace is not None:
+            context = contextvars.copy_context()
+            span = context.run(tracer.start, self.name, trace, Kind="server")
+        try:
+            result = self.func(*params) if context is None else context.run(self.func, *params)
+        except BaseException as e:
+            self._done(start, e, span)
+            raise
+        if isinstance(result, types.GeneratorType):
+            result = self._timed(result, start, context, span)
+            return list(result) if collect else result
+        self._done(start, None, span)
+        return result
+
+    def _timed(self, records, start, context, span):
+        error = None
+        try:
+            if context is None:
+                yield from records
+            else:
+                # every step runs in the trace of the call, whatever thread asks for it
+                while (record := context.run(next, records, _END)) is not _END:
+                    yield record
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            if context is not None:
+                context.run(records.close)
+            self._done(start, error, span)
+
+    def _done(self, start, error, span):
+        with self.lock:
+            self.calls += 1
+            self.errors += error is not None
+        self.latency.observe(time.perf_counter() - start)
+        tracer.finish(span, error)
+
+    def call(self, params: tuple, client_address, command, trace=None):
+        """
+        a POST call, the results of generators are collected since a rpc response is one value
+        """
+        return self.invoke(self.inject(params, client_address, command), trace=trace)
+
+    def call_rest(self, url_path, trace=None):
+        """
+        a clean rest GET call
+        """
+        return self.invoke(self.rest_params(url_path), collect=False, trace=trace)
+
+
+_END = object()
+
+
+def build_routes(instance) -> dict[str, Route]:
+    routes = {}
+    for name in dir(type(instance)):
+        if name.startswith("_") or not (is_valid_get_method(name) or is_valid_post_method(name)):
+            continue
+        if not callable(getattr(type(instance), name, None)):
+            continue
+        routes[name] = Route(name, getattr(instance, name))
+    return routes
+
+
+class RoutedDispatcher:
+    """
+    dispatcher mixin, the registered instance is reached through a table instead of resolving the name every call
+    """
+    routes: dict[str, Route] = {}
+
+    def register_instance(self, instance, allow_dotted_names=False):
+        super().register_instance(instance, allow_dotted_names)
+        self.routes = build_routes(instance)
+
+    def _dispatch(self, method, params):
+        route = self.routes.get(method, None)
+        if route is None:
+            return super()._dispatch(method, params)
+        return route.invoke(params)
+
+
+def redirect_url(result: RedirectNodeResponse, secure, path):
+    host = f"{result.Address[0]}:{result.Address[1]}"
+    proto = "https://" if secure else "http://"
+    return proto + host + path
+
+
+def make_server_context(ca_file, keypair):
+    """
+    tls server context asking for a client certificate signed by the ca, required later on POST
+    """
+    context: ssl.SSLContext = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.maximum_version = ssl.TLSVersion.TLSv1_2
+    context.check_hostname = False
+    context.verify_flags = ssl.VerifyFlags.VERIFY_DEFAULT  # no crl check
+    # context.verify_flags = ssl.VerifyFlags.VERIFY_CRL_CHECK_CHAIN  # crl check
+    context.verify_mode = ssl.VerifyMode.CERT_OPTIONAL
+    context.load_verify_locations(cafile=ca_file)
+    context.load_cert_chain(certfile=keypair[0], keyfile=keypair[1])
+    return context
 
 
 class DiSRequestHandler(SimpleXMLRPCRequestHandler):
+    # HTTP/1.1 keeps the connection open between requests, every response must carry a Content-length
+    protocol_version = "HTTP/1.1"
+    # idle keep-alive connections are dropped after this, must be bigger than the client pool idle timeout
+    timeout = 15
+    # headers and body are written separately, avoid the nagle + delayed ack stall on kept alive connections
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.connections.inc()
+
+    def finish(self):
+        try:
+            super().finish()
+        finally:
+            self.server.connections.dec()
 
-    def _is_valid_post_method(self, method: str):
-        if len(method) < 3 or not method[0].isupper():
-            logger.error('method "' + method + f'" is not supported on POST by {self.client_address}')
-            return False
-        return True
-
-    def _is_valid_get_method(self, method: str):
-        if len(method) < 3 or not all(map(str.isupper, method)):
-            logger.error('method "' + method + f'" is not supported on GET {self.client_address}')
-            return False
-        return True
+    def _route(self, method: str, command) -> Route:
+        route: Route = self.server.routes.get(method, None)
+        if route is None or not (route.post if command == "POST" else route.get):
+            logger.error('method "' + method + f'" is not supported on {command} by {self.client_address}')
+            return None
+        return route
 
     def _report_403(self):
         # Report a 404 error
@@ -53,11 +294,52 @@ class DiSRequestHandler(SimpleXMLRPCRequestHandler):
 
     def _report_500(self, e):
         self.send_response(500)
-        response = f'Internal Server Error {e}'
+        response = f'Internal Server Error {e}'.encode("utf-8")
         self.send_header("Content-type", "text/plain")
         self.send_header("Content-length", str(len(response)))
         self.end_headers()
-        self.wfile.write(response.encode("utf-8"))
+        self.wfile.write(response)
+
+    def _write_chunk(self, chunk: bytes, chunked: bool):
+        if not chunk:
+            return  # an empty chunk would end the body
+        if chunked:
+            self.wfile.write(f"{len(chunk):X}\r\n".encode("ascii") + chunk + b"\r\n")
+        else:
+            self.wfile.write(chunk)
+
+    def _send_trace(self, trace):
+        if trace is not None:
+            self.send_header(TRACE_RESPONSE_HEADER, parse_header(trace)[0])
+
+    def _send_stream(self, result: StreamResponse, trace=None):
+        # chunked transfer, deflate compressed if the client accepts it
+        deflate = result.compress and "deflate" in self.headers.get("Accept-Encoding", "")
+        compressor = zlib.compressobj() if deflate else None
+        chunked = self.request_version != "HTTP/1.0"
+        self.send_response(200)
+        self.send_header("Content-type", result.content_type)
+        self._send_trace(trace)
+        if deflate:
+            self.send_header("Content-Encoding", "deflate")
+        if chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+        else:
+            # without chunks the end of the body is the end of the connection
+            self.close_connection = True
+        self.end_headers()
+        try:
+            for chunk in result.chunks:
+                self._write_chunk(compressor.compress(chunk) if compressor else chunk, chunked)
+            if compressor:
+                self._write_chunk(compressor.flush(), chunked)
+        except Exception as e:
+            # status is already sent, leaving the body unterminated tells the client it failed
+            logger.error(f"Stream to {self.client_address} failed {e}")
+            self.close_connection = True
+            return
+        if chunked:
+            self.wfile.write(b"0\r\n\r\n")
 
     def do_GET(self):
         # clean url + rest
@@ -70,48 +352,45 @@ class DiSRequestHandler(SimpleXMLRPCRequestHandler):
             return self.report_404()
         method = path[0]
 
-        if not self._is_valid_get_method(method):
+        route = self._route(method, "GET")
+        if route is None:
             self.report_404()
             return
 
-        meth = getattr(self.server.instance, method)
-        meth_params = inspect.signature(meth).parameters
-        param_count = len(meth_params) - (1 if "i_remote" in meth_params else 0)  # Self is not counted
-        # qs = urlparse.parse_qs(url.query)
-        if param_count > 0 and len(path) > 1:
-            p = url.path.lstrip("/")
-            path = p.split("/", param_count)  # +1 because of method
-            params = tuple(path[1:])
-        else:
-            params = tuple()
         logger.debug(f"Clean Rest Called {method} by {self.client_address}")
 
+        trace = route.rest_trace(self.headers.get(TRACE_HEADER))
         try:
-            result = self.server._dispatch(method, params)
+            result = route.call_rest(url.path, trace)
         except Exception as e:
             self._report_500(e)
             return
 
         if isinstance(result, RedirectNodeResponse):
-            host = f"{result.Address[0]}:{result.Address[1]}"
-            # new_url = urlparse.urlparse(self.request)
-            # new_url._replace(netloc=host)
-            proto = "https://" if isinstance(self.server.socket, ssl.SSLSocket) else "http://"
-            new_url = proto + host + self.path
+            new_url = redirect_url(result, isinstance(self.server.socket, ssl.SSLSocket), self.path)
             self.send_response(301)
             self.send_header("Location", new_url)
+            self._send_trace(trace)
+            self.send_header("Content-length", "0")
             self.end_headers()
             return
-        self.send_response(200)
-        # set content to json
-        self.send_header("Content-type", "application/json")
+        if isinstance(result, types.GeneratorType):
+            result = json_stream(result, self.headers.get("Accept", ""))
+        if isinstance(result, StreamResponse):
+            self._send_stream(result, trace)
+            return
         try:
-            encoded_result = json.JSONEncoder().encode(result)
+            encoded_result = json.JSONEncoder().encode(result).encode("utf-8")
         except Exception as e:
             self._report_500(e)
             return
+        self.send_response(200)
+        # set content to json
+        self.send_header("Content-type", "application/json")
+        self._send_trace(trace)
+        self.send_header("Content-length", str(len(encoded_result)))
         self.end_headers()
-        self.wfile.write(encoded_result.encode("utf-8"))
+        self.wfile.write(encoded_result)
 
     def do_POST(self) -> None:
         # self.send_header("Connection", "close")  # this will close the connection here and report client to do same
@@ -124,44 +403,202 @@ class DiSRequestHandler(SimpleXMLRPCRequestHandler):
                 logger.error(f"Client {self.client_address} did not used a certificate on POST")
                 return
         logger.debug(f"XMLRequest from {self.client_address} and cert {cert}")
-        super().do_POST()
+        content_type = self.headers.get("Content-Type", "")
+        accept = self.headers.get("Accept", "")
+        if content_type != BinaryCodec.CONTENT_TYPE and BinaryCodec.CONTENT_TYPE not in accept:
+            super().do_POST()
+            return
+        if not self.is_rpc_path_valid():
+            self.report_404()
+            return
+        data = self.rfile.read(int(self.headers["Content-length"]))
+        response, content_type = marshaled_dispatch(self.server, data, self._dispatch, content_type, accept)
+        self.send_response(200)
+        self.send_header("Content-type", content_type)
+        self.send_header("Content-length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
 
     def _dispatch(self, method: str, params: tuple):
 
-        if not self._is_valid_post_method(method):
-            return self.report_404()
+        route = self._route(method, "POST")
+        if route is None:
+            # a 404 here would be written before the xml response and break the kept alive connection
+            raise Exception(f'method "{method}" is not supported')
 
         logger.debug(f"XMLCalled {method} by {self.client_address}")
-        meth = getattr(self.server.instance, method)
-        meth_params = inspect.signature(meth).parameters
-        if meth_params.get("i_addr", None):
-            params = tuple(list(params) + [self.client_address])
-        if meth_params.get("i_remote", None):
-            params = tuple(list(params) + [1 if self.command == "POST" else 2])
-        if len(params) > len(meth_params):
-            raise Exception("Invalid call to Injected method")
-        result = self.server._dispatch(method, params)
-        return result
+        return route.call(tuple(params), self.client_address, self.command, self.headers.get(TRACE_HEADER))
+
+
+class ConnectionPool:
+    """
+    Keeps idle keep-alive connections per peer so calls to the same node skip the tcp and tls handshakes.
+    A connection counts against max_per_host from acquire until it is released or discarded, a call over the
+    cap waits for one to be given back
+    """
+
+    def __init__(self, max_per_host=16, max_idle_per_host=4, idle_timeout=10, wait_timeout=30):
+        self.max_per_host = max_per_host
+        self.max_idle_per_host = max_idle_per_host
+        self.idle_timeout = idle_timeout
+        self.wait_timeout = wait_timeout
+        self.lock = threading.Lock()
+        self.freed = threading.Condition(self.lock)
+        self._idle: dict[tuple, list[tuple[client.HTTPConnection, float]]] = {}
+        self._open: dict[tuple, int] = {}  # idle and checked out connections by peer
+
+    def _closed(self, key, n=1):
+        # caller holds the lock
+        left = self._open.get(key, 0) - n
+        if left > 0:
+            self._open[key] = left
+        else:
+            self._open.pop(key, None)
+        self.freed.notify_all()
+
+    def acquire(self, key, timeout=None):
+        """
+        returns an idle connection for key, or None when the caller has a slot to open a new one. Waits up to
+        timeout (wait_timeout by default) for a slot when max_per_host connections are out
+        """
+        deadline = time.monotonic() + (timeout or self.wait_timeout)
+        stale = []
+        conn = None
+        with self.lock:
+            while True:
+                now = time.monotonic()
+                conns = self._idle.get(key, [])
+                while conns:
+                    c, last_used = conns.pop()
+                    if now - last_used < self.idle_timeout:
+                        conn = c
+                        break
+                    stale.append(c)
+                    self._closed(key)
+                if conn is not None or self._open.get(key, 0) < self.max_per_host:
+                    break
+                if now >= deadline or not self.freed.wait(deadline - now):
+                    conn = TimeoutError(f"{self.max_per_host} connections to {key[1]} in use")
+                    break
+            if conn is None:
+                self._open[key] = self._open.get(key, 0) + 1
+        for c in stale:
+            c.close()
+        if isinstance(conn, TimeoutError):
+            raise conn
+        return conn
+
+    def release(self, key, conn):
+        """
+        gives back a connection whose response was read
+        """
+        now = time.monotonic()
+        evicted = []
+        with self.lock:
+            # lazy eviction of idle connections of every peer
+            for k, conns in list(self._idle.items()):
+                fresh = [(c, t) for c, t in conns if now - t < self.idle_timeout]
+                if len(fresh) < len(conns):
+                    evicted.extend(c for c, t in conns if now - t >= self.idle_timeout)
+                    self._closed(k, len(conns) - len(fresh))
+                if fresh:
+                    self._idle[k] = fresh
+                else:
+                    del self._idle[k]
+            conns = self._idle.setdefault(key, [])
+            if len(conns) < self.max_idle_per_host:
+                conns.append((conn, now))
+                self.freed.notify_all()
+            else:
+                evicted.append(conn)
+                self._closed(key)
+        for c in evicted:
+            c.close()
+
+    def discard(self, key, conn):
+        """
+        closes a checked out connection that can not be reused
+        """
+        conn.close()
+        with self.lock:
+            self._closed(key)
+
+    def clear(self, key):
+        """
+        drops all idle connections of key, used when the peer closed one of them
+        """
+        with self.lock:
+            conns = self._idle.pop(key, [])
+            if conns:
+                self._closed(key, len(conns))
+        for c, _ in conns:
+            c.close()
+
+    def idle_count(self) -> int:
+        with self.lock:
+            return sum(map(len, self._idle.values()))
+
+    def open_count(self) -> int:
+        with self.lock:
+            return sum(self._open.values())
+
+    def close(self):
+        with self.lock:
+            idle, self._idle = self._idle, {}
+            for key, conns in idle.items():
+                self._closed(key, len(conns))
+        for conns in idle.values():
+            for c, _ in conns:
+                c.close()
+
+
+# shared by all transports of the process, so connections outlive the proxies
+shared_pool = ConnectionPool()
+# peers that answered in the binary codec, calls to them are sent binary from then on
+binary_peers: set[str] = set()
+# calls made by the process by method, redirects followed included, and the ones that failed
+client_latency = HistogramFamily()
+client_errors = Counters()
+
+
+def _observe_call(methodname, start, failed):
+    client_latency.observe(methodname, time.perf_counter() - start)
+    if failed:
+        client_errors.inc(methodname)
+
+
+def make_client_context(ca_file, keypair) -> ssl.SSLContext:
+    context: ssl.SSLContext = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.maximum_version = ssl.TLSVersion.TLSv1_2
+    context.check_hostname = False
+    context.verify_flags = ssl.VerifyFlags.VERIFY_DEFAULT  # no crl check
+    # context.verify_flags = ssl.VerifyFlags.VERIFY_CRL_CHECK_CHAIN  # crl check
+    context.verify_mode = ssl.VerifyMode.CERT_REQUIRED
+    context.load_cert_chain(certfile=keypair[0], keyfile=keypair[1])
+    context.load_verify_locations(cafile=ca_file)
+    return context
 
 
 class DiSTransport(Transport):
+    # ask the peers to answer in the binary codec, the ones that understand it will
+    accept_binary = True
+
     def __init__(self, proxy: str = None, ca_file=None, keypair=None, timeout=None, follow_redirects=True,
-                 baseport=None):
+                 baseport=None, pool: ConnectionPool = None, context: ssl.SSLContext = None):
         super().__init__()
         self.proxy = proxy
+        self.pool = pool or shared_pool
+        # connection in use by the current thread, a transport may be shared between threads
+        self._local = threading.local()
         self.baseport = baseport
         self.followRedirects = follow_redirects
         self.timeout = timeout
-        if keypair is not None and len(keypair) == 2 and ca_file is not None:
-            self.context: ssl.SSLContext = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-            self.context.minimum_version = ssl.TLSVersion.TLSv1_2
-            self.context.maximum_version = ssl.TLSVersion.TLSv1_2
-            self.context.check_hostname = False
-            self.context.verify_flags = ssl.VerifyFlags.VERIFY_DEFAULT  # no crl check
-            # context.verify_flags = ssl.VerifyFlags.VERIFY_CRL_CHECK_CHAIN  # crl check
-            self.context.verify_mode = ssl.VerifyMode.CERT_REQUIRED
-            self.context.load_cert_chain(certfile=keypair[0], keyfile=keypair[1])
-            self.context.load_verify_locations(cafile=ca_file)
+        if context is not None:
+            # already loaded context, avoids parsing the keys again
+            self.context = context
+        elif keypair is not None and len(keypair) == 2 and ca_file is not None:
+            self.context = make_client_context(ca_file, keypair)
         else:
             self.context = None
 
@@ -177,33 +614,216 @@ class DiSTransport(Transport):
     #                 pass
     #     raise Exception("Unable to bind in range")
 
+    def _pooled_connection(self, chost):
+        key = ("https" if self.context is not None else "http", chost)
+        conn = self.pool.acquire(key, self.timeout)
+        if conn is None:
+            if self.context is not None:
+                conn = client.HTTPSConnection(chost, timeout=self.timeout, context=self.context)
+            else:
+                conn = client.HTTPConnection(chost, timeout=self.timeout)
+        return key, conn
+
     def make_connection(self, host):
-        # will not use keep alive
+        # keep alive, connections are taken from the pool and given back after the response is read
         chost, self._extra_headers, x509 = self.get_host_info(host)
-        if self.context is not None:
-            conn = client.HTTPSConnection(chost, timeout=self.timeout, context=self.context)
-        else:
-            conn = client.HTTPConnection(chost, timeout=self.timeout)
+        key, conn = self._pooled_connection(chost)
+        self._local.conn = key, conn, False
         return conn
 
+    def stream(self, host, handler, chunk_size=64 * 1024):
+        """
+        GETs handler from host yielding the body chunk by chunk, inflated if it came compressed
+        """
+        start = time.perf_counter()
+        # not made current, the chunks may be read from other threads
+        span = tracer.start("stream", activate=False, Kind="client", Peer=host, Path=handler)
+        error = None
+        try:
+            yield from self._stream(host, handler, chunk_size, tracer.header(span) if span else None)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            _observe_call(handler.lstrip("/").split("/")[0], start, error is not None)
+            tracer.finish(span, error)
+
+    def _stream(self, host, handler, chunk_size, trace):
+        chost, extra_headers, x509 = self.get_host_info(host)
+        headers = dict(self._headers + (extra_headers or []))
+        headers["Accept-Encoding"] = "deflate"
+        if trace is not None:
+            headers[TRACE_HEADER] = trace
+        for attempt in (0, 1):
+            key, conn = self._pooled_connection(chost)
+            try:
+                conn.request("GET", handler, headers=headers)
+                resp = conn.getresponse()
+                break
+            except (client.RemoteDisconnected, ConnectionResetError, ConnectionAbortedError, BrokenPipeError):
+                # kept alive connection went cold, retry once on a fresh one
+                self.pool.discard(key, conn)
+                self.pool.clear(key)
+                if attempt:
+                    raise
+            except BaseException:
+                self.pool.discard(key, conn)
+                raise
+        try:
+            if resp.status != 200:
+                resp.read()
+                raise xmlrpc.client.ProtocolError(host + handler, resp.status, resp.reason, dict(resp.getheaders()))
+            decompressor = zlib.decompressobj() if resp.getheader("Content-Encoding", "") == "deflate" else None
+            while chunk := resp.read(chunk_size):
+                yield decompressor.decompress(chunk) if decompressor else chunk
+            if decompressor:
+                yield decompressor.flush()
+        except BaseException:
+            self.pool.discard(key, conn)
+            raise
+        if resp.will_close:
+            self.pool.discard(key, conn)
+        else:
+            self.pool.release(key, conn)
+
+    def send_request(self, host, handler, request_body, debug):
+        self._local.binary_body = BinaryCodec.is_binary(request_body)
+        return super().send_request(host, handler, request_body, debug)
+
+    def send_headers(self, connection, headers):
+        if self._local.binary_body:
+            headers = [h for h in headers if h[0] != "Content-Type"] + [("Content-Type", BinaryCodec.CONTENT_TYPE)]
+        if self.accept_binary:
+            headers = headers + [("Accept", BinaryCodec.CONTENT_TYPE + ", text/xml")]
+        if (trace := tracer.header()) is not None:
+            headers = headers + [(TRACE_HEADER, trace)]
+        super().send_headers(connection, headers)
+
+    def parse_response(self, response):
+        key, conn, _ = self._local.conn
+        if response.getheader("Content-Type", "") == BinaryCodec.CONTENT_TYPE:
+            binary_peers.add(key[1])
+            try:
+                res = BinaryCodec.loads(response.read(), struct_to_instance)[0]
+            finally:
+                self._local.conn = key, conn, response.will_close
+            return res
+        res = super().parse_response(response)
+        self._local.conn = key, conn, response.will_close
+        return res
+
+    def _release_connection(self):
+        key, conn, will_close = getattr(self._local, "conn", (None, None, True))
+        self._local.conn = None, None, True
+        if conn is not None:
+            if will_close:
+                self.pool.discard(key, conn)
+            else:
+                self.pool.release(key, conn)
+
+    def single_request(self, host, handler, request_body, verbose=False):
+        try:
+            res = super().single_request(host, handler, request_body, verbose)
+        except Fault:
+            # the response was fully read so the connection can still be reused
+            self._release_connection()
+            raise
+        except xmlrpc.client.ProtocolError:
+            # an error status, its body may be left unread so the connection is not reused
+            key, conn, _ = getattr(self._local, "conn", (None, None, True))
+            self._local.conn = None, None, True
+            if conn is not None:
+                self.pool.discard(key, conn)
+            raise
+        self._release_connection()
+        return res
+
+    def close(self):
+        # called on errors, the peer may have dropped the socket so the idle ones are not trusted either
+        key, conn, _ = getattr(self._local, "conn", (None, None, True))
+        self._local.conn = None, None, True
+        if conn is not None:
+            self.pool.discard(key, conn)
+            self.pool.clear(key)
+
     def request(self, host, handler, request_body, verbose=False):
+        alternatives = []
         while True:
-            if self.context is not None:
-                pass
-
-            resp = super().request(host, handler, request_body, verbose)
-            self.close()  # closing, no keep alive # this mehtod may not do anything though
+            if BinaryCodec.is_binary(request_body) and host not in binary_peers:
+                # redirected to a peer not known to speak binary
+                params, methodname = BinaryCodec.loads(request_body, struct_to_instance)
+                request_body = xmlrpc.client.dumps(params, methodname, allow_none=True).encode("utf-8")
+            try:
+                # the base request retries once with a new connection if the kept alive one was reset
+                with tracer.span("hop", Kind="client", Peer=host):
+                    resp = super().request(host, handler, request_body, verbose)
+            except (OSError, client.HTTPException) as e:
+                # a dead redirect target is replaced by the next node given along with it
+                if not alternatives:
+                    raise
+                logger.info(f"RPC Redirect to {host} failed ({e}), trying " + alternatives[0])
+                host = alternatives.pop(0)
+                continue
 
             if len(resp) != 1 or not (self.followRedirects and isinstance(resp[0], RedirectNodeResponse)):
                 break
             resp = resp[0]
             nhost = str(resp.Address[0]) + ":" + str(resp.Address[1])
+            alternatives = [str(a[0]) + ":" + str(a[1]) for a in resp.Alternatives]
             logger.info(f"RPC Redirected from {host}  to " + nhost)
             host = nhost
         return resp
 
 
-class ThreadedXRPCServer(ThreadingMixIn, SimpleXMLRPCServer):
+class DiSServerProxy(ServerProxy):
+    """
+    ServerProxy sending binary bodies to the peers known to answer in binary
+    """
+
+    def _ServerProxy__request(self, methodname, params):
+        with tracer.span(methodname, Kind="client"):
+            return self._timed_request(methodname, params)
+
+    def _timed_request(self, methodname, params):
+        start = time.perf_counter()
+        failed = True
+        try:
+            if self._ServerProxy__host not in binary_peers:
+                response = super()._ServerProxy__request(methodname, params)
+            else:
+                response = self._ServerProxy__transport.request(self._ServerProxy__host, self._ServerProxy__handler,
+                                                                BinaryCodec.dumps(params, methodname),
+                                                                verbose=self._ServerProxy__verbose)
+                if len(response) == 1:
+                    response = response[0]
+            failed = False
+            return response
+        finally:
+            _observe_call(methodname, start, failed)
+
+
+def marshaled_dispatch(dispatcher: SimpleXMLRPCDispatcher, data, dispatch_method, content_type, accept):
+    """
+    answers a POST body in binary if it came in binary or the client accepts it, otherwise in xml.
+    returns the response and its content type
+    """
+    binary_in = content_type == BinaryCodec.CONTENT_TYPE
+    if not binary_in and BinaryCodec.CONTENT_TYPE not in accept:
+        return dispatcher._marshaled_dispatch(data, dispatch_method), "text/xml"
+    try:
+        if binary_in:
+            params, method = BinaryCodec.loads(data, struct_to_instance)
+        else:
+            params, method = xmlrpc.client.loads(data, use_builtin_types=dispatcher.use_builtin_types)
+        response = BinaryCodec.dumps((dispatch_method(method, params),), methodresponse=True)
+    except Fault as fault:
+        response = BinaryCodec.dumps(fault)
+    except BaseException as e:
+        response = BinaryCodec.dumps(Fault(1, f"{type(e)}:{e}"))
+    return response, BinaryCodec.CONTENT_TYPE
+
+
+class ThreadedXRPCServer(RoutedDispatcher, ThreadingMixIn, SimpleXMLRPCServer):
     daemon_threads = True
 
     def __init__(self, addr, ca_file=None, keypair=None, requestHandler=DiSRequestHandler,
@@ -211,17 +831,10 @@ class ThreadedXRPCServer(ThreadingMixIn, SimpleXMLRPCServer):
                  bind_and_activate=True, use_builtin_types=False):
         SimpleXMLRPCServer.__init__(self, addr, requestHandler, logRequests, allow_none, encoding, bind_and_activate,
                                     use_builtin_types)
+        self.connections = Gauge()
 
         if keypair is not None and len(keypair) == 2 and ca_file is not None:
-            self.context: ssl.SSLContext = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-            self.context.minimum_version = ssl.TLSVersion.TLSv1_2
-            self.context.maximum_version = ssl.TLSVersion.TLSv1_2
-            self.context.check_hostname = False
-            self.context.verify_flags = ssl.VerifyFlags.VERIFY_DEFAULT  # no crl check
-            # context.verify_flags = ssl.VerifyFlags.VERIFY_CRL_CHECK_CHAIN  # crl check
-            self.context.verify_mode = ssl.VerifyMode.CERT_OPTIONAL
-            self.context.load_verify_locations(cafile=ca_file)
-            self.context.load_cert_chain(certfile=keypair[0], keyfile=keypair[1])
+            self.context = make_server_context(ca_file, keypair)
             self.socket = self.context.wrap_socket(self.socket)
             logger.info(f"Starting a secure XRPC server on {addr}")
         else:
@@ -269,17 +882,26 @@ def register_type_unmarshaller(type):
     xmlrpc.client.Unmarshaller.dispatch[type.__name__] = my_end_struct
 
 
+def struct_to_instance(name, val: dict):
+    """
+    builds the object a {type name: fields} struct stands for, unknown types stay as the struct
+    """
+    if name == BigInt.__name__:
+        return int(val["Value"])
+    if name == RedirectNodeResponse.__name__:
+        return RedirectNodeResponse(val.get("Address", None), val.get("Alternatives", ()))
+    if name in knw_types:
+        return knw_types[name].unmarshall(val)
+    return {name: val}
+
+
 def my_end_struct(self: Unmarshaller, data):
     self.end_struct(data)  # fast look shift reduce or pushdown?
     res = self._stack[-1]
     if isinstance(res, dict) and len(res) == 1:
-        if (val := res.get(BigInt.__name__, None)) and isinstance(val, dict):
-            res = int(val["Value"])
-        elif (val := res.get(RedirectNodeResponse.__name__, None)) and isinstance(val, dict):
-            addr = val.get("Address", None)
-            res = RedirectNodeResponse(addr)
-        elif (k := tuple(res.keys())[0]) and k in knw_types and (val := res.get(k, None)) and isinstance(val, dict):
-            res = knw_types[k].unmarshall(val)
+        k = tuple(res.keys())[0]
+        if (val := res.get(k, None)) and isinstance(val, dict):
+            res = struct_to_instance(k, val)
     self._stack[-1] = res
 
 
@@ -1,7 +1,17 @@
 from . import CustomXRPC as _CustomXRPC
+from . import AsyncXRPC as _AsyncXRPC
 
 DiSTransport = _CustomXRPC.DiSTransport
+ConnectionPool = _CustomXRPC.ConnectionPool
+shared_pool = _CustomXRPC.shared_pool
+client_latency = _CustomXRPC.client_latency
+client_errors = _CustomXRPC.client_errors
+make_client_context = _CustomXRPC.make_client_context
 register_type_unmarshaller = _CustomXRPC.register_type_unmarshaller
 RedirectNodeResponse = _CustomXRPC.RedirectNodeResponse
+StreamResponse = _CustomXRPC.StreamResponse
 ThreadedXRPCServer = _CustomXRPC.ThreadedXRPCServer
+AsyncXRPCServer = _AsyncXRPC.AsyncXRPCServer
+ElasticExecutor = _AsyncXRPC.ElasticExecutor
 ServerProxy = _CustomXRPC.ServerProxy
+DiSServerProxy = _CustomXRPC.DiSServerProxy
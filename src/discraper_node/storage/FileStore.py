@@ -0,0 +1,115 @@
+import json
+from pathlib import Path
+
+from .Manifest import Manifest
+from ..custom_logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class FileStore:
+    """
+    Legacy storage, one <id>.html blob and one <id>.json descriptor per document
+    """
+
+    def __init__(self, folder):
+        self.folder = Path(folder)
+        self.manifest = Manifest(self.folder / "files.manifest")
+
+    def _blob(self, id_) -> Path:
+        return self.folder / f"{id_}.html"
+
+    def _descriptor(self, id_) -> Path:
+        return self.folder / f"{id_}.json"
+
+    def put(self, id_, address, refs, chunks, validators=None):
+        blob_file = self._blob(id_)
+        try:
+            with blob_file.open("wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+        except BaseException:
+            blob_file.unlink(missing_ok=True)
+            raise
+        js = json.JSONEncoder()
+        js = js.encode({"Address": address, "Refs": refs, "BlobFile": str(blob_file), "Validators": validators or {}})
+        self._descriptor(id_).write_text(js)
+        self.manifest.append(["P", id_, address, list(refs), validators or {}])
+
+    def update_validators(self, id_, address, refs, validators):
+        js = json.JSONEncoder()
+        js = js.encode({"Address": address, "Refs": refs, "BlobFile": str(self._blob(id_)), "Validators": validators})
+        self._descriptor(id_).write_text(js)
+        self.manifest.append(["P", id_, address, list(refs), validators])
+
+    def read(self, id_) -> bytes:
+        return self._blob(id_).read_bytes()
+
+    def read_chunks(self, id_, chunk_size=64 * 1024):
+        with self._blob(id_).open("rb") as f:
+            while chunk := f.read(chunk_size):
+                yield chunk
+
+    def delete(self, id_):
+        self._blob(id_).unlink(missing_ok=True)
+        self._descriptor(id_).unlink(missing_ok=True)
+        self.manifest.append(["D", id_])
+
+    def has_documents(self) -> bool:
+        """
+        there is a manifest or a descriptor, without reading them
+        """
+        return self.manifest.exists() or any(d.stem.isdigit() for d in self.folder.glob('*.json'))
+
+    def _scan(self) -> dict:
+        docs = {}
+        for descriptor in self.folder.glob('*.json'):
+            try:
+                with descriptor.open() as f:
+                    js = json.load(f)
+                docs[int(descriptor.stem)] = js["Address"], js["Refs"], js.get("Validators", {})
+            except (ValueError, KeyError) as e:
+                # written halfway when the node stopped
+                logger.error(f"Skipping descriptor {descriptor} {e}")
+        return docs
+
+    def _replay_manifest(self) -> dict:
+        docs = {}
+        for op, id_, *rest in self.manifest.read():
+            if op == "P":
+                # entries written before the validators have none
+                docs[id_] = rest[0], rest[1], rest[2] if len(rest) > 2 else {}
+            else:
+                docs.pop(id_, None)
+        return docs
+
+    def load(self):
+        """
+        yields (address, refs, validators) of every stored document, from the manifest or scanning the
+        descriptors if there is none or it is unusable
+        """
+        docs = None
+        if self.manifest.exists():
+            try:
+                docs = self._replay_manifest()
+            except Exception as e:
+                logger.error(f"Manifest unusable, scanning the descriptors {e}")
+        if docs is None:
+            docs = self._scan()
+        if docs or self.manifest.exists():
+            # compacted, one entry per document
+            self.manifest.rewrite(["P", id_, *meta] for id_, meta in docs.items())
+        yield from docs.values()
+
+    def size(self) -> int:
+        total = 0
+        for path in self.folder.iterdir():
+            if path.suffix in (".html", ".json", ".manifest"):
+                try:
+                    total += path.stat().st_size
+                except FileNotFoundError:
+                    pass  # deleted meanwhile
+        return total
+
+    def close(self):
+        self.manifest.close()
@@ -0,0 +1,80 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+from ..custom_logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class Manifest:
+    """
+    Append only log of the metadata of the stored documents, read in one go at start instead of
+    scanning the storage
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.entries = 0
+        self._file = None
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def read(self) -> list:
+        """
+        entries in append order. The tail of an interrupted append, an incomplete or unreadable last line, is
+        dropped, a ValueError is raised if one is unreadable before the end
+        """
+        data = self.path.read_bytes()
+        entries = []
+        end = 0  # of the last good line
+        bad = None
+        for line in data.split(b"\n")[:-1]:
+            try:
+                entry = json.loads(line)
+            except ValueError as e:
+                bad = bad or e
+            else:
+                if bad is not None:
+                    raise ValueError(f"corrupt entry {len(entries) + 1} in {self.path}") from bad
+                entries.append(entry)
+            if bad is None:
+                end += len(line) + 1
+        if end < len(data):
+            logger.warning(f"Truncating manifest {self.path} at {end}")
+            with self.path.open("r+b") as f:
+                f.truncate(end)
+        self.entries = len(entries)
+        return entries
+
+    def append(self, entry):
+        with self.lock:
+            if self._file is None:
+                self._file = self.path.open("ab")
+            self._file.write(json.dumps(entry).encode("utf-8") + b"\n")
+            self._file.flush()
+            self.entries += 1
+
+    def rewrite(self, entries):
+        # written aside and swapped, a crash leaves the old manifest
+        tmp = self.path.with_suffix(".tmp")
+        with tmp.open("wb") as f:
+            count = 0
+            for entry in entries:
+                f.write(json.dumps(entry).encode("utf-8") + b"\n")
+                count += 1
+        with self.lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            os.replace(tmp, self.path)
+            self.entries = count
+
+    def close(self):
+        with self.lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
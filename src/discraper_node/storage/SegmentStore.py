@@ -0,0 +1,332 @@
+import json
+import mmap
+import shutil
+import struct
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from .Manifest import Manifest
+from ..custom_logger import get_logger
+
+logger = get_logger(__name__)
+
+# op, id, meta length, blob length
+_HEADER = struct.Struct(">c20sIQ")
+_PUT = b"P"
+_DELETE = b"D"
+
+
+def _meta(meta: bytes) -> tuple:
+    # records written before the validators only have address and refs
+    address, refs, *validators = json.loads(meta)
+    return address, refs, validators[0] if validators else {}
+
+
+class SegmentStore:
+    """
+    Log structured storage, records are appended to segment files and an index keeps
+    id -> (segment, offset, length) of the live blobs. Blobs are read through memory maps and the space of
+    deleted or overwritten records is reclaimed by a background compactor
+    """
+
+    def __init__(self, folder, segment_size=64 * 1024 * 1024, compact_ratio=0.5, compact_polling=30):
+        self.folder = Path(folder)
+        self.segment_size = segment_size
+        self.compact_ratio = compact_ratio
+        self.compact_polling = compact_polling
+        self.lock = threading.RLock()
+        # id -> segment, record offset, blob offset, blob length
+        self.index: dict[int, tuple[int, int, int, int]] = {}
+        self.live: dict[int, int] = {}  # live bytes per segment
+        self._maps: dict[int, mmap.mmap] = {}
+        self._pins: dict[int, int] = {}  # segments being streamed, the compactor won't remove them
+        self._loaded: dict[int, tuple[str, list]] = {}
+
+        self.manifest = Manifest(self.folder / "segments.manifest")
+        self.segments = sorted(int(p.stem.split("-")[1]) for p in self.folder.glob("segment-*.log"))
+        for segment in self.segments:
+            self.live[segment] = 0
+        covered = None
+        if self.manifest.exists():
+            try:
+                covered = self._replay_manifest()
+            except Exception as e:
+                logger.error(f"Manifest unusable, scanning the segments {e}")
+                self.index.clear()
+                self._loaded.clear()
+                self.live = dict.fromkeys(self.segments, 0)
+                covered = None
+        for segment in self.segments:
+            # only what the manifest has not seen, all of it without a manifest
+            self._load_segment(segment, covered.get(segment, 0) if covered is not None else 0)
+        if not self.segments:
+            self.segments.append(1)
+            self.live[1] = 0
+        self.manifest.rewrite(self._manifest_entries(self._loaded))
+        self.active = self.segments[-1]
+        self._writer = self._path(self.active).open("ab")
+
+        self.compactor_thread = threading.Thread(name="COMPACT", target=self._compactor_d, daemon=True)
+        self.compactor_thread.start()
+
+    def _path(self, segment) -> Path:
+        return self.folder / f"segment-{segment:06d}.log"
+
+    def _scan(self, segment, start=0):
+        """
+        yields (op, id, meta, record offset, blob offset, blob length) of each complete record from start
+        """
+        path = self._path(segment)
+        size = path.stat().st_size
+        offset = start
+        with path.open("rb") as f:
+            f.seek(start)
+            while offset + _HEADER.size <= size:
+                op, raw_id, meta_len, blob_len = _HEADER.unpack(f.read(_HEADER.size))
+                blob_offset = offset + _HEADER.size + meta_len
+                if blob_offset + blob_len > size:
+                    break
+                meta = f.read(meta_len)
+                f.seek(blob_offset + blob_len)
+                yield op, int.from_bytes(raw_id, byteorder="big"), meta, offset, blob_offset, blob_len
+                offset = blob_offset + blob_len
+        if offset < size:
+            # partial record of an interrupted append
+            logger.warning(f"Truncating segment {segment} at {offset}")
+            with path.open("r+b") as f:
+                f.truncate(offset)
+
+    def _replay_manifest(self) -> dict[int, int]:
+        """
+        rebuilds the index from the manifest, returns the offset up to where each segment is covered by it
+        """
+        covered = {}
+        for op, *entry in self.manifest.read():
+            if op == "P":
+                # entries written before the validators have none
+                id_, address, refs, (segment, offset, blob_offset, blob_len), *validators = entry
+                self._unlink_live(id_)
+                self.index[id_] = segment, offset, blob_offset, blob_len
+                self.live[segment] = self.live.get(segment, 0) + blob_offset + blob_len - offset
+                self._loaded[id_] = address, refs, validators[0] if validators else {}
+                end = blob_offset + blob_len
+            elif op == "D":
+                id_, (segment, end) = entry
+                self._unlink_live(id_)
+                self._loaded.pop(id_, None)
+            else:  # "C" checkpoint of a segment
+                segment, end = entry
+            covered[segment] = max(covered.get(segment, 0), end)
+        missing = {location[0] for location in self.index.values()}.difference(self.segments)
+        if missing:
+            raise Exception(f"segments {missing} are gone")
+        short = [segment for segment, end in covered.items()
+                 if segment in self.segments and self._path(segment).stat().st_size < end]
+        if short:
+            raise Exception(f"segments {short} are shorter than the manifest")
+        return covered
+
+    def _manifest_entries(self, docs):
+        # caller makes sure the index does not change while iterating
+        for id_, (address, refs, validators) in docs.items():
+            yield ["P", id_, address, list(refs), list(self.index[id_]), validators]
+        for segment in self.segments:
+            yield ["C", segment, self._path(segment).stat().st_size if self._path(segment).exists() else 0]
+
+    def _load_segment(self, segment, start=0):
+        self.live.setdefault(segment, 0)
+        for op, id_, meta, offset, blob_offset, blob_len in self._scan(segment, start):
+            self._unlink_live(id_)
+            if op == _PUT:
+                self.index[id_] = segment, offset, blob_offset, blob_len
+                self.live[segment] += blob_offset + blob_len - offset
+                self._loaded[id_] = _meta(meta)
+            else:
+                self._loaded.pop(id_, None)
+
+    def _unlink_live(self, id_):
+        location = self.index.pop(id_, None)
+        if location is not None:
+            segment, offset, blob_offset, blob_len = location
+            self.live[segment] -= blob_offset + blob_len - offset
+
+    def _map(self, segment, end) -> mmap.mmap:
+        m = self._maps.get(segment, None)
+        if m is None or len(m) < end:
+            # the active segment grows, remap it when reading past the mapped size
+            if segment == self.active:
+                self._writer.flush()
+            if m is not None:
+                m.close()
+            with self._path(segment).open("rb") as f:
+                m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = m
+        return m
+
+    def _append(self, op, id_, meta: bytes, blob, blob_len) -> tuple[int, int]:
+        # caller holds the lock, returns the record and blob offsets in the active segment
+        if self._writer.tell() >= self.segment_size:
+            self._writer.close()
+            self.active += 1
+            self.segments.append(self.active)
+            self.live[self.active] = 0
+            self._writer = self._path(self.active).open("ab")
+        offset = self._writer.tell()
+        self._writer.write(_HEADER.pack(op, id_.to_bytes(20, byteorder="big"), len(meta), blob_len))
+        self._writer.write(meta)
+        if blob is not None:
+            shutil.copyfileobj(blob, self._writer)
+        self._writer.flush()
+        return offset, offset + _HEADER.size + len(meta)
+
+    def put(self, id_, address, refs, chunks, validators=None):
+        # spooled first so a slow stream does not hold the lock, small blobs stay in memory
+        with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as blob:
+            for chunk in chunks:
+                blob.write(chunk)
+            blob_len = blob.tell()
+            blob.seek(0)
+            meta = json.dumps([address, list(refs), validators or {}]).encode("utf-8")
+            with self.lock:
+                offset, blob_offset = self._append(_PUT, id_, meta, blob, blob_len)
+                self._unlink_live(id_)
+                self.index[id_] = self.active, offset, blob_offset, blob_len
+                self.live[self.active] += blob_offset + blob_len - offset
+                self.manifest.append(["P", id_, address, list(refs), list(self.index[id_]), validators or {}])
+
+    def update_validators(self, id_, address, refs, validators):
+        """
+        the live record is appended again with the new metadata, a scan or the compactor would bring back the
+        old one otherwise
+        """
+        meta = json.dumps([address, list(refs), validators]).encode("utf-8")
+        with self.lock:
+            if id_ in self.index:
+                self._move(id_, meta)
+
+    def _move(self, id_, meta: bytes):
+        # caller holds the lock, copies the live blob of id_ to the end of the log with meta
+        segment, _, blob_offset, blob_len = self.index[id_]
+        blob = self._map(segment, blob_offset + blob_len)[blob_offset:blob_offset + blob_len]
+        with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as f:
+            f.write(blob)
+            f.seek(0)
+            new_offset, new_blob_offset = self._append(_PUT, id_, meta, f, blob_len)
+        self._unlink_live(id_)
+        self.index[id_] = self.active, new_offset, new_blob_offset, blob_len
+        self.live[self.active] += new_blob_offset + blob_len - new_offset
+        address, refs, validators = _meta(meta)
+        self.manifest.append(["P", id_, address, refs, list(self.index[id_]), validators])
+
+    def read(self, id_) -> bytes:
+        with self.lock:
+            segment, _, blob_offset, blob_len = self.index[id_]
+            return self._map(segment, blob_offset + blob_len)[blob_offset:blob_offset + blob_len]
+
+    def read_chunks(self, id_, chunk_size=64 * 1024):
+        with self.lock:
+            segment, _, blob_offset, blob_len = self.index[id_]
+            self._pins[segment] = self._pins.get(segment, 0) + 1
+        try:
+            for start in range(blob_offset, blob_offset + blob_len, chunk_size):
+                end = min(start + chunk_size, blob_offset + blob_len)
+                with self.lock:
+                    chunk = self._map(segment, end)[start:end]
+                yield chunk
+        finally:
+            with self.lock:
+                self._pins[segment] -= 1
+
+    def delete(self, id_):
+        with self.lock:
+            if id_ in self.index:
+                offset, end = self._append(_DELETE, id_, b"", None, 0)
+                self._unlink_live(id_)
+                self.manifest.append(["D", id_, [self.active, end]])
+
+    def load(self):
+        """
+        yields (address, refs, validators) of every stored document, the metadata is only kept until loaded
+        """
+        with self.lock:
+            loaded, self._loaded = self._loaded, {}
+        yield from loaded.values()
+
+    def size(self) -> int:
+        with self.lock:
+            return sum(self._path(s).stat().st_size for s in self.segments if self._path(s).exists())
+
+    # ---------------------- COMPACTION ---------------------- #
+
+    def _compactor_d(self):
+        while True:
+            time.sleep(self.compact_polling)
+            try:
+                self.compact()
+            except Exception as e:
+                logger.error(f"Compaction failed {e}")
+
+    def _compact_manifest(self):
+        # the metadata is not kept in memory, it is collected back from the manifest itself
+        with self.lock:
+            docs = {}
+            for op, *entry in self.manifest.read():
+                if op == "P" and entry[0] in self.index:
+                    docs[entry[0]] = entry[1], entry[2], entry[4] if len(entry) > 4 else {}
+            self.manifest.rewrite(list(self._manifest_entries(docs)))
+
+    def compact(self):
+        """
+        rewrites the live records of mostly dead sealed segments at the end of the log
+        """
+        if self.manifest.entries > 4 * len(self.index) + 1024:
+            self._compact_manifest()
+        for segment in list(self.segments):
+            if segment == self.active:
+                continue
+            size = self._path(segment).stat().st_size
+            if size == 0 or self.live.get(segment, 0) / size < self.compact_ratio:
+                # tombstones can only go with the oldest segment, older puts would come back otherwise
+                self._compact_segment(segment, drop_tombstones=segment == self.segments[0])
+
+    def _compact_segment(self, segment, drop_tombstones):
+        with self.lock:
+            if self._pins.get(segment, 0):
+                return  # being streamed, tried again next time
+        moved = 0
+        tombstones = set()
+        for op, id_, meta, offset, blob_offset, blob_len in self._scan(segment):
+            if op == _DELETE:
+                if not drop_tombstones:
+                    tombstones.add(id_)
+                continue
+            with self.lock:
+                if self.index.get(id_, None) == (segment, offset, blob_offset, blob_len):
+                    self._move(id_, meta)
+                    moved += 1
+        with self.lock:
+            if self._pins.get(segment, 0):
+                # pinned meanwhile, the moved records are dead here and the tombstones are copied next time
+                return
+            # only when the segment goes, an aborted compaction would append them again on every retry
+            for id_ in tombstones:
+                if id_ not in self.index:
+                    _, end = self._append(_DELETE, id_, b"", None, 0)
+                    self.manifest.append(["D", id_, [self.active, end]])
+            m = self._maps.pop(segment, None)
+            if m is not None:
+                m.close()
+            self._path(segment).unlink(missing_ok=True)
+            self.segments.remove(segment)
+            self.live.pop(segment, None)
+        logger.info(f"Compacted segment {segment} moved {moved} records")
+
+    def close(self):
+        with self.lock:
+            self._writer.close()
+            self.manifest.close()
+            for m in self._maps.values():
+                m.close()
+            self._maps.clear()
@@ -0,0 +1,11 @@
+from . import FileStore as _FileStore
+from . import SegmentStore as _SegmentStore
+
+FileStore = _FileStore.FileStore
+SegmentStore = _SegmentStore.SegmentStore
+
+backends = {"files": FileStore, "segments": SegmentStore}
+
+
+def make_store(backend, folder):
+    return backends[backend](folder)
@@ -0,0 +1,77 @@
+import math
+import threading
+from xmlrpc.client import Binary
+
+_MASK64 = (1 << 64) - 1
+
+
+class BloomFilter:
+    """
+    Bloom filter of ids. The ids are already uniform hashes, the positions come from two 64 bit slices of
+    the id (double hashing) instead of hashing again
+    """
+
+    def __init__(self, capacity=1024, error_rate=0.01, *, bits=None, hashes=None, data=None):
+        if bits is None:
+            bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+            bits = max(64, (bits + 7) // 8 * 8)
+        self.bits = bits
+        self.hashes = hashes or max(1, round(bits / capacity * math.log(2)))
+        self.array = bytearray(data) if data is not None else bytearray(bits // 8)
+        self.count = 0
+
+    def _positions(self, id_):
+        h1 = id_ & _MASK64
+        h2 = (id_ >> 64) & _MASK64 | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, id_):
+        for p in self._positions(id_):
+            self.array[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def __contains__(self, id_):
+        array = self.array
+        return all(array[p >> 3] & (1 << (p & 7)) for p in self._positions(id_))
+
+    def __len__(self):
+        return self.count
+
+    def to_wire(self) -> list:
+        return [self.bits, self.hashes, self.count, bytes(self.array)]
+
+    @staticmethod
+    def from_wire(wire) -> "BloomFilter":
+        bits, hashes, count, data = wire
+        # xml brings the bytes wrapped
+        data = data.data if isinstance(data, Binary) else data
+        if len(data) * 8 != bits:
+            raise ValueError("Bloom filter size does not match its bits")
+        bloom = BloomFilter(bits=bits, hashes=hashes, data=data)
+        bloom.count = count
+        return bloom
+
+
+class RecentFilter:
+    """
+    Ids seen lately, two generations of bloom filters, the older is dropped when the newer fills up
+    so the memory stays bounded and old ids age out
+    """
+
+    def __init__(self, capacity=8192, error_rate=0.01):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.lock = threading.Lock()
+        self.current = BloomFilter(capacity, error_rate)
+        self.previous = BloomFilter(capacity, error_rate)
+
+    def add(self, id_):
+        with self.lock:
+            if id_ in self.current:
+                return
+            if len(self.current) >= self.capacity:
+                self.previous, self.current = self.current, BloomFilter(self.capacity, self.error_rate)
+            self.current.add(id_)
+
+    def __contains__(self, id_):
+        return id_ in self.current or id_ in self.previous
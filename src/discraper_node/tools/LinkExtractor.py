@@ -0,0 +1,87 @@
+from html.parser import HTMLParser
+from urllib import parse as urlparse
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str) -> str | None:
+    """
+    canonical form of an absolute http url, None if it is not one. Scheme and host lowercased, default port,
+    fragment and dot segments removed
+    """
+    try:
+        parts = urlparse.urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return None
+    scheme = parts.scheme.lower()
+    if scheme not in _DEFAULT_PORTS or not parts.hostname:
+        return None
+    netloc = parts.hostname.lower()
+    if ":" in netloc:
+        netloc = f"[{netloc}]"
+    if port is not None and port != _DEFAULT_PORTS[scheme]:
+        netloc += f":{port}"
+    path = _remove_dot_segments(parts.path) or "/"
+    return urlparse.urlunsplit((scheme, netloc, path, parts.query, ""))
+
+
+def _remove_dot_segments(path: str) -> str:
+    # rfc 3986 5.2.4, urljoin only does it for relative references
+    if "." not in path:
+        return path
+    out = []
+    for segment in path.split("/"):
+        if segment == "..":
+            if len(out) > 1:
+                out.pop()
+        elif segment != ".":
+            out.append(segment)
+    if path.endswith(("/.", "/..")):
+        out.append("")
+    return "/".join(out)
+
+
+class LinkExtractor(HTMLParser):
+    """
+    Collects the links of a page while it is fed chunk by chunk, resolved against the page url or its <base>,
+    normalized and without duplicates in order of appearance
+    """
+
+    def __init__(self, url):
+        super().__init__(convert_charrefs=True)
+        self.base = url
+        self.base_seen = False
+        self._links: dict[str, None] = {}
+        # hrefs already resolved, pages repeat the same ones a lot
+        self._hrefs: set[str] = set()
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a" or tag == "area":
+            for name, value in attrs:
+                if name == "href" and value:
+                    self._add(value)
+        elif tag == "base" and not self.base_seen:
+            # only the first base counts
+            for name, value in attrs:
+                if name == "href" and value:
+                    self.base = urlparse.urljoin(self.base, value.strip())
+                    self.base_seen = True
+                    self._hrefs.clear()
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def _add(self, href):
+        if href in self._hrefs:
+            return
+        self._hrefs.add(href)
+        href = href.strip()
+        if href.startswith("#"):
+            return
+        url = normalize_url(urlparse.urljoin(self.base, href))
+        if url is not None:
+            self._links[url] = None
+
+    def links(self) -> list[str]:
+        return list(self._links)
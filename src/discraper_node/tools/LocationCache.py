@@ -0,0 +1,92 @@
+import bisect
+import threading
+import time
+from collections import OrderedDict
+
+
+class LocationCache:
+    """
+    Bounded LRU of key ranges and the node that owns them, learned from lookup results.
+    Entries older than ttl have to be confirmed with the owner before being trusted again
+    """
+
+    def __init__(self, capacity=1024, ttl=1):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # owner id -> [owner, lowest key known to be owned, time of last confirmation]
+        self._entries: OrderedDict[int, list] = OrderedDict()
+        self._ids: list[int] = []  # owner ids sorted, to find the first owner after a key
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def node_seen(self, node):
+        """
+        a live node takes its keys out of the cached range it falls in
+        """
+        with self.lock:
+            self._trim(node.id)
+
+    def _trim(self, node_id):
+        index = bisect.bisect_right(self._ids, node_id)
+        if index < len(self._ids):
+            entry = self._entries[self._ids[index]]
+            entry[1] = max(entry[1], node_id + 1)
+
+    def learn(self, id_, node):
+        """
+        node is the successor of id_, so every key in [id_, node] is owned by it
+        the largest node keeps the keys above it, those are not cached
+        """
+        if id_ > node.id:
+            return
+        with self.lock:
+            self._trim(node.id)
+            entry = self._entries.get(node.id, None)
+            if entry is not None:
+                entry[1] = min(entry[1], id_)
+                entry[0], entry[2] = node, time.monotonic()
+                self._entries.move_to_end(node.id)
+                return
+            self._entries[node.id] = [node, id_, time.monotonic()]
+            bisect.insort(self._ids, node.id)
+            if len(self._entries) > self.capacity:
+                old_id, _ = self._entries.popitem(last=False)
+                del self._ids[bisect.bisect_left(self._ids, old_id)]
+
+    def lookup(self, id_):
+        """
+        returns (owner, fresh) for a cached range containing id_ or None
+        """
+        with self.lock:
+            index = bisect.bisect_left(self._ids, id_)
+            if index < len(self._ids):
+                owner_id = self._ids[index]
+                owner, low, confirmed = self._entries[owner_id]
+                if low <= id_:
+                    self.hits += 1
+                    self._entries.move_to_end(owner_id)
+                    return owner, time.monotonic() - confirmed < self.ttl
+            self.misses += 1
+            return None
+
+    def confirm(self, node):
+        with self.lock:
+            entry = self._entries.get(node.id, None)
+            if entry is not None:
+                entry[2] = time.monotonic()
+
+    def invalidate(self, node):
+        """
+        forgets the ranges of a node that failed or rejected a key
+        """
+        with self.lock:
+            if self._entries.pop(node.id, None) is not None:
+                del self._ids[bisect.bisect_left(self._ids, node.id)]
+                self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "invalidations": self.invalidations}
@@ -0,0 +1,44 @@
+import threading
+from hashlib import sha1
+
+
+class MerkleTree:
+    """
+    Hash tree over a key space of m bits, the leaves are buckets of consecutive keys.
+    The hash of a node is the xor of the hashes of the keys under it, so adding or removing a key
+    only touches one node per level
+    """
+
+    def __init__(self, m=160, depth=12):
+        self.m = m
+        self.depth = depth
+        self.lock = threading.Lock()
+        self.levels = [[0] * (2 ** d) for d in range(depth + 1)]
+
+    def _key_hash(self, key: int) -> int:
+        return int.from_bytes(sha1(key.to_bytes((self.m + 7) // 8, byteorder="big")).digest(), byteorder="big")
+
+    def _toggle(self, key: int):
+        key_hash = self._key_hash(key)
+        bucket = key >> (self.m - self.depth)
+        with self.lock:
+            for d in range(self.depth, -1, -1):
+                self.levels[d][bucket >> (self.depth - d)] ^= key_hash
+
+    # xor is its own inverse
+    def add(self, key: int):
+        self._toggle(key)
+
+    def remove(self, key: int):
+        self._toggle(key)
+
+    def hashes(self, level, indices) -> list:
+        with self.lock:
+            return [self.levels[level][i] for i in indices]
+
+    def node_range(self, level, index) -> tuple[int, int]:
+        """
+        inclusive range of keys under a node
+        """
+        shift = self.m - level
+        return index << shift, ((index + 1) << shift) - 1
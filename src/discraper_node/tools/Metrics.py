@@ -0,0 +1,170 @@
+import bisect
+import threading
+
+# seconds, from a local call to a slow page download
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+HOP_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10, 12, 16, 24, 32)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """
+    observations counted in the first bucket they do not exceed, the sum and count kept along for the mean
+    """
+    __slots__ = ("buckets", "counts", "sum", "count", "lock")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self) -> tuple[list, float, int]:
+        """
+        cumulative counts per bucket, sum and count
+        """
+        with self.lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative = 0
+        for i, c in enumerate(counts):
+            cumulative += c
+            counts[i] = cumulative
+        return counts, total, count
+
+
+class HistogramFamily:
+    """
+    one histogram per label value, made on the first observation
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.histograms: dict[str, Histogram] = {}
+
+    def observe(self, label, value):
+        histogram = self.histograms.get(label, None)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(label, Histogram(self.buckets))
+        histogram.observe(value)
+
+    def items(self) -> list[tuple[str, Histogram]]:
+        with self.lock:
+            return list(self.histograms.items())
+
+
+class Counters:
+    """
+    counts by label value, the given labels start at 0 so they are shown before their first count
+    """
+
+    def __init__(self, labels=()):
+        self.lock = threading.Lock()
+        self.counts: dict[str, int] = dict.fromkeys(labels, 0)
+
+    def inc(self, label, amount=1):
+        with self.lock:
+            self.counts[label] = self.counts.get(label, 0) + amount
+
+    def __getitem__(self, label) -> int:
+        with self.lock:
+            return self.counts.get(label, 0)
+
+    def items(self) -> list[tuple[str, int]]:
+        with self.lock:
+            return list(self.counts.items())
+
+
+class Gauge:
+    """
+    a value going up and down from several threads, as the open connections
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = 0
+
+    def inc(self):
+        with self.lock:
+            self.value += 1
+
+    def dec(self):
+        with self.lock:
+            self.value -= 1
+
+
+def thread_counts() -> dict[str, int]:
+    """
+    live threads by pool, the name without its number as in LOOKUP_3 or Thread-12 (process_request_thread)
+    """
+    counts = {}
+    for thread in threading.enumerate():
+        pool = thread.name.split(" ")[0].rstrip("0123456789_-") or thread.name
+        counts[pool] = counts.get(pool, 0) + 1
+    return counts
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class MetricsText:
+    """
+    Prometheus text exposition format, every metric is written once with its help and type and then its samples.
+    Samples are (labels dict, value), histograms are (labels dict, Histogram)
+    """
+
+    def __init__(self, prefix="discraper_"):
+        self.prefix = prefix
+        self.lines: list[str] = []
+
+    def _header(self, name, kind, doc):
+        self.lines.append(f"# HELP {name} {_escape(doc)}")
+        self.lines.append(f"# TYPE {name} {kind}")
+
+    def counter(self, name, doc, samples):
+        name = self.prefix + name
+        self._header(name, "counter", doc)
+        for labels, value in samples:
+            self.lines.append(f"{name}{_labels(labels)} {_number(value)}")
+
+    def gauge(self, name, doc, samples):
+        name = self.prefix + name
+        self._header(name, "gauge", doc)
+        for labels, value in samples:
+            self.lines.append(f"{name}{_labels(labels)} {_number(value)}")
+
+    def histogram(self, name, doc, samples):
+        name = self.prefix + name
+        self._header(name, "histogram", doc)
+        for labels, histogram in samples:
+            counts, total, count = histogram.snapshot()
+            for bound, cumulative in zip(histogram.buckets + (float("inf"),), counts):
+                self.lines.append(f"{name}_bucket{_labels({**labels, 'le': _number(float(bound))})} {cumulative}")
+            self.lines.append(f"{name}_sum{_labels(labels)} {_number(float(total))}")
+            self.lines.append(f"{name}_count{_labels(labels)} {count}")
+
+    def encode(self) -> bytes:
+        return ("\n".join(self.lines) + "\n").encode("utf-8")
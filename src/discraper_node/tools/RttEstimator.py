@@ -0,0 +1,62 @@
+import threading
+
+
+class RttEstimator:
+    """
+    Smoothed round trip time and deviation per peer, same filter as the tcp retransmission timer (rfc 6298)
+    """
+
+    def __init__(self, initial=0.1, alpha=0.125, beta=0.25, min_timeout=0.02, max_timeout=2):
+        self.initial = initial
+        self.alpha = alpha
+        self.beta = beta
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.lock = threading.Lock()
+        # peer -> [srtt, rttvar]
+        self._peers: dict = {}
+        self.failures = 0
+
+    def observe(self, peer, sample):
+        with self.lock:
+            entry = self._peers.get(peer, None)
+            if entry is None:
+                self._peers[peer] = [sample, sample / 2]
+            else:
+                entry[1] = (1 - self.beta) * entry[1] + self.beta * abs(entry[0] - sample)
+                entry[0] = (1 - self.alpha) * entry[0] + self.alpha * sample
+
+    def failed(self, peer):
+        """
+        forgets a peer that did not answer, it has to be measured again
+        """
+        with self.lock:
+            self._peers.pop(peer, None)
+            self.failures += 1
+
+    def estimate(self, peer):
+        """
+        smoothed rtt of the peer, unknown peers are assumed to be as far as the average known one
+        """
+        with self.lock:
+            entry = self._peers.get(peer, None)
+            if entry is not None:
+                return entry[0]
+            if self._peers:
+                return sum(e[0] for e in self._peers.values()) / len(self._peers)
+            return self.initial
+
+    def timeout(self, peer):
+        """
+        time to wait for an answer of the peer before asking someone else
+        """
+        with self.lock:
+            entry = self._peers.get(peer, None)
+        if entry is None:
+            return min(self.max_timeout, 2 * self.estimate(peer))
+        return min(self.max_timeout, max(self.min_timeout, entry[0] + 4 * entry[1]))
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"peers": len(self._peers), "failures": self.failures,
+                    "srtt": {f"{p[0]}:{p[1]}": round(e[0], 6) for p, e in self._peers.items()}}
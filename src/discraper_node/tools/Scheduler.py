@@ -0,0 +1,149 @@
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .Metrics import Histogram
+from ..custom_logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class _Task:
+    def __init__(self, name, fn, interval, max_interval, backoff):
+        self.name = name
+        self.fn = fn
+        self.min_interval = interval
+        self.max_interval = max(interval, max_interval)
+        self.backoff = backoff
+        self.interval = interval
+        self.due_tick = 0
+        self.running = False
+        self.tightened = False
+        # stats
+        self.runs = 0
+        self.changes = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.last_time = 0.0
+        self.durations = Histogram()
+
+    def stats(self) -> dict:
+        return {"runs": self.runs, "changes": self.changes, "errors": self.errors,
+                "interval": round(self.interval, 3), "total_time": round(self.total_time, 6),
+                "avg_time": round(self.total_time / self.runs, 6) if self.runs else 0,
+                "max_time": round(self.max_time, 6), "last_time": round(self.last_time, 6)}
+
+
+class Scheduler:
+    """
+    Hashed timer wheel for periodic tasks, one timer thread and a few workers instead of a thread per task.
+    A task returns True when it saw a failure or a change, then every task goes back to its shortest interval,
+    otherwise its own interval grows by backoff up to max_interval. A task never overlaps with itself
+    """
+
+    def __init__(self, tick=0.05, slots=256, workers=3, name="SCHED"):
+        self.tick = tick
+        self.slots = slots
+        self.wheel: list[list[_Task]] = [[] for _ in range(slots)]
+        self.tasks: dict[str, _Task] = {}
+        self.lock = threading.Condition()
+        self.start_time = time.monotonic()
+        self.current_tick = 0
+        self.running = True
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self.thread = threading.Thread(name=name, target=self._run, daemon=True)
+        self.thread.start()
+
+    def add(self, name, fn, interval, max_interval=None, backoff=2):
+        """
+        runs fn every interval seconds, starting now
+        """
+        with self.lock:
+            task = _Task(name, fn, interval, max_interval or interval, backoff)
+            self.tasks[name] = task
+            self._schedule(task, 0)
+            self.lock.notify()
+
+    def tighten(self, *names):
+        """
+        a change was seen outside the tasks, they run soon and at their shortest interval again
+        """
+        with self.lock:
+            self._tighten([self.tasks[n] for n in names] if names else self.tasks.values())
+            self.lock.notify()
+
+    def _tighten(self, tasks):
+        for task in tasks:
+            task.interval = task.min_interval
+            if task.running:
+                task.tightened = True
+            elif (task.due_tick - self.current_tick) * self.tick > task.min_interval:
+                self.wheel[task.due_tick % self.slots].remove(task)
+                self._schedule(task, task.min_interval)
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+            self.lock.notify()
+        self.pool.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {name: task.stats() for name, task in self.tasks.items()}
+
+    def task_list(self) -> list[_Task]:
+        with self.lock:
+            return list(self.tasks.values())
+
+    def _now_tick(self):
+        return int((time.monotonic() - self.start_time) / self.tick)
+
+    def _schedule(self, task: _Task, delay):
+        task.due_tick = max(self._now_tick(), self.current_tick) + max(1, math.ceil(delay / self.tick))
+        self.wheel[task.due_tick % self.slots].append(task)
+
+    def _run(self):
+        with self.lock:
+            while self.running:
+                now = self._now_tick()
+                while self.current_tick < now:
+                    self.current_tick += 1
+                    slot = self.wheel[self.current_tick % self.slots]
+                    # tasks further than one turn of the wheel stay in the slot for the next turns
+                    due = [task for task in slot if task.due_tick <= self.current_tick]
+                    for task in due:
+                        slot.remove(task)
+                        task.running = True
+                        self.pool.submit(self._execute, task)
+                # sleep until the closest task is due instead of waking up every tick
+                pending = [task.due_tick for task in self.tasks.values() if not task.running]
+                timeout = (min(pending) - self.current_tick) * self.tick if pending else None
+                self.lock.wait(timeout)
+
+    def _execute(self, task: _Task):
+        start = time.monotonic()
+        try:
+            changed = bool(task.fn())
+        except BaseException as e:
+            logger.error(f"Task {task.name} failed: {e}")
+            task.errors += 1
+            changed = True
+        elapsed = time.monotonic() - start
+        with self.lock:
+            task.runs += 1
+            task.total_time += elapsed
+            task.max_time = max(task.max_time, elapsed)
+            task.last_time = elapsed
+            task.durations.observe(elapsed)
+            if changed:
+                task.changes += 1
+                self._tighten(self.tasks.values())
+            if not task.tightened:
+                task.interval = min(task.max_interval, task.interval * task.backoff)
+            task.running = False
+            task.tightened = False
+            if self.running:
+                self._schedule(task, task.interval)
+            self.lock.notify()
@@ -0,0 +1,202 @@
+import bisect
+import itertools
+import threading
+from xmlrpc.client import Marshaller
+
+
+class SortedIndex:
+    """
+    Ordered index of items by integer id, kept as a list of small sorted blocks so inserts and deletes
+    only move one block. Blocks are copied on write, iterating works on a consistent snapshot while
+    other threads insert and delete
+    """
+
+    def __init__(self, iterable=None, tree=None, load=512):
+        self.lock = threading.RLock()
+        # optional MerkleTree kept in sync with the ids in the index
+        self.tree = tree
+        self._load = load
+        self._keys: list[list[int]] = []
+        self._items: list[list] = []
+        self._maxes: list[int] = []
+        self._len = 0
+        if iterable is not None:
+            self.bulk_load(iterable)
+
+    @staticmethod
+    def key_of(item) -> int:
+        if isinstance(item, int):
+            return item
+        if isinstance(item, str):
+            return int(item)
+        return item.id
+
+    def _find(self, key) -> tuple[int, int]:
+        # block and position of key, -1 if not in the index
+        b = bisect.bisect_left(self._maxes, key)
+        if b == len(self._maxes):
+            return -1, -1
+        i = bisect.bisect_left(self._keys[b], key)
+        if i < len(self._keys[b]) and self._keys[b][i] == key:
+            return b, i
+        return -1, -1
+
+    def _replace_block(self, b, keys, items):
+        if not keys:
+            del self._keys[b], self._items[b], self._maxes[b]
+        elif len(keys) > 2 * self._load:
+            half = len(keys) // 2
+            self._keys[b:b + 1] = [keys[:half], keys[half:]]
+            self._items[b:b + 1] = [items[:half], items[half:]]
+            self._maxes[b:b + 1] = [keys[half - 1], keys[-1]]
+        else:
+            self._keys[b], self._items[b], self._maxes[b] = keys, items, keys[-1]
+
+    def append(self, item, replace=False) -> None:
+        """
+        inserts item if its id is not in the index, or puts it in place of the one with its id if replace
+        """
+        key = self.key_of(item)
+        with self.lock:
+            if not self._maxes:
+                self._keys, self._items, self._maxes = [[key]], [[item]], [key]
+            else:
+                b = min(bisect.bisect_left(self._maxes, key), len(self._maxes) - 1)
+                i = bisect.bisect_left(self._keys[b], key)
+                if i < len(self._keys[b]) and self._keys[b][i] == key:
+                    if replace:
+                        items = self._items[b][:]
+                        items[i] = item
+                        self._items[b] = items
+                    return
+                # copy on write, snapshots keep the old block
+                keys, items = self._keys[b][:], self._items[b][:]
+                keys.insert(i, key)
+                items.insert(i, item)
+                self._replace_block(b, keys, items)
+            self._len += 1
+            if self.tree is not None:
+                self.tree.add(key)
+
+    def pop(self, item):
+        """
+        removes the item with the id of item and returns it, None if there was none
+        """
+        key = self.key_of(item)
+        with self.lock:
+            b, i = self._find(key)
+            if b < 0:
+                return None
+            keys, items = self._keys[b][:], self._items[b][:]
+            del keys[i]
+            removed = items.pop(i)
+            self._replace_block(b, keys, items)
+            self._len -= 1
+            if self.tree is not None:
+                self.tree.remove(key)
+            return removed
+
+    def remove(self, item) -> None:
+        self.pop(item)
+
+    def extend(self, iterable) -> None:
+        self.bulk_load(iterable)
+
+    def bulk_load(self, iterable) -> None:
+        # one sort by id instead of an insert per item, items already in the index are kept
+        with self.lock:
+            known = set(itertools.chain.from_iterable(self._keys))
+            items = sorted(itertools.chain(self, iterable), key=self.key_of)
+            keys, unique = [], []
+            for item in items:
+                key = self.key_of(item)
+                if keys and keys[-1] == key:
+                    continue
+                keys.append(key)
+                unique.append(item)
+                if self.tree is not None and key not in known:
+                    self.tree.add(key)
+            self._keys = [keys[i:i + self._load] for i in range(0, len(keys), self._load)]
+            self._items = [unique[i:i + self._load] for i in range(0, len(unique), self._load)]
+            self._maxes = [block[-1] for block in self._keys]
+            self._len = len(keys)
+
+    def find_like(self, item):
+        key = self.key_of(item)
+        with self.lock:
+            b, i = self._find(key)
+            return self._items[b][i] if b >= 0 else None
+
+    def __contains__(self, item):
+        return self.find_like(item) is not None
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        # the blocks are never modified in place, holding the references is a snapshot
+        with self.lock:
+            blocks = list(self._items)
+        for block in blocks:
+            yield from block
+
+    def __getitem__(self, index: int):
+        with self.lock:
+            if index < 0:
+                index += self._len
+            for block in self._items:
+                if index < len(block):
+                    return block[index]
+                index -= len(block)
+        raise IndexError("SortedIndex index out of range")
+
+    def __repr__(self):
+        return f"SortedIndex({list(self)})"
+
+    def get_range(self, low, high, limit=None) -> list:
+        # inclusive on both ends, at most limit items
+        low, high = self.key_of(low), self.key_of(high)
+        res = []
+        with self.lock:
+            b = bisect.bisect_left(self._maxes, low)
+            i = bisect.bisect_left(self._keys[b], low) if b < len(self._maxes) else 0
+            while b < len(self._maxes) and (limit is None or len(res) < limit):
+                keys = self._keys[b]
+                j = bisect.bisect_right(keys, high)
+                if limit is not None:
+                    j = min(j, i + limit - len(res))
+                res.extend(self._items[b][i:j])
+                if j < len(keys):
+                    break
+                b, i = b + 1, 0
+        return res
+
+    def ring_range(self, low, high, limit=None) -> list:
+        """
+        items in (low, high] walking the ring clockwise, none if low == high
+        """
+        low, high = self.key_of(low), self.key_of(high)
+        with self.lock:
+            if low == high:
+                return []
+            if low < high:
+                return self.get_range(low + 1, high, limit)
+            upper = self.get_range(low + 1, self._maxes[-1], limit) if self._maxes else []
+            if limit is not None and len(upper) >= limit:
+                return upper
+            return upper + self.get_range(0, high, None if limit is None else limit - len(upper))
+
+    def get_bigger(self, item) -> list:
+        return self.get_range(self.key_of(item) + 1, self._maxes[-1]) if self._maxes else []
+
+    def get_bigger_or_equal(self, item) -> list:
+        return self.get_range(item, self._maxes[-1]) if self._maxes else []
+
+    def get_smaller(self, item) -> list:
+        return self.get_range(0, self.key_of(item) - 1)
+
+    def get_smaller_or_equal(self, item) -> list:
+        return self.get_range(0, item)
+
+    def encode(self, marshaller_w: Marshaller):
+        marshaller_w.dump_array(list(self), marshaller_w.write)
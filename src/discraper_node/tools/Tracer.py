@@ -0,0 +1,142 @@
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# w3c trace context, version-trace id-parent span-flags
+HEADER = "traceparent"
+# sent back on the rest answers so the trace can be asked to TRACE
+RESPONSE_HEADER = "X-Trace-Id"
+
+_ROOT = "0" * 16
+# trace id and span id of the span running in this context
+_current: contextvars.ContextVar = contextvars.ContextVar("trace", default=None)
+
+
+def _new_id(bits) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+def parse_header(value) -> tuple[str, str]:
+    """
+    trace id and parent span id of a traceparent header, None if it is not one
+    """
+    try:
+        _, trace_id, parent, _ = value.strip().split("-")
+        int(trace_id, 16), int(parent, 16)
+    except (AttributeError, ValueError):
+        return None
+    if len(trace_id) != 32 or len(parent) != 16:
+        return None
+    return trace_id, parent
+
+
+def untraced(method):
+    """
+    marks an exported method whose rest calls do not start a trace, as the ones reading the node state
+    """
+    method.untraced = True
+    return method
+
+
+def carry(fn):
+    """
+    fn bound to the trace of the caller, for the tasks submitted to a pool
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.run(fn, *args, **kwargs)
+
+    return run
+
+
+class Tracer:
+    """
+    Spans of the traced requests that went through this node, kept in a ring buffer so the memory stays bounded.
+    A span is a dict with its trace, its id, its parent, the node, name, start, duration and the attributes
+    given, a call to another node has its address in Peer
+    """
+
+    def __init__(self, capacity=4096):
+        self.node = ""
+        self.lock = threading.Lock()
+        self.spans: deque[dict] = deque(maxlen=capacity)
+
+    def configure(self, node, capacity):
+        with self.lock:
+            self.node = node
+            if capacity != self.spans.maxlen:
+                self.spans = deque(self.spans, maxlen=capacity)
+
+    @staticmethod
+    def new_header() -> str:
+        """
+        header of a new trace, for a request that came without one
+        """
+        return f"00-{_new_id(128)}-{_ROOT}-01"
+
+    @staticmethod
+    def header(span=None) -> str:
+        """
+        header carrying span or the current one to another node, None if nothing is traced
+        """
+        current = (span["Trace"], span["Span"]) if span is not None else _current.get()
+        if current is None:
+            return None
+        return f"00-{current[0]}-{current[1]}-01"
+
+    def start(self, name, parent_header=None, activate=True, **attrs) -> dict:
+        """
+        opens a span under parent_header or the current span, None if nothing is traced. An activated span
+        is the parent of the ones opened after it in this context
+        """
+        parent = parse_header(parent_header) if parent_header else _current.get()
+        if parent is None:
+            return None
+        trace_id, parent_id = parent
+        span = {"Trace": trace_id, "Span": _new_id(64), "Parent": parent_id if parent_id != _ROOT else "",
+                "Node": self.node, "Name": name, "Start": time.time(), **attrs}
+        if activate:
+            _current.set((trace_id, span["Span"]))
+        span["_start"] = time.perf_counter()
+        return span
+
+    def finish(self, span, error=None):
+        if span is None:
+            return
+        span["Duration"] = round(time.perf_counter() - span.pop("_start"), 6)
+        if error is not None:
+            span["Error"] = f"{type(error).__name__}: {error}"
+        with self.lock:
+            self.spans.append(span)
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """
+        the block as a span under the current one, nothing is recorded if the request is not traced
+        """
+        current = _current.get()
+        if current is None:
+            yield None
+            return
+        span = self.start(name, **attrs)
+        try:
+            yield span
+        except BaseException as e:
+            self.finish(span, e)
+            raise
+        else:
+            self.finish(span)
+        finally:
+            _current.set(current)
+
+    def spans_of(self, trace_id) -> list[dict]:
+        with self.lock:
+            return [span for span in self.spans if span["Trace"] == trace_id]
+
+
+# one per process, shared by the node and the transports
+tracer = Tracer()
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the node package lives in src and is run from there, not installed
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
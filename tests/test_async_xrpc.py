@@ -0,0 +1,115 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from discraper_node.custom_xrpc.AsyncXRPC import AsyncXRPCServer, ElasticExecutor
+
+
+def test_elastic_executor_runs_calls_waiting_on_each_other():
+    # every call waits for the last one, a pool bounded at core would never get to it
+    executor = ElasticExecutor(core=2, idle_timeout=1)
+    calls = 10
+    arrived = threading.Barrier(calls, timeout=5)
+    futures = [executor.submit(arrived.wait) for _ in range(calls)]
+    assert sorted(f.result(timeout=5) for f in futures) == list(range(calls))
+    assert executor.threads == calls
+    executor.shutdown()
+
+
+def test_elastic_executor_reuses_idle_threads_and_shrinks():
+    executor = ElasticExecutor(core=1, idle_timeout=0.2)
+    for _ in range(5):
+        assert executor.submit(lambda: 1).result(timeout=5) == 1
+    assert executor.threads == 1
+    release = threading.Event()
+    futures = [executor.submit(release.wait, 5) for _ in range(3)]
+    release.set()
+    assert all(f.result(timeout=5) for f in futures)
+    deadline = time.monotonic() + 5
+    while executor.threads > 1 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert executor.threads == 1
+    executor.shutdown()
+
+
+def test_elastic_executor_reports_errors():
+    executor = ElasticExecutor(core=1)
+    future = executor.submit(lambda: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        future.result(timeout=5)
+    executor.shutdown()
+    with pytest.raises(RuntimeError):
+        executor.submit(lambda: 1)
+
+
+class Node:
+    def LIST(self):
+        yield {"Id": 1}
+        yield {"Id": 2}
+
+
+@pytest.fixture
+def server():
+    server = AsyncXRPCServer(("127.0.0.1", 0), allow_none=True, logRequests=False, workers=2)
+    server.register_instance(Node())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 5
+    while server.loop is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    yield server
+    server.server_close()
+
+
+def _get(server, version):
+    with socket.create_connection(server.socket.getsockname()[:2], timeout=5) as s:
+        s.sendall(f"GET /LIST {version}\r\nAccept: application/x-ndjson\r\n\r\n".encode("ascii"))
+        data = b""
+        while b"\r\n\r\n" not in data:
+            chunk = s.recv(4096)
+            assert chunk, "closed before the headers"
+            data += chunk
+        head, _, body = data.partition(b"\r\n\r\n")
+        if version == "HTTP/1.1":
+            # kept alive, the body is read until its frames end with the last chunk. Not matched on the tail
+            # of the buffer, the random X-Trace-Id of the headers may end in 0 as well
+            while _whole_chunks(body) is None:
+                chunk = s.recv(4096)
+                assert chunk, "closed before the last chunk"
+                body += chunk
+        else:
+            while chunk := s.recv(4096):
+                body += chunk
+    return head.decode("iso-8859-1"), body
+
+
+def _whole_chunks(body):
+    # frames of a chunked body up to its empty last chunk, None if more has to be read
+    frames, pos = [], 0
+    while (end := body.find(b"\r\n", pos)) >= 0:
+        size = int(body[pos:end], 16)
+        if size == 0:
+            return frames if body[end + 2:end + 4] == b"\r\n" else None
+        start = end + 2
+        if len(body) < start + size + 2:
+            return None
+        frames.append(body[start:start + size])
+        pos = start + size + 2
+    return None
+
+
+def test_stream_is_chunked_for_http11(server):
+    for _ in range(20):
+        head, body = _get(server, "HTTP/1.1")
+        assert "Transfer-Encoding: chunked" in head
+        assert b"".join(_whole_chunks(body)) == b'{"Id": 1}\n{"Id": 2}\n'
+
+
+def test_stream_is_not_chunked_for_http10(server):
+    head, body = _get(server, "HTTP/1.0")
+    assert "Transfer-Encoding" not in head
+    assert "Connection: close" in head
+    # the server closed the connection after the records, which came unframed
+    assert body == b'{"Id": 1}\n{"Id": 2}\n'
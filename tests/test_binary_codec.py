@@ -0,0 +1,79 @@
+import xmlrpc.client
+
+import pytest
+
+from discraper_node.custom_xrpc import BinaryCodec
+
+
+class Node:
+    def __init__(self, address):
+        self.Address = address
+        self.hidden = "not sent"
+
+
+class Info:
+    def wire_struct(self):
+        return {"Address": "http://example.com", "Id": 2 ** 159, "Refs": ["a", "b"]}
+
+
+VALUES = [
+    None, True, False, 0, 1, -1, 63, -64, 64, 2 ** 160 - 1, -(2 ** 70), 0.0, -1.5, 1e300,
+    "", "text", "ünïcødé ✓" * 100, b"", b"\x00\xff" * 300, [], [1, [2, [3, "x"]]], {}, {"a": {"b": [None]}},
+]
+
+
+@pytest.mark.parametrize("value", VALUES, ids=repr)
+def test_round_trip(value):
+    params, method = BinaryCodec.loads(BinaryCodec.dumps((value,), methodresponse=True))
+    assert method is None
+    assert params == (value,)
+    assert type(params[0]) is type(value)
+
+
+def test_call():
+    data = BinaryCodec.dumps((1, "two", [3]), "Find_Successor")
+    assert BinaryCodec.is_binary(data)
+    assert BinaryCodec.loads(data) == ((1, "two", [3]), "Find_Successor")
+
+
+def test_tuples_bytearrays_and_binaries():
+    data = BinaryCodec.dumps(((1, 2), bytearray(b"ab"), xmlrpc.client.Binary(b"cd")), "M")
+    assert BinaryCodec.loads(data)[0] == ([1, 2], b"ab", b"cd")
+
+
+def test_fault():
+    data = BinaryCodec.dumps(xmlrpc.client.Fault(7, "went wrong"))
+    with pytest.raises(xmlrpc.client.Fault) as e:
+        BinaryCodec.loads(data)
+    assert (e.value.faultCode, e.value.faultString) == (7, "went wrong")
+
+
+def test_objects_go_through_the_hook():
+    data = BinaryCodec.dumps(([Node(("127.0.0.1", 4440)), Info()],), methodresponse=True)
+    (value,), _ = BinaryCodec.loads(data)
+    # nodes only carry their address, the rest their capitalized fields or wire_struct
+    assert value == [{"Node": {"Address": ["127.0.0.1", 4440]}},
+                     {"Info": {"Address": "http://example.com", "Id": 2 ** 159, "Refs": ["a", "b"]}}]
+    built = BinaryCodec.loads(data, lambda name, fields: (name, fields["Address"]))[0][0]
+    assert built == [("Node", ["127.0.0.1", 4440]), ("Info", "http://example.com")]
+
+
+def test_smaller_than_xml():
+    params = ([{"Address": "http://example.com/page", "Id": 2 ** 159, "Refs": []}] * 50,)
+    assert len(BinaryCodec.dumps(params, methodresponse=True)) < len(
+        xmlrpc.client.dumps(params, methodresponse=True).encode()) / 3
+
+
+def test_not_binary():
+    assert not BinaryCodec.is_binary(b"<?xml")
+    with pytest.raises(ValueError):
+        BinaryCodec.loads(b"<?xml version='1.0'?>")
+    with pytest.raises(ValueError):
+        BinaryCodec.loads(BinaryCodec.MAGIC + b"Z")
+
+
+def test_truncated_messages_raise_value_error():
+    data = BinaryCodec.dumps(([1, "abc", {"x": 2.5, "y": b"bytes"}],), "Method")
+    for end in range(len(BinaryCodec.MAGIC) + 1, len(data)):
+        with pytest.raises(ValueError):
+            BinaryCodec.loads(data[:end])
@@ -0,0 +1,80 @@
+import random
+import xmlrpc.client
+from hashlib import sha1
+
+import pytest
+
+from discraper_node.custom_xrpc import BinaryCodec
+from discraper_node.tools.BloomFilter import BloomFilter, RecentFilter
+
+
+def _ids(n, seed):
+    # the node ids, sha1 of the urls
+    return [int.from_bytes(sha1(f"http://example.com/{seed}/{i}".encode()).digest(), "big") for i in range(n)]
+
+
+def test_no_false_negatives():
+    ids = _ids(1000, "in")
+    bloom = BloomFilter(capacity=1000)
+    for id_ in ids:
+        bloom.add(id_)
+    assert all(id_ in bloom for id_ in ids)
+    assert len(bloom) == 1000
+
+
+def test_false_positives_near_the_error_rate():
+    bloom = BloomFilter(capacity=2000, error_rate=0.01)
+    for id_ in _ids(2000, "in"):
+        bloom.add(id_)
+    false_positives = sum(id_ in bloom for id_ in _ids(20000, "out"))
+    assert false_positives / 20000 < 0.02
+
+
+def test_sizing():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    # about 9.6 bits and 7 hashes per id for 1%
+    assert 9000 <= bloom.bits <= 10000 and bloom.bits % 8 == 0
+    assert bloom.hashes == 7
+    assert BloomFilter(capacity=1).bits == 64
+
+
+@pytest.mark.parametrize("wire", ["binary", "xml"])
+def test_wire_round_trip(wire):
+    bloom = BloomFilter(capacity=100)
+    ids = _ids(100, "in")
+    for id_ in ids:
+        bloom.add(id_)
+    if wire == "binary":
+        data = BinaryCodec.loads(BinaryCodec.dumps((bloom.to_wire(),), methodresponse=True))[0][0]
+    else:
+        data = xmlrpc.client.loads(xmlrpc.client.dumps((bloom.to_wire(),), methodresponse=True))[0][0]
+    received = BloomFilter.from_wire(data)
+    assert (received.bits, received.hashes, len(received)) == (bloom.bits, bloom.hashes, 100)
+    assert all(id_ in received for id_ in ids)
+
+
+def test_wire_size_mismatch_is_rejected():
+    bits, hashes, count, data = BloomFilter(capacity=100).to_wire()
+    with pytest.raises(ValueError):
+        BloomFilter.from_wire([bits + 8, hashes, count, data])
+
+
+def test_recent_filter_ages_out_old_ids():
+    recent = RecentFilter(capacity=100)
+    old, middle, new = _ids(100, "old"), _ids(100, "middle"), _ids(100, "new")
+    for id_ in old + middle:
+        recent.add(id_)
+    assert all(id_ in recent for id_ in old + middle)
+    for id_ in new:
+        recent.add(id_)
+    # two generations kept, the oldest one is gone
+    assert all(id_ in recent for id_ in middle + new)
+    assert sum(id_ in recent for id_ in old) < 10
+
+
+def test_recent_filter_counts_an_id_once():
+    recent = RecentFilter(capacity=10)
+    id_ = random.Random(1).getrandbits(160)
+    for _ in range(100):
+        recent.add(id_)
+    assert len(recent.current) == 1
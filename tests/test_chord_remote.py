@@ -0,0 +1,73 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from discraper_node.ChordNode import ChordNode
+from discraper_node.ChordNodeRemote import RemoteChordNode
+from discraper_node.tools.MerkleTree import MerkleTree
+
+
+@pytest.fixture
+def frozen_peer():
+    # accepts connections and never answers, as a peer stuck without closing its sockets
+    listener = socket.create_server(("127.0.0.1", 0))
+    accepted = []
+    stop = threading.Event()
+
+    def accept():
+        listener.settimeout(0.1)
+        while not stop.is_set():
+            try:
+                accepted.append(listener.accept()[0])
+            except OSError:
+                continue
+
+    thread = threading.Thread(target=accept, daemon=True)
+    thread.start()
+    yield listener.getsockname()[:2]
+    stop.set()
+    thread.join()
+    for conn in accepted:
+        conn.close()
+    listener.close()
+
+
+@pytest.fixture
+def short_timeout(monkeypatch):
+    RemoteChordNode.set_credentials()
+    monkeypatch.setattr(RemoteChordNode, "lookup_timeout", 0.3)
+    yield
+    RemoteChordNode.set_credentials()
+
+
+def test_bounded_calls_give_up_on_a_frozen_peer(frozen_peer, short_timeout):
+    node = RemoteChordNode.make_remote_node(frozen_peer)
+    start = time.monotonic()
+    with pytest.raises(OSError):
+        node.bounded().Ping("hello")
+    assert time.monotonic() - start < 2
+
+
+def test_bounded_proxy_is_made_once(frozen_peer, short_timeout):
+    node = RemoteChordNode.make_remote_node(frozen_peer)
+    assert node.bounded() is node.bounded()
+
+
+class Point:
+    def __init__(self, id_):
+        self.id = id_
+
+
+def test_anti_entropy_gives_up_on_a_frozen_replica(frozen_peer, short_timeout):
+    # only what the comparison reads, no servers nor ring
+    node = ChordNode.__new__(ChordNode)
+    node.finger = [None] * 160
+    node.id = 2 ** 159
+    node.merkle = MerkleTree(160)
+    replica = RemoteChordNode.make_remote_node(frozen_peer)
+    start = time.monotonic()
+    with pytest.raises(OSError):
+        node._anti_entropy(replica, Point(2 ** 158))
+    assert time.monotonic() - start < 2
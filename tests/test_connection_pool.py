@@ -0,0 +1,118 @@
+import threading
+import time
+import xmlrpc.client
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from discraper_node.custom_xrpc import ConnectionPool
+from discraper_node.custom_xrpc.CustomXRPC import DiSServerProxy, DiSTransport
+
+KEY = ("http", "127.0.0.1:1")
+
+
+class Conn:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_checked_out_connections_count_against_the_cap():
+    pool = ConnectionPool(max_per_host=2, wait_timeout=0.2)
+    assert pool.acquire(KEY) is None
+    assert pool.acquire(KEY) is None
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        pool.acquire(KEY)
+    assert time.monotonic() - start >= 0.2
+    # other peers have their own slots
+    assert pool.acquire(("http", "127.0.0.1:2")) is None
+    assert pool.open_count() == 3
+
+
+def test_a_waiting_call_gets_the_released_connection():
+    pool = ConnectionPool(max_per_host=1, wait_timeout=5)
+    conn = Conn()
+    assert pool.acquire(KEY) is None
+    threading.Timer(0.1, pool.release, (KEY, conn)).start()
+    assert pool.acquire(KEY) is conn
+    assert pool.idle_count() == 0 and pool.open_count() == 1
+
+
+def test_discard_frees_the_slot():
+    pool = ConnectionPool(max_per_host=1, wait_timeout=5)
+    conn = Conn()
+    assert pool.acquire(KEY) is None
+    threading.Timer(0.1, pool.discard, (KEY, conn)).start()
+    assert pool.acquire(KEY) is None
+    assert conn.closed
+    assert pool.open_count() == 1
+
+
+def test_idle_connections_are_capped_and_expire():
+    pool = ConnectionPool(max_per_host=4, max_idle_per_host=1, idle_timeout=0.1)
+    conns = [Conn(), Conn()]
+    for _ in conns:
+        pool.acquire(KEY)
+    for conn in conns:
+        pool.release(KEY, conn)
+    assert not conns[0].closed and conns[1].closed
+    assert pool.idle_count() == 1 and pool.open_count() == 1
+    time.sleep(0.15)
+    assert pool.acquire(KEY) is None
+    assert conns[0].closed
+    assert pool.open_count() == 1
+
+
+def test_clear_and_close_forget_the_idle_ones():
+    pool = ConnectionPool()
+    conns = [Conn(), Conn()]
+    for _ in conns:
+        pool.acquire(KEY)
+    for conn in conns:
+        pool.release(KEY, conn)
+    pool.clear(KEY)
+    assert all(c.closed for c in conns) and pool.open_count() == 0
+    conn = Conn()
+    pool.acquire(KEY)
+    pool.release(KEY, conn)
+    pool.close()
+    assert conn.closed and pool.open_count() == 0
+
+
+class Failing(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        body = b"unavailable"
+        self.send_response(503)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def failing_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Failing)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address
+    server.shutdown()
+    server.server_close()
+
+
+def test_error_status_gives_the_connection_back(failing_server):
+    pool = ConnectionPool(max_per_host=1, wait_timeout=0.5)
+    proxy = DiSServerProxy(f"http://{failing_server[0]}:{failing_server[1]}", DiSTransport(pool=pool, timeout=5))
+    for _ in range(3):
+        # a leaked connection would keep the only slot and the next call would time out waiting
+        with pytest.raises(xmlrpc.client.ProtocolError) as e:
+            proxy.Ping("hello")
+        assert e.value.errcode == 503
+    assert pool.open_count() == 0
@@ -0,0 +1,87 @@
+import logging
+import threading
+import time
+
+import pytest
+
+from discraper_node.DiSNode import DiSNode
+from discraper_node.custom_xrpc import ElasticExecutor
+from discraper_node.tools.BloomFilter import RecentFilter
+from discraper_node.tools.Metrics import Counters
+
+
+@pytest.fixture
+def node():
+    # only the crawl state, no servers nor ring
+    node = DiSNode.__new__(DiSNode)
+    node.scrap_fanout = 3
+    node.crawl_executor = ElasticExecutor(core=node.scrap_fanout, thread_name_prefix="SCRAP")
+    node.scrap_skip_known = False
+    node.recent_urls = RecentFilter()
+    node.crawl_stats = Counters(("scraped", "metadata", "misses"))
+    node.logger = logging.getLogger("test_crawl")
+    yield node
+    node.crawl_executor.shutdown()
+
+
+class Site:
+    """
+    every page links to the next ten, counts the pages being scraped at the same time
+    """
+
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.running = 0
+        self.most = 0
+        self.started = 0
+
+    def scrap_ref(self, level, url, refresh=False):
+        with self.lock:
+            self.running += 1
+            self.started += 1
+            self.most = max(self.most, self.running)
+        time.sleep(self.delay)
+        with self.lock:
+            self.running -= 1
+        if url == "/fail":
+            raise OSError("down")
+        n = int(url.strip("/"))
+        entry = {"Address": url, "Id": n, "Refs": []}
+        return [entry], [f"/{10 * n + i}" for i in range(10)] if level > 1 else []
+
+
+def test_each_crawl_keeps_its_fanout(node, monkeypatch):
+    site = Site()
+    monkeypatch.setattr(node, "_scrap_ref", site.scrap_ref, raising=False)
+    entries = list(node._crawl(2, ["/1", "/2", "/fail", "/1"], set()))
+    assert sorted(e["Id"] for e in entries) == [1, 2] + list(range(10, 30))
+    assert site.most <= node.scrap_fanout
+    assert node.crawl_stats["scraped"] == 23
+
+
+def test_crawls_share_the_executor_threads(node, monkeypatch):
+    site = Site()
+    monkeypatch.setattr(node, "_scrap_ref", site.scrap_ref, raising=False)
+    crawls = [threading.Thread(target=lambda: list(node._crawl(1, [f"/{i}" for i in range(12)], set())))
+              for _ in range(4)]
+    for crawl in crawls:
+        crawl.start()
+    for crawl in crawls:
+        crawl.join()
+    assert site.started == 48
+    assert site.most <= 4 * node.scrap_fanout
+    threads = node.crawl_executor.threads
+    list(node._crawl(1, [f"/{i}" for i in range(12)], set()))
+    # no new threads for the next crawl
+    assert node.crawl_executor.threads == threads
+
+
+def test_early_stop_drops_the_pending_refs(node, monkeypatch):
+    site = Site(delay=0.05)
+    monkeypatch.setattr(node, "_scrap_ref", site.scrap_ref, raising=False)
+    crawl = node._crawl(1, [f"/{i}" for i in range(30)], set())
+    next(crawl)
+    crawl.close()
+    time.sleep(0.2)
+    assert site.started <= 2 * node.scrap_fanout
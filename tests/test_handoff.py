@@ -0,0 +1,95 @@
+import logging
+
+from discraper_node.ChordNode import ChordNode
+from discraper_node.tools.SortedIndex import SortedIndex
+
+M = 8  # bits of the ids in these rings, 0..255
+
+
+class Item:
+    def __init__(self, id_):
+        self.id = id_
+
+    def write(self):
+        pass
+
+
+def _node(id_, ids=()):
+    # only the database and the ring pointers, no servers
+    node = ChordNode.__new__(ChordNode)
+    node.id = id_
+    node.Address = "127.0.0.1", 4000 + id_
+    node.finger = [None] * M
+    node.handoff_batch = 2
+    node.logger = logging.getLogger("test_handoff")
+    node.database = SortedIndex(map(Item, ids), load=2)
+    node.predecessor = None
+    node.Predecessor = lambda: node.predecessor
+    return node
+
+
+def _ring(*nodes):
+    for node, before in zip(nodes, nodes[-1:] + nodes[:-1]):
+        node.predecessor = before
+    return nodes
+
+
+def _ids(node):
+    return [item.id for item in node.database]
+
+
+def test_handoff_walks_the_range_in_batches():
+    owner = _node(0, range(0, 100, 10))
+    assert [i.id for i in owner.Handoff_Range(15, 65, 14, 2)] == [20, 30]
+    assert [i.id for i in owner.Handoff_Range(15, 65, 30, 2)] == [40, 50]
+    assert [i.id for i in owner.Handoff_Range(15, 65, 60, 2)] == []
+    assert [i.id for i in owner.Handoff_Range(0, 10, -1, 5)] == [0, 10]
+
+
+def test_join_between_two_nodes():
+    a, b = _ring(_node(50, [10, 20, 240]), _node(150, range(60, 150, 10)))
+    joining = _node(100)
+    joining._take_over_range(b)
+    assert _ids(joining) == [60, 70, 80, 90, 100]
+
+
+def test_join_as_the_new_smallest():
+    small, large = _ring(_node(50, [0, 10, 20, 50]), _node(150, [60, 200, 250]))
+    joining = _node(30)
+    joining._take_over_range(small)
+    assert _ids(joining) == [0, 10, 20]
+
+
+def test_join_as_the_new_largest_from_the_old_largest():
+    # the largest node owns its range and every id above it
+    small, large = _ring(_node(50, [0, 10, 50]), _node(150, [60, 150, 200, 210, 250]))
+    joining = _node(205)
+    joining._take_over_range(large)
+    assert _ids(joining) == [200, 210, 250]
+
+
+def test_join_as_the_new_largest_from_the_smallest():
+    small, large = _ring(_node(50, [0, 10, 50]), _node(150, [60, 150, 200, 210, 250]))
+    joining = _node(205)
+    joining._take_over_range(small)
+    assert _ids(joining) == [200, 210, 250]
+
+
+def test_join_next_to_a_lonely_node():
+    lonely = _node(150, [10, 100, 200])
+    lonely.predecessor = lonely
+    below = _node(120)
+    below._take_over_range(lonely)
+    assert _ids(below) == [10, 100]
+    above = _node(180)
+    above._take_over_range(lonely)
+    assert _ids(above) == [200]
+
+
+def test_rejoin_of_the_predecessor_moves_nothing():
+    # the successor still has the rejoining node as predecessor
+    rejoining = _node(100)
+    successor = _node(150, range(0, 256, 10))
+    successor.predecessor = rejoining
+    rejoining._take_over_range(successor)
+    assert _ids(rejoining) == []
@@ -0,0 +1,88 @@
+import pytest
+
+from discraper_node.DiSNode import DiSNode
+from discraper_node.tools.LinkExtractor import LinkExtractor, normalize_url
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("HTTP://Example.COM", "http://example.com/"),
+    ("http://example.com:80/a", "http://example.com/a"),
+    ("https://example.com:443/a", "https://example.com/a"),
+    ("http://example.com:8080/a", "http://example.com:8080/a"),
+    ("http://example.com/a/./b/../c", "http://example.com/a/c"),
+    ("http://example.com/a/..", "http://example.com/"),
+    ("http://example.com/../../a", "http://example.com/a"),
+    ("http://example.com/a/b/.", "http://example.com/a/b/"),
+    ("http://example.com/a?q=1#frag", "http://example.com/a?q=1"),
+    ("  http://example.com/a  ", "http://example.com/a"),
+    ("http://[::1]:8000/a", "http://[::1]:8000/a"),
+    ("http://example.com/Case", "http://example.com/Case"),
+])
+def test_normalize(url, expected):
+    assert normalize_url(url) == expected
+
+
+@pytest.mark.parametrize("url", [
+    "ftp://example.com/a", "mailto:someone@example.com", "javascript:void(0)", "/relative", "http://",
+    "http://example.com:99999/", "http://example.com:port/",
+])
+def test_normalize_rejects(url):
+    assert normalize_url(url) is None
+
+
+def _extract(url, html, chunk=None):
+    extractor = LinkExtractor(url)
+    if chunk is None:
+        extractor.feed(html)
+    else:
+        for i in range(0, len(html), chunk):
+            extractor.feed(html[i:i + chunk])
+    extractor.close()
+    return extractor.links()
+
+
+PAGE = """<html><head><title>t</title></head><body>
+<a href="b.html">b</a> <A HREF="/c?x=1#top">c</A> <a href="b.html">again</a>
+<a href="#section">anchor</a> <a>no href</a> <a href="">empty</a>
+<a href="mailto:x@example.com">mail</a> <a href="HTTP://Other.example.com/">other</a>
+<map><area href="../d.html"/></map> <a href="e.html?q=&amp;r=2">e</a>
+</body></html>"""
+
+EXPECTED = [
+    "http://example.com/dir/b.html",
+    "http://example.com/c?x=1",
+    "http://other.example.com/",
+    "http://example.com/d.html",
+    "http://example.com/dir/e.html?q=&r=2",
+]
+
+
+def test_links_resolved_normalized_and_unique_in_order():
+    assert _extract("http://example.com/dir/page.html", PAGE) == EXPECTED
+
+
+@pytest.mark.parametrize("chunk", [1, 7, 64])
+def test_fed_in_chunks(chunk):
+    assert _extract("http://example.com/dir/page.html", PAGE, chunk) == EXPECTED
+
+
+def test_first_base_wins():
+    html = '<base href="http://cdn.example.com/root/"><base href="http://ignored.example.com/">' \
+           '<a href="x">x</a>'
+    assert _extract("http://example.com/page", html) == ["http://cdn.example.com/root/x"]
+
+
+def test_relative_base():
+    html = '<head><base href="/sub/"></head><a href="x">x</a>'
+    assert _extract("http://example.com/a/page", html) == ["http://example.com/sub/x"]
+
+
+def test_broken_html_keeps_the_links():
+    html = '<a href="a.html">a<div><a href=b.html>b</p></a><a href="c.html'
+    assert _extract("http://example.com/", html) == ["http://example.com/a.html", "http://example.com/b.html"]
+
+
+def test_same_site_keeps_the_domain_and_its_subdomains():
+    links = ["http://example.com/a", "http://www.example.com/b", "http://evil-example.com/c",
+             "http://example.com.evil.org/d", "http://other.org/e"]
+    assert DiSNode._same_site("http://example.com/page", links) == links[:2]
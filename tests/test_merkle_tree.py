@@ -0,0 +1,78 @@
+import random
+
+from discraper_node.tools.MerkleTree import MerkleTree
+
+M = 32
+
+
+def _tree(keys, depth=6):
+    tree = MerkleTree(m=M, depth=depth)
+    for key in keys:
+        tree.add(key)
+    return tree
+
+
+def _differing_leaves(a, b):
+    # the descent of the anti-entropy, only into the nodes whose hashes differ
+    frontier = [0]
+    for level in range(a.depth + 1):
+        differ = [i for i, x, y in zip(frontier, a.hashes(level, frontier), b.hashes(level, frontier)) if x != y]
+        if level == a.depth:
+            return differ
+        frontier = [c for i in differ for c in (2 * i, 2 * i + 1)]
+
+
+def test_hash_depends_on_the_keys_not_the_order():
+    keys = random.Random(1).sample(range(2 ** M), 500)
+    a, b = _tree(keys), _tree(reversed(keys))
+    assert a.levels == b.levels
+    assert a.hashes(0, [0]) != [0]
+
+
+def test_removing_every_key_leaves_an_empty_tree():
+    keys = random.Random(2).sample(range(2 ** M), 100)
+    tree = _tree(keys)
+    for key in keys:
+        tree.remove(key)
+    assert tree.levels == MerkleTree(m=M, depth=6).levels
+
+
+def test_root_is_the_xor_of_each_level():
+    tree = _tree(random.Random(3).sample(range(2 ** M), 300))
+    root = tree.hashes(0, [0])[0]
+    for level in range(tree.depth + 1):
+        xor = 0
+        for h in tree.hashes(level, range(2 ** level)):
+            xor ^= h
+        assert xor == root
+
+
+def test_node_ranges_split_the_key_space():
+    tree = MerkleTree(m=M, depth=6)
+    assert tree.node_range(0, 0) == (0, 2 ** M - 1)
+    for level in range(1, tree.depth + 1):
+        ranges = [tree.node_range(level, i) for i in range(2 ** level)]
+        assert ranges[0][0] == 0 and ranges[-1][1] == 2 ** M - 1
+        assert all(hi + 1 == lo for (_, hi), (lo, _) in zip(ranges, ranges[1:]))
+
+
+def test_a_key_lands_in_the_leaf_of_its_range():
+    tree = MerkleTree(m=M, depth=6)
+    key = 0x9abcdef0
+    tree.add(key)
+    leaf = next(i for i, h in enumerate(tree.hashes(6, range(64))) if h)
+    lo, hi = tree.node_range(6, leaf)
+    assert lo <= key <= hi
+
+
+def test_descent_finds_the_leaves_that_differ():
+    rng = random.Random(4)
+    keys = rng.sample(range(2 ** M), 1000)
+    a, b = _tree(keys), _tree(keys)
+    assert _differing_leaves(a, b) == []
+    missing, extra = keys[10], rng.randrange(2 ** M)
+    b.remove(missing)
+    b.add(extra)
+    leaves = _differing_leaves(a, b)
+    expected = {key >> (M - a.depth) for key in (missing, extra)}
+    assert set(leaves) == expected
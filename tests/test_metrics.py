@@ -0,0 +1,110 @@
+import threading
+
+from discraper_node.tools.Metrics import Counters, Gauge, Histogram, HistogramFamily, MetricsText, thread_counts
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram(buckets=(1, 2, 5))
+    for value in (0.5, 1, 1.5, 2, 3, 10):
+        histogram.observe(value)
+    counts, total, count = histogram.snapshot()
+    # a value equal to a bound goes in that bucket, the last one is +Inf
+    assert counts == [2, 4, 5, 6]
+    assert total == 18 and count == 6
+
+
+def test_histogram_from_several_threads():
+    histogram = Histogram()
+
+    def observe():
+        for _ in range(1000):
+            histogram.observe(0.01)
+
+    threads = [threading.Thread(target=observe) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    counts, total, count = histogram.snapshot()
+    assert count == counts[-1] == 8000
+
+
+def test_counters_from_several_threads():
+    counters = Counters(("scraped", "misses"))
+    assert dict(counters.items()) == {"scraped": 0, "misses": 0}
+
+    def count():
+        for _ in range(1000):
+            counters.inc("scraped")
+
+    threads = [threading.Thread(target=count) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counters["scraped"] == 8000 and counters["misses"] == 0
+
+
+def test_family_counters_and_gauge():
+    family = HistogramFamily(buckets=(1,))
+    family.observe("Ping", 0.5)
+    family.observe("Ping", 2)
+    family.observe("Push", 0.5)
+    assert {label: h.snapshot()[0] for label, h in family.items()} == {"Ping": [1, 2], "Push": [1, 1]}
+    counters = Counters()
+    counters.inc(200)
+    counters.inc(200, 2)
+    counters.inc("error")
+    assert dict(counters.items()) == {200: 3, "error": 1}
+    gauge = Gauge()
+    gauge.inc()
+    gauge.inc()
+    gauge.dec()
+    assert gauge.value == 1
+
+
+def test_thread_counts_by_pool():
+    release = threading.Event()
+    threads = [threading.Thread(name=f"METRICSTEST_{i}", target=release.wait) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    try:
+        counts = thread_counts()
+        assert counts["METRICSTEST"] == 3
+        assert counts["MainThread"] == 1
+    finally:
+        release.set()
+        for thread in threads:
+            thread.join()
+
+
+def test_text_format():
+    out = MetricsText()
+    out.counter("calls_total", "Calls by method", [({"method": "Ping"}, 3), ({"method": 'a"b\\c'}, 1)])
+    out.gauge("ratio", "A ratio\nover two lines", [({}, 0.5)])
+    histogram = Histogram(buckets=(0.1, 1))
+    histogram.observe(0.05)
+    histogram.observe(5)
+    out.histogram("latency_seconds", "Latency", [({"method": "Ping"}, histogram)])
+    assert out.encode().decode() == "\n".join([
+        "# HELP discraper_calls_total Calls by method",
+        "# TYPE discraper_calls_total counter",
+        'discraper_calls_total{method="Ping"} 3',
+        'discraper_calls_total{method="a\\"b\\\\c"} 1',
+        "# HELP discraper_ratio A ratio\\nover two lines",
+        "# TYPE discraper_ratio gauge",
+        "discraper_ratio 0.5",
+        "# HELP discraper_latency_seconds Latency",
+        "# TYPE discraper_latency_seconds histogram",
+        'discraper_latency_seconds_bucket{method="Ping",le="0.1"} 1',
+        'discraper_latency_seconds_bucket{method="Ping",le="1.0"} 1',
+        'discraper_latency_seconds_bucket{method="Ping",le="+Inf"} 2',
+        'discraper_latency_seconds_sum{method="Ping"} 5.05',
+        'discraper_latency_seconds_count{method="Ping"} 2',
+    ]) + "\n"
+
+
+def test_metrics_without_samples_keep_their_header():
+    out = MetricsText(prefix="")
+    out.counter("empty_total", "Nothing yet", [])
+    assert out.encode() == b"# HELP empty_total Nothing yet\n# TYPE empty_total counter\n"
@@ -0,0 +1,111 @@
+import logging
+import threading
+import time
+
+import pytest
+
+from discraper_node.DiSNode import DiSNode
+from discraper_node.InfoContainer import InfoContainer
+from discraper_node.storage import FileStore, SegmentStore
+from discraper_node.tools.Metrics import Counters
+
+URL = "http://example.com/page"
+
+
+@pytest.fixture
+def node():
+    # only the refresh state, no servers nor ring
+    node = DiSNode.__new__(DiSNode)
+    node.refresh_stats = Counters(("revalidated", "not_modified", "modified", "failed"))
+    node.refresh_retry = 60
+    node.fetch_semaphore = threading.BoundedSemaphore(1)
+    node.logger = logging.getLogger("test_refresh")
+    return node
+
+
+@pytest.fixture(params=[FileStore, lambda folder: SegmentStore(folder, compact_polling=3600)],
+                ids=["files", "segments"])
+def open_store(request, tmp_path, monkeypatch):
+    opened = []
+
+    def open_store():
+        store = request.param(tmp_path)
+        monkeypatch.setattr(InfoContainer, "store", store)
+        opened.append(store)
+        return store
+
+    yield open_store
+    for store in opened:
+        store.close()
+
+
+def _stored(store, validators):
+    info = InfoContainer(URL, refs=["http://example.com/other"], content="<html></html>", validators=validators)
+    info.write()
+    return info
+
+
+def test_failed_refresh_backs_off(node, monkeypatch):
+    def fail(url, validators=None):
+        raise OSError("down")
+
+    monkeypatch.setattr(node, "_get_url", fail, raising=False)
+    info = InfoContainer(URL, validators={"fetched": 0})
+    max_age = 3600
+    now = time.time()
+    assert node._refresh_due(info, max_age, now) <= now
+    assert node._refresh_local(info) is None
+    assert info.validators["failures"] == 1
+    # not due again right away, and each failure waits longer
+    assert node._refresh_due(info, max_age, now + 1) == pytest.approx(info.validators["failed"] + 60)
+    node._refresh_local(info)
+    assert node._refresh_due(info, max_age, now) == pytest.approx(info.validators["failed"] + 120)
+    for _ in range(10):
+        node._refresh_local(info)
+    assert node._refresh_due(info, max_age, now) == pytest.approx(info.validators["failed"] + max_age)
+    assert node.refresh_stats["failed"] == 12
+
+
+def test_not_modified_is_stored(node, open_store, monkeypatch):
+    store = open_store()
+    info = _stored(store, {"etag": '"v1"', "fetched": 1.0, "failures": 2, "failed": 5.0})
+    fetched = time.time()
+    monkeypatch.setattr(node, "_get_url", lambda url, validators=None: (None, None, {**validators, "fetched": fetched}),
+                        raising=False)
+    assert node._refresh_local(info) is info
+    assert node.refresh_stats["not_modified"] == 1
+    assert info.validators == {"etag": '"v1"', "fetched": fetched}
+    store.close()
+    # a restart loads the new fetch time and the same content
+    reopened = open_store()
+    assert list(reopened.load()) == [(URL, ["http://example.com/other"], {"etag": '"v1"', "fetched": fetched})]
+    assert reopened.read(info.id) == b"<html></html>"
+
+
+def test_segments_keep_the_new_validators_through_compaction(tmp_path, monkeypatch):
+    store = SegmentStore(tmp_path, segment_size=1, compact_polling=3600)
+    monkeypatch.setattr(InfoContainer, "store", store)
+    info = _stored(store, {"fetched": 1.0})
+    info.update_validators({"fetched": 2.0})
+    store.compact()
+    store.close()
+    reopened = SegmentStore(tmp_path, compact_polling=3600)
+    (tmp_path / "segments.manifest").unlink()
+    scanned = SegmentStore(tmp_path, compact_polling=3600)
+    try:
+        assert [v for _, _, v in reopened.load()] == [{"fetched": 2.0}]
+        # without the manifest the segments have the same metadata
+        assert [v for _, _, v in scanned.load()] == [{"fetched": 2.0}]
+    finally:
+        reopened.close()
+        scanned.close()
+
+
+def test_legacy_pages_are_spread_over_the_max_age(node):
+    now = time.time()
+    infos = [InfoContainer(f"{URL}{i}") for i in range(200)]
+    due = [node._refresh_due(info, 3600, now) for info in infos]
+    assert all(now <= d <= now + 3600 for d in due)
+    # not all of them in the same poll
+    assert sum(d <= now + 10 for d in due) < 20
+    assert node._refresh_due(infos[0], 3600, now + 1) == due[0]
@@ -0,0 +1,113 @@
+import random
+import threading
+
+import pytest
+
+from discraper_node.tools.MerkleTree import MerkleTree
+from discraper_node.tools.SortedIndex import SortedIndex
+
+
+class Item:
+    def __init__(self, id_, tag=""):
+        self.id = id_
+        self.tag = tag
+
+
+def _ids(items):
+    return [item.id for item in items]
+
+
+def test_keeps_items_sorted_and_unique():
+    keys = random.Random(1).sample(range(10 ** 6), 2000)
+    index = SortedIndex(load=8)
+    for key in keys:
+        index.append(Item(key))
+    index.append(Item(keys[0], "dup"))
+    assert len(index) == len(keys)
+    assert _ids(index) == sorted(keys)
+    assert index.find_like(keys[0]).tag == ""
+    index.append(Item(keys[0], "new"), replace=True)
+    assert index.find_like(keys[0]).tag == "new"
+    assert len(index) == len(keys)
+
+
+def test_pop_and_remove():
+    index = SortedIndex(map(Item, range(0, 100, 2)), load=4)
+    assert index.pop(4).id == 4
+    assert index.pop(4) is None
+    index.remove(6)
+    index.remove(7)
+    assert 4 not in index and 6 not in index and 8 in index
+    assert len(index) == 48
+    for key in range(0, 100, 2):
+        index.remove(key)
+    assert len(index) == 0 and list(index) == []
+    index.append(Item(3))
+    assert _ids(index) == [3]
+
+
+def test_bulk_load_merges_and_keeps_existing():
+    index = SortedIndex(load=4)
+    index.append(Item(5, "old"))
+    index.bulk_load([Item(5, "new"), Item(1), Item(9), Item(1)])
+    assert _ids(index) == [1, 5, 9]
+    assert index.find_like(5).tag == "old"
+    assert len(index) == 3
+
+
+def test_indexing():
+    index = SortedIndex(map(Item, range(10, 30)), load=3)
+    assert index[0].id == 10 and index[7].id == 17 and index[-1].id == 29
+    with pytest.raises(IndexError):
+        index[20]
+
+
+def test_ranges():
+    index = SortedIndex(map(Item, range(0, 100, 10)), load=2)
+    assert _ids(index.get_range(15, 50)) == [20, 30, 40, 50]
+    assert _ids(index.get_range(15, 50, limit=2)) == [20, 30]
+    assert _ids(index.get_range(95, 200)) == []
+    assert _ids(index.get_bigger(70)) == [80, 90]
+    assert _ids(index.get_bigger_or_equal(70)) == [70, 80, 90]
+    assert _ids(index.get_smaller(20)) == [0, 10]
+    assert _ids(index.get_smaller_or_equal(20)) == [0, 10, 20]
+
+
+def test_ring_range_wraps_around():
+    index = SortedIndex(map(Item, range(0, 100, 10)), load=2)
+    assert _ids(index.ring_range(20, 50)) == [30, 40, 50]
+    assert _ids(index.ring_range(70, 20)) == [80, 90, 0, 10, 20]
+    assert _ids(index.ring_range(70, 20, limit=3)) == [80, 90, 0]
+    assert _ids(index.ring_range(70, 20, limit=1)) == [80]
+    assert _ids(SortedIndex().ring_range(70, 20)) == []
+
+
+def test_ring_range_of_one_point_is_empty():
+    index = SortedIndex(map(Item, range(0, 100, 10)), load=2)
+    assert index.ring_range(30, 30) == []
+    assert index.ring_range(35, 35) == []
+
+
+def test_tree_follows_the_ids():
+    tree, expected = MerkleTree(m=20, depth=4), MerkleTree(m=20, depth=4)
+    index = SortedIndex(tree=tree, load=4)
+    for key in (3, 900, 70000, 900):
+        index.append(Item(key))
+    index.bulk_load([Item(3), Item(5)])
+    index.remove(70000)
+    for key in (3, 5, 900):
+        expected.add(key)
+    assert tree.levels == expected.levels
+
+
+def test_iteration_is_a_snapshot():
+    index = SortedIndex(map(Item, range(1000)), load=16)
+    seen = []
+    writer = threading.Thread(target=lambda: [index.remove(k) for k in range(0, 1000, 2)])
+    it = iter(index)
+    seen.append(next(it))
+    writer.start()
+    writer.join()
+    seen.extend(it)
+    assert _ids(seen) == list(range(1000))
+    assert _ids(index) == list(range(1, 1000, 2))
@@ -0,0 +1,214 @@
+import logging
+
+import pytest
+
+from discraper_node.DiSNode import DiSNode
+from discraper_node.InfoContainer import InfoContainer
+from discraper_node.storage import FileStore, SegmentStore
+from discraper_node.storage.Manifest import Manifest
+from discraper_node.tools.SortedIndex import SortedIndex
+
+
+def _segments(folder, **kwargs):
+    return SegmentStore(folder, compact_polling=3600, **kwargs)
+
+
+def _put(store, id_, body, validators=None):
+    store.put(id_, f"http://example.com/{id_}", [f"http://example.com/{id_ + 1}"], [body], validators)
+
+
+def _loaded(store):
+    return sorted(address for address, _, _ in store.load())
+
+
+# ---------------------- MANIFEST ---------------------- #
+
+def test_manifest_drops_an_incomplete_tail(tmp_path):
+    manifest = Manifest(tmp_path / "m.manifest")
+    manifest.append(["P", 1])
+    manifest.append(["P", 2])
+    manifest.close()
+    with manifest.path.open("ab") as f:
+        f.write(b'["P", 3')
+    assert manifest.read() == [["P", 1], ["P", 2]]
+    assert manifest.path.read_bytes() == b'["P", 1]\n["P", 2]\n'
+
+
+def test_manifest_drops_an_unreadable_tail(tmp_path):
+    manifest = Manifest(tmp_path / "m.manifest")
+    manifest.path.write_bytes(b'["P", 1]\n["P", \x00\x00\n\x00\x00\x00\n')
+    assert manifest.read() == [["P", 1]]
+    assert manifest.entries == 1
+    manifest.append(["D", 1])
+    manifest.close()
+    assert manifest.read() == [["P", 1], ["D", 1]]
+
+
+def test_manifest_corrupt_before_the_end_raises(tmp_path):
+    manifest = Manifest(tmp_path / "m.manifest")
+    manifest.path.write_bytes(b'["P", 1]\n["P", \n["P", 3]\n')
+    with pytest.raises(ValueError):
+        manifest.read()
+
+
+def test_manifest_rewrite(tmp_path):
+    manifest = Manifest(tmp_path / "m.manifest")
+    manifest.append(["P", 1])
+    manifest.rewrite([["P", 2], ["P", 3]])
+    manifest.append(["D", 2])
+    manifest.close()
+    assert manifest.read() == [["P", 2], ["P", 3], ["D", 2]]
+
+
+# ---------------------- FILE STORE ---------------------- #
+
+def test_file_store_loads_after_a_torn_manifest(tmp_path):
+    store = FileStore(tmp_path)
+    _put(store, 1, b"one", {"etag": "a"})
+    _put(store, 2, b"two")
+    store.delete(2)
+    store.close()
+    with (tmp_path / "files.manifest").open("ab") as f:
+        f.write(b'["P", 3, "http://exa')
+    reopened = FileStore(tmp_path)
+    assert list(reopened.load()) == [("http://example.com/1", ["http://example.com/2"], {"etag": "a"})]
+    assert reopened.read(1) == b"one"
+    reopened.close()
+
+
+def test_file_store_scans_when_the_manifest_is_corrupt(tmp_path):
+    store = FileStore(tmp_path)
+    _put(store, 1, b"one")
+    _put(store, 2, b"two")
+    store.close()
+    data = (tmp_path / "files.manifest").read_bytes()
+    (tmp_path / "files.manifest").write_bytes(b"garbage\n" + data)
+    (tmp_path / "3.json").write_text('{"Address": "http://exa')
+    reopened = FileStore(tmp_path)
+    assert _loaded(reopened) == ["http://example.com/1", "http://example.com/2"]
+    reopened.close()
+
+
+def test_legacy_documents_are_migrated_once(tmp_path):
+    legacy_folder = tmp_path / "legacy"
+    legacy_folder.mkdir()
+    (legacy_folder / "config.json").write_text("{}")
+    node = DiSNode.__new__(DiSNode)
+    node.database = SortedIndex()
+    node.logger = logging.getLogger("test_storage")
+    store = _segments(tmp_path)
+    # nothing to migrate, no manifest is made
+    node._migrate_legacy(store, FileStore(legacy_folder))
+    assert not (legacy_folder / "files.manifest").exists()
+    legacy = FileStore(legacy_folder)
+    # the legacy layout names the documents by the id of their address
+    ids = {InfoContainer(f"http://example.com/{i}").id: f"{i}".encode() for i in (1, 2)}
+    for id_, body in ids.items():
+        legacy.put(id_, f"http://example.com/{body.decode()}", [], [body])
+    legacy.close()
+    node._migrate_legacy(store, FileStore(legacy_folder))
+    assert [info.id for info in node.database] == sorted(ids)
+    assert all(store.read(id_) == body for id_, body in ids.items())
+    assert sorted(p.name for p in legacy_folder.iterdir()) == ["config.json"]
+    assert not FileStore(legacy_folder).has_documents()
+    store.close()
+
+
+# ---------------------- SEGMENT STORE ---------------------- #
+
+def test_segments_put_read_delete_and_reopen(tmp_path):
+    store = _segments(tmp_path)
+    _put(store, 1, b"one")
+    _put(store, 2, b"two" * 1000)
+    _put(store, 1, b"uno")
+    store.delete(2)
+    assert store.read(1) == b"uno"
+    assert b"".join(store.read_chunks(1, chunk_size=1)) == b"uno"
+    with pytest.raises(KeyError):
+        store.read(2)
+    store.close()
+    reopened = _segments(tmp_path)
+    assert _loaded(reopened) == ["http://example.com/1"]
+    assert reopened.read(1) == b"uno"
+    reopened.close()
+
+
+def test_segments_recover_without_manifest(tmp_path):
+    store = _segments(tmp_path, segment_size=64)
+    for id_ in range(1, 6):
+        _put(store, id_, f"body {id_}".encode(), {"fetched": id_})
+    store.delete(3)
+    store.close()
+    (tmp_path / "segments.manifest").unlink()
+    reopened = _segments(tmp_path)
+    assert _loaded(reopened) == [f"http://example.com/{i}" for i in (1, 2, 4, 5)]
+    assert reopened.read(5) == b"body 5"
+    reopened.close()
+
+
+def test_segments_recover_from_a_torn_append(tmp_path):
+    store = _segments(tmp_path)
+    _put(store, 1, b"one")
+    _put(store, 2, b"two")
+    store.close()
+    segment = tmp_path / "segment-000001.log"
+    segment.write_bytes(segment.read_bytes()[:-1])
+    # the manifest covers a record that is not whole anymore
+    with (tmp_path / "segments.manifest").open("ab") as f:
+        f.write(b'["P", 3')
+    reopened = _segments(tmp_path)
+    assert reopened.read(1) == b"one"
+    assert 2 not in reopened.index
+    reopened.close()
+
+
+def test_compaction_moves_the_live_records(tmp_path):
+    store = _segments(tmp_path, segment_size=1)
+    _put(store, 1, b"one")
+    _put(store, 2, b"two")
+    _put(store, 3, b"three")
+    store.delete(2)
+    _put(store, 3, b"tres")
+    store.compact()
+    assert store.read(1) == b"one" and store.read(3) == b"tres"
+    size = store.size()
+    store.compact()
+    assert store.size() <= size
+    store.close()
+    reopened = _segments(tmp_path)
+    assert _loaded(reopened) == ["http://example.com/1", "http://example.com/3"]
+    reopened.close()
+    (tmp_path / "segments.manifest").unlink()
+    scanned = _segments(tmp_path)
+    # the tombstone of 2 was kept while an older segment could have its put
+    assert _loaded(scanned) == ["http://example.com/1", "http://example.com/3"]
+    scanned.close()
+
+
+def test_compaction_of_a_pinned_segment_writes_nothing(tmp_path):
+    store = _segments(tmp_path, segment_size=150)
+    _put(store, 1, b"one")
+    _put(store, 2, b"two")
+    # a tombstone and a live record in the same sealed segment
+    store.delete(2)
+    _put(store, 4, b"four")
+    _put(store, 1, b"uno")
+    _put(store, 5, b"five")
+    segment = store.index[4][0]
+    assert segment != store.active and segment != store.segments[0]
+    stream = store.read_chunks(4, chunk_size=1)
+    next(stream)
+    size = store.size()
+    for _ in range(5):
+        store._compact_segment(segment, drop_tombstones=False)
+    assert store.size() == size
+    assert segment in store.segments
+    assert b"".join(stream) == b"our"
+    store._compact_segment(segment, drop_tombstones=False)
+    assert segment not in store.segments
+    assert store.read(4) == b"four"
+    store.close()
+    (tmp_path / "segments.manifest").unlink()
+    scanned = _segments(tmp_path)
+    assert _loaded(scanned) == ["http://example.com/1", "http://example.com/4", "http://example.com/5"]
+    scanned.close()
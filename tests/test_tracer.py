@@ -0,0 +1,108 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from discraper_node.tools.Tracer import Tracer, _current, carry, parse_header, untraced
+
+
+@pytest.fixture
+def tracer():
+    tracer = Tracer(capacity=16)
+    tracer.configure("127.0.0.1:4440", 16)
+    return tracer
+
+
+@pytest.fixture(autouse=True)
+def untraced_context():
+    # the current span lives in a context var, no test leaves one for the next
+    token = _current.set(None)
+    yield
+    _current.reset(token)
+
+
+def test_parse_header():
+    header = Tracer.new_header()
+    trace_id, parent = parse_header(header)
+    assert len(trace_id) == 32 and parent == "0" * 16
+    assert header == f"00-{trace_id}-{parent}-01"
+    for bad in (None, "", "00-abc-def-01", "00-" + "g" * 32 + "-" + "0" * 16 + "-01", "garbage"):
+        assert parse_header(bad) is None
+
+
+def test_nothing_is_recorded_without_a_trace(tracer):
+    assert Tracer.header() is None
+    assert tracer.start("call") is None
+    with tracer.span("inner") as span:
+        assert span is None
+    tracer.finish(None)
+    assert len(tracer.spans) == 0
+
+
+def test_spans_nest_under_the_request(tracer):
+    header = Tracer.new_header()
+    trace_id = parse_header(header)[0]
+    root = tracer.start("Find_Successor", header, Kind="server")
+    assert root["Parent"] == "" and root["Node"] == "127.0.0.1:4440" and root["Kind"] == "server"
+    with tracer.span("hop", Peer="127.0.0.1:4441") as hop:
+        # the header sent along carries the hop as parent
+        assert parse_header(Tracer.header()) == (trace_id, hop["Span"])
+        with tracer.span("fetch"):
+            pass
+    assert parse_header(Tracer.header()) == (trace_id, root["Span"])
+    tracer.finish(root)
+    spans = {s["Name"]: s for s in tracer.spans_of(trace_id)}
+    assert set(spans) == {"Find_Successor", "hop", "fetch"}
+    assert spans["hop"]["Parent"] == root["Span"] and spans["fetch"]["Parent"] == hop["Span"]
+    assert all(s["Duration"] >= 0 and "_start" not in s for s in spans.values())
+    assert tracer.spans_of("0" * 32) == []
+
+
+def test_errors_are_recorded(tracer):
+    tracer.start("call", Tracer.new_header())
+    with pytest.raises(KeyError):
+        with tracer.span("failing"):
+            raise KeyError("gone")
+    assert tracer.spans[-1]["Error"] == "KeyError: 'gone'"
+
+
+def test_inactive_span_is_not_the_parent(tracer):
+    root = tracer.start("call", Tracer.new_header())
+    stream = tracer.start("stream", activate=False)
+    assert parse_header(Tracer.header())[1] == root["Span"]
+    assert parse_header(Tracer.header(stream))[1] == stream["Span"]
+
+
+def test_carry_takes_the_trace_to_a_pool(tracer):
+    root = tracer.start("call", Tracer.new_header())
+    with ThreadPoolExecutor(1) as pool:
+        assert pool.submit(Tracer.header).result() is None
+        assert pool.submit(carry(Tracer.header)).result() == Tracer.header()
+    assert parse_header(Tracer.header())[1] == root["Span"]
+
+
+def test_ring_buffer_is_bounded(tracer):
+    header = Tracer.new_header()
+    for i in range(40):
+        tracer.finish(tracer.start(f"call {i}", header, activate=False))
+    assert len(tracer.spans) == 16
+    assert tracer.spans[0]["Name"] == "call 24"
+    tracer.configure("127.0.0.1:4440", 4)
+    assert [s["Name"] for s in tracer.spans] == ["call 36", "call 37", "call 38", "call 39"]
+
+
+def test_untraced_marks_the_method():
+    @untraced
+    def STATS():
+        return {}
+
+    assert STATS.untraced and STATS() == {}
+
+
+def test_threads_do_not_share_the_current_span(tracer):
+    tracer.start("call", Tracer.new_header())
+    seen = []
+    thread = threading.Thread(target=lambda: seen.append(Tracer.header()))
+    thread.start()
+    thread.join()
+    assert seen == [None]